@@ -3,10 +3,12 @@ import time
 
 import machine
 
-from utils.utils import connect_to_wifi
+from utils.timezone import restore_time
+from utils.utils import start_wifi
 
-BOOT_DELAY = 2
-WIFI_TIMEOUT = 120
+# Seconds to wait before starting, e.g. to break into the REPL. Every second here
+# is a second with the scheduler stopped.
+BOOT_DELAY = 0
 ENABLE_WEBREPL = False
 
 
@@ -22,15 +24,19 @@ def show_boot_info() -> None:
 
 
 def boot_sequence() -> None:
-    print(f"Waiting {BOOT_DELAY} seconds for system stability...")
-    time.sleep(BOOT_DELAY)
-
-    print("\n[1/1] Connecting to WiFi...")
-    wifi_connected = connect_to_wifi(timeout=WIFI_TIMEOUT)
-    if wifi_connected:
-        print("WiFi connected successfully")
-    else:
-        print("WiFi connection failed — main program will retry")
+    # Closes the valves before the boot delay and WiFi: the reset may have come
+    # from the hardware watchdog while a zone was open
+    import irrigation_controller  # noqa: F401
+
+    if BOOT_DELAY:
+        print(f"Waiting {BOOT_DELAY} seconds...")
+        time.sleep(BOOT_DELAY)
+
+    print(f"Clock: {restore_time() or 'not set'}")
+
+    # Main starts without waiting: WiFi and NTP come up while the scheduler runs
+    print("Connecting to WiFi in the background...")
+    start_wifi()
 
     gc.collect()
     print(f"\nFree memory after boot: {gc.mem_free()} bytes")
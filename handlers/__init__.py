@@ -0,0 +1,81 @@
+import gc
+import sys
+import time
+
+from utils import log, memory
+
+# Rarely used MQTT handlers, imported on first use instead of at boot:
+#   programs  CRUD, bulk import, program list, upcoming activations
+#   control   pause / resume / stop of auto programs
+#   queries   encoding, history, runtime, log and metrics requests
+GROUPS = ("programs", "control", "queries")
+
+# Free heap a group needs to load; below it the other loaded groups are dropped
+# first (when UNLOAD_ON_PRESSURE)
+LOAD_BUDGET = 16000
+UNLOAD_ON_PRESSURE = True
+
+# {group: [loads, last import us, resident bytes after the last import]}
+stats = {}
+
+
+def load(group: str):
+    """Returns the handler module of 'group', importing it if needed."""
+    name = "handlers." + group
+    mod = sys.modules.get(name)
+    if mod is not None:
+        return mod
+    if UNLOAD_ON_PRESSURE and not memory.has_budget(LOAD_BUDGET):
+        unload()
+    gc.collect()
+    before = gc.mem_alloc()
+    t0 = time.ticks_us()
+    __import__(name)
+    elapsed = time.ticks_diff(time.ticks_us(), t0)
+    gc.collect()
+    resident = gc.mem_alloc() - before
+    entry = stats.get(group)
+    if entry is None:
+        entry = [0, 0, 0]
+        stats[group] = entry
+    entry[0] += 1
+    entry[1] = elapsed
+    entry[2] = resident
+    log.info("Loaded handlers.%s: %d us, %d bytes", group, elapsed, resident)
+    return sys.modules[name]
+
+
+def loaded() -> list:
+    return [g for g in GROUPS if "handlers." + g in sys.modules]
+
+
+def unload() -> int:
+    """Drops every loaded group; each is imported again on its next use."""
+    pkg = sys.modules[__name__]
+    count = 0
+    for name in list(sys.modules):
+        if not name.startswith("handlers."):
+            continue
+        del sys.modules[name]
+        try:
+            delattr(pkg, name[9:])
+        except AttributeError:
+            pass
+        if name[9:] in GROUPS:
+            count += 1
+    if count:
+        gc.collect()
+        log.info("Unloaded %d handler group(s), free heap %d", count, gc.mem_free())
+    return count
+
+
+def report() -> dict:
+    return {
+        group: {
+            "loads": s[0],
+            "import_us": s[1],
+            "bytes": s[2],
+            "loaded": group in loaded(),
+        }
+        for group, s in stats.items()
+    }
@@ -0,0 +1,260 @@
+import time
+
+import irrigation_controller as ctrl
+from irrigation_notify import NOTIFY, send_notification
+from irrigation_programs import get_all_programs, get_program_by_id
+from irrigation_scheduler import (
+    cap_to_next_program,
+    held_programs,
+    start_auto_program,
+)
+from utils import schema
+from utils.timezone import local_time
+
+HOLD_MAX_SECONDS = 86400
+
+PROGRAM_CONTROL = schema.compile(
+    (
+        ("id", schema.integer("program.invalid_id")),
+        (
+            "action",
+            schema.choice(
+                ("pause", "resume", "stop", "hold", "start"),
+                "program_control.invalid_action",
+            ),
+        ),
+        ("user", schema.text(max_len=32, truncate=True, default=None)),
+        (
+            "seconds",
+            schema.integer(
+                "program_control.invalid_hold",
+                lo=1,
+                hi=HOLD_MAX_SECONDS,
+                clamp=True,
+                default=None,
+            ),
+        ),
+    )
+)
+
+
+def handle_program_control(data: dict) -> None:
+    """
+    Routes pause/resume/stop/hold/start actions.
+    Payload: {"action": "pause"|"resume"|"stop"|"hold"|"start", "id": <int>, "user": "..."}
+    plus "seconds" for hold, and optionally for start.
+    """
+    fields, error = PROGRAM_CONTROL(data)
+    if error:
+        send_notification(NOTIFY["PROGRAM_CONTROL"], error, False)
+        return
+
+    action = fields["action"]
+    if action == "pause":
+        _handle_program_pause(fields["id"], fields["user"])
+    elif action == "resume":
+        _handle_program_resume(fields["id"], fields["user"])
+    elif action == "hold":
+        _handle_program_hold(fields["id"], fields["seconds"], fields["user"])
+    elif action == "start":
+        _handle_program_start(fields["id"], fields["seconds"], fields["user"])
+    else:
+        _handle_program_stop(fields["id"], fields["user"])
+
+
+def _handle_program_pause(program_id: int, username: str) -> None:
+    """Pauses a running auto program. Stores window_end so resume knows the original deadline."""
+    if ctrl.active_program_id != program_id:
+        send_notification(
+            NOTIFY["PROGRAM_CONTROL"], "program_control.not_running", False
+        )
+        return
+
+    remaining = ctrl.get_remaining_seconds()
+    window_end = ctrl.zone_end_time  # original scheduled end time
+    zone = ctrl.active_zone
+
+    ctrl.deactivate_active_zone()
+
+    ctrl.user_paused_program = {
+        "id": program_id,
+        "zone": zone,
+        "window_end": window_end,
+    }
+
+    program = get_program_by_id(program_id)
+    send_notification(
+        NOTIFY["PROGRAM_CONTROL"],
+        "program_control.paused",
+        user=username,
+        id=program_id,
+        name=program["name"] if program else str(program_id),
+        zone=zone,
+        remaining=remaining,
+    )
+
+
+def _handle_program_resume(program_id: int, username: str) -> None:
+    """Resumes a user-paused program if its time window has not expired."""
+    if not ctrl.user_paused_program or ctrl.user_paused_program["id"] != program_id:
+        send_notification(
+            NOTIFY["PROGRAM_CONTROL"], "program_control.not_paused", False
+        )
+        return
+
+    if time.time() >= ctrl.user_paused_program["window_end"]:
+        ctrl.user_paused_program = None
+        send_notification(
+            NOTIFY["PROGRAM_CONTROL"], "program_control.window_expired", False
+        )
+        return
+
+    if ctrl.active_zone is not None:
+        send_notification(NOTIFY["PROGRAM_CONTROL"], "program_control.zone_busy", False)
+        return
+
+    if ctrl.water_low:
+        send_notification(
+            NOTIFY["PROGRAM_CONTROL"],
+            "float.blocked",
+            False,
+            zone=ctrl.user_paused_program["zone"],
+        )
+        return
+
+    paused = ctrl.user_paused_program
+    ctrl.user_paused_program = None
+
+    # Remaining time is computed from the original window, not from when it was paused
+    new_remaining = int(paused["window_end"] - time.time())
+
+    programs = get_all_programs()
+    local_t = local_time()
+    current_seconds = local_t[3] * 3600 + local_t[4] * 60
+    capped = cap_to_next_program(new_remaining, current_seconds, paused["id"], programs)
+
+    if capped <= 0:
+        send_notification(NOTIFY["PROGRAM_CONTROL"], "program_control.no_time", False)
+        return
+
+    ctrl.activate_zone(paused["zone"], capped, is_manual=False, program_id=paused["id"])
+
+    program = get_program_by_id(paused["id"])
+    send_notification(
+        NOTIFY["PROGRAM_CONTROL"],
+        "program_control.resumed",
+        user=username,
+        id=paused["id"],
+        name=program["name"] if program else str(paused["id"]),
+        zone=paused["zone"],
+        remaining=capped,
+    )
+
+
+def _handle_program_stop(program_id: int, username: str) -> None:
+    """Permanently stops a program regardless of its current state (running, user-paused, or auto-paused)."""
+    stopped = False
+
+    if ctrl.active_program_id == program_id:
+        ctrl.deactivate_active_zone()
+        stopped = True
+
+    if ctrl.user_paused_program and ctrl.user_paused_program["id"] == program_id:
+        ctrl.user_paused_program = None
+        stopped = True
+
+    if ctrl.paused_program and ctrl.paused_program["id"] == program_id:
+        ctrl.paused_program = None
+        stopped = True
+
+    program = get_program_by_id(program_id)
+
+    if stopped:
+        send_notification(
+            NOTIFY["PROGRAM_CONTROL"],
+            "program_control.stopped",
+            user=username,
+            id=program_id,
+            name=program["name"] if program else str(program_id),
+        )
+    else:
+        send_notification(
+            NOTIFY["PROGRAM_CONTROL"], "program_control.not_running", False
+        )
+
+
+def _handle_program_hold(program_id: int, seconds: int, username: str) -> None:
+    """Keeps the scheduler from starting a program for 'seconds'; a run in progress goes on."""
+    if seconds is None:
+        send_notification(
+            NOTIFY["PROGRAM_CONTROL"], "program_control.invalid_hold", False
+        )
+        return
+
+    program = get_program_by_id(program_id)
+    if program is None:
+        send_notification(NOTIFY["PROGRAM_CONTROL"], "program.not_found", False)
+        return
+
+    held_programs[program_id] = time.time() + seconds
+    send_notification(
+        NOTIFY["PROGRAM_CONTROL"],
+        "program_control.held",
+        user=username,
+        id=program_id,
+        name=program["name"],
+        remaining=seconds,
+    )
+
+
+def _handle_program_start(program_id: int, seconds: int, username: str) -> None:
+    """
+    Starts a program now as the scheduler would, for 'seconds' (at most, and by
+    default, its duration) capped at the next scheduled start. Lifts its hold and
+    replaces a paused run of it.
+    """
+    program = get_program_by_id(program_id)
+    if program is None:
+        send_notification(NOTIFY["PROGRAM_CONTROL"], "program.not_found", False)
+        return
+
+    if not program.get("is_active", True):
+        send_notification(NOTIFY["PROGRAM_CONTROL"], "program_control.inactive", False)
+        return
+
+    if ctrl.active_zone is not None:
+        send_notification(NOTIFY["PROGRAM_CONTROL"], "program_control.zone_busy", False)
+        return
+
+    if ctrl.water_low:
+        send_notification(
+            NOTIFY["PROGRAM_CONTROL"], "float.blocked", False, zone=program["zone"]
+        )
+        return
+
+    duration = min(seconds or program["duration"], program["duration"])
+    local_t = local_time()
+    current_seconds = local_t[3] * 3600 + local_t[4] * 60
+    duration = cap_to_next_program(
+        duration, current_seconds, program_id, get_all_programs()
+    )
+    if duration <= 0:
+        send_notification(NOTIFY["PROGRAM_CONTROL"], "program_control.no_time", False)
+        return
+
+    held_programs.pop(program_id, None)
+    if ctrl.paused_program and ctrl.paused_program["id"] == program_id:
+        ctrl.paused_program = None
+    if ctrl.user_paused_program and ctrl.user_paused_program["id"] == program_id:
+        ctrl.user_paused_program = None
+
+    start_auto_program(program, duration)
+    send_notification(
+        NOTIFY["PROGRAM_CONTROL"],
+        "program_control.started",
+        user=username,
+        id=program_id,
+        name=program["name"],
+        zone=program["zone"],
+        remaining=duration,
+    )
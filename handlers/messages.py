@@ -0,0 +1,56 @@
+from utils.messages import MESSAGES as CORE_MESSAGES
+
+# Legacy texts of the codes only the lazily loaded handlers send. MESSAGES here
+# is the full catalog: these groups plus the core ones.
+MESSAGES = {
+    "program_control": {
+        "paused": "{user} ha messo in pausa '{name}' ({remaining} min rimanenti)",
+        "resumed": "{user} ha ripreso '{name}' ({remaining} min rimanenti)",
+        "stopped": "{user} ha fermato il programma '{name}'",
+        "not_running": "Il programma non è in esecuzione",
+        "not_paused": "Nessun programma in pausa con questo ID",
+        "window_expired": "La finestra temporale del programma è scaduta: non è più possibile riprendere",
+        "zone_busy": "Impossibile riprendere: un'altra zona è attiva",
+        "no_time": "Nessun tempo disponibile prima del prossimo programma schedulato",
+        "invalid_action": "Azione non valida",
+        "held": "{user} ha rimandato '{name}' per {remaining} minuti",
+        "invalid_hold": "Durata del rinvio non valida (secondi, al massimo 24 ore)",
+        "started": "{user} ha avviato '{name}' ({remaining} min)",
+        "inactive": "Il programma è disattivato: non può essere avviato",
+    },
+    "program": {
+        "created": "Programma '{name}' creato con successo",
+        "edited": "Programma '{name}' modificato con successo",
+        "deleted": "Programma eliminato con successo",
+        "conflict": "Conflitto con il programma '{name}': orario già occupato",
+        "not_found": "Programma non trovato",
+        "error_create": "Errore nella creazione del programma",
+        "error_edit": "Errore nella modifica del programma",
+        "error_delete": "Errore nell'eliminazione del programma",
+        "imported": "Importazione completata: {created} programmi creati, {rejected} scartati",
+        "error_import": "Errore nell'importazione dei programmi",
+        "import_rejected": "#{index} '{name}': {error}",
+        "disabled_stopped": "Programma '{name}' disabilitato: zona disattivata",
+        "deleted_stopped": "Programma {id} eliminato: zona disattivata",
+        "invalid": "Dati programma non validi",
+        "invalid_update": "Dati aggiornamento non validi",
+        "invalid_id": "ID programma mancante o non valido",
+        "invalid_name": "Nome programma mancante",
+        "invalid_days": "Giorni attivi non validi (valori 0-6, 0=Lunedì)",
+        "invalid_time": "Formato orario non valido (HH:MM)",
+        "invalid_duration": "Durata non valida (intero positivo in secondi)",
+        "invalid_active": "Valore is_active non valido",
+    },
+    "encoding": {
+        "changed": "Codifica delle notifiche impostata su {encoding}",
+    },
+    "history": {
+        "invalid": "Richiesta storico non valida",
+        "error": "Errore nella lettura dello storico",
+    },
+    "runtime": {
+        "invalid": "Richiesta tempi di irrigazione non valida",
+        "error": "Errore nella lettura dei tempi di irrigazione",
+    },
+}
+MESSAGES.update(CORE_MESSAGES)
@@ -0,0 +1,547 @@
+import heapq
+
+import irrigation_controller as ctrl
+import irrigation_programs as store
+from irrigation_notify import NOTIFY, publish, send_notification
+from irrigation_programs import (
+    create_program,
+    create_programs,
+    delete_program,
+    edit_program,
+    get_all_programs,
+    get_program_by_id,
+    get_store_size,
+)
+from irrigation_scheduler import (
+    check_and_run_programs,
+    program_last_started,
+    time_str_to_seconds,
+)
+from utils import log, memory, schema
+from utils.json_stream import JsonArrayReader
+from utils.timezone import (
+    dst_days_between,
+    now_unix,
+    now_unix_ms,
+    utc_from_local,
+    weekday_of,
+)
+
+IMPORT_MAX_PROGRAM_SIZE = 512
+IMPORT_MAX_PROGRAMS = 50
+
+# Import rejections listed in the result notification; the rest are only counted
+IMPORT_MAX_ERRORS = 10
+
+PROGRAM_LIST_HEAP_FACTOR = 4
+
+# Upcoming activations: a page of at most UPCOMING_MAX_PAGE_SIZE, at most
+# UPCOMING_MAX_LIMIT counted over all pages, over a range of up to a year
+UPCOMING_LIMIT = 10
+UPCOMING_MAX_LIMIT = 500
+UPCOMING_PAGE_SIZE = 50
+UPCOMING_MAX_PAGE_SIZE = 50
+UPCOMING_DEGRADED_COUNT = 3
+UPCOMING_RANGE = 8 * 86400
+UPCOMING_MAX_RANGE = 366 * 86400
+# Local hour skipped in March and repeated in October (utils.timezone)
+DST_HOUR_START = 7200
+DST_HOUR_END = 10800
+
+PROGRAM_FIELDS = (
+    ("name", schema.text("program.invalid_name", max_len=64)),
+    ("zone", schema.choice(ctrl.VALID_ZONES, "zone.invalid")),
+    (
+        "active_days",
+        schema.int_list(0, 6, "program.invalid_days"),
+    ),
+    (
+        "start_time",
+        schema.pattern(r"^(?:[01]\d|2[0-3]):[0-5]\d$", "program.invalid_time"),
+    ),
+    (
+        "duration",
+        schema.integer("program.invalid_duration", lo=1, strict=True),
+    ),
+    ("is_active", schema.boolean("program.invalid_active", default=True)),
+)
+PROGRAM = schema.compile(PROGRAM_FIELDS, error="program.invalid")
+PROGRAM_UPDATE = schema.compile(
+    PROGRAM_FIELDS, partial=True, error="program.invalid_update"
+)
+PROGRAM_REF = schema.compile((("id", schema.integer("program.invalid_id")),))
+UPCOMING_REQUEST = schema.compile(
+    (
+        ("from", schema.integer(default=None)),
+        ("to", schema.integer(default=None)),
+        (
+            "limit",
+            schema.integer(
+                lo=1, hi=UPCOMING_MAX_LIMIT, clamp=True, default=UPCOMING_LIMIT
+            ),
+        ),
+        ("page", schema.integer(lo=0, clamp=True, default=0)),
+        (
+            "page_size",
+            schema.integer(
+                lo=1,
+                hi=UPCOMING_MAX_PAGE_SIZE,
+                clamp=True,
+                default=UPCOMING_PAGE_SIZE,
+            ),
+        ),
+    )
+)
+
+# Bulk import in progress: programs parsed so far from the streamed array
+import_reader = JsonArrayReader(IMPORT_MAX_PROGRAM_SIZE)
+import_items = []
+
+
+def check_conflict(
+    program_data: dict, exclude_id: int = None, programs: list = None
+) -> tuple:
+    """
+    Check if program_data overlaps with any existing active program.
+    Returns (has_conflict: bool, conflicting_name: str | None).
+    Conflict = same day AND overlapping time window (start_time + duration).
+    'programs' overrides the stored list (e.g. to include a pending batch).
+    """
+    if programs is None:
+        programs = get_all_programs()
+    new_start = time_str_to_seconds(program_data["start_time"])
+    new_end = new_start + program_data["duration"]
+    new_days = set(program_data["active_days"])
+
+    for prog in programs:
+        if exclude_id is not None and prog.get("id") == exclude_id:
+            continue
+        if not prog.get("is_active", True):
+            continue
+
+        shared_days = new_days.intersection(set(prog["active_days"]))
+        if not shared_days:
+            continue
+
+        existing_start = time_str_to_seconds(prog["start_time"])
+        existing_end = existing_start + prog["duration"]
+
+        if new_start < existing_end and new_end > existing_start:
+            return True, prog.get("name", "sconosciuto")
+
+    return False, None
+
+
+def handle_program_create(data: dict) -> None:
+    program_data, error = PROGRAM(data.get("program"))
+    if error:
+        send_notification(NOTIFY["PROGRAM"], error, False)
+        return
+
+    has_conflict, conflict_name = check_conflict(program_data)
+    if has_conflict:
+        send_notification(
+            NOTIFY["PROGRAM"], "program.conflict", False, name=conflict_name
+        )
+        return
+
+    try:
+        program = create_program(program_data)
+        send_notification(
+            NOTIFY["PROGRAM"], "program.created", id=program["id"], name=program["name"]
+        )
+        send_program_change("create", program["id"], program, store.revision)
+    except Exception as e:
+        log.error("Error creating program: %s", e)
+        send_notification(NOTIFY["PROGRAM"], "program.error_create", False)
+
+
+def _collect_import_item(item) -> None:
+    if len(import_items) >= IMPORT_MAX_PROGRAMS:
+        import_reader.error = "too many programs"
+        return
+    import_items.append(item)
+
+
+def on_import_chunk(topic: bytes, chunk, offset: int, total: int) -> None:
+    """Streams a JSON array of programs through the incremental reader."""
+    if offset == 0:
+        import_reader.reset()
+        import_items.clear()
+        if not memory.has_budget(IMPORT_MAX_PROGRAMS * IMPORT_MAX_PROGRAM_SIZE):
+            import_reader.error = "low memory"
+    import_reader.feed(chunk, _collect_import_item)
+    if offset + len(chunk) < total:
+        return
+
+    error = import_reader.error
+    if not error and not import_reader.done:
+        error = "incomplete array"
+    items = import_items[:]
+    import_items.clear()
+    if error:
+        log.warning("Program import rejected: %s", error)
+        if error == "low memory":
+            send_notification(NOTIFY["PROGRAM"], "memory.low", False)
+        else:
+            send_notification(NOTIFY["PROGRAM"], "program.error_import", False)
+        return
+    handle_program_import(items)
+
+
+def handle_program_import(programs: list) -> None:
+    """
+    Validates and stores a batch of programs. Every invalid or conflicting program
+    is rejected, the others are stored; the result lists what was rejected and why.
+    """
+    valid, invalid = schema.validate_all(PROGRAM, programs)
+    rejected = [
+        {"index": index + 1, "name": name, "code": code}
+        for index, name, code in invalid
+    ]
+    pending = get_all_programs()
+    accepted = []
+
+    for index, program_data in valid:
+        has_conflict, conflict_name = check_conflict(program_data, programs=pending)
+        if has_conflict:
+            rejected.append(
+                {
+                    "index": index + 1,
+                    "name": program_data["name"],
+                    "code": "program.conflict",
+                    "params": {"name": conflict_name},
+                }
+            )
+            continue
+        pending.append(program_data)
+        accepted.append(program_data)
+
+    try:
+        created = create_programs(accepted)
+    except Exception as e:
+        log.error("Error importing programs: %s", e)
+        send_notification(NOTIFY["PROGRAM"], "program.error_import", False)
+        return
+
+    rejected.sort(key=lambda r: r["index"])
+    for r in rejected:
+        log.warning("Import: #%d '%s' rejected: %s", r["index"], r["name"], r["code"])
+    send_notification(
+        NOTIFY["PROGRAM"],
+        "program.imported",
+        not rejected,
+        created=len(accepted),
+        rejected=len(rejected),
+        errors=rejected[:IMPORT_MAX_ERRORS],
+    )
+    first_rev = store.revision - len(created) + 1
+    for i, program in enumerate(created):
+        send_program_change("create", program["id"], program, first_rev + i)
+
+
+def handle_program_edit(data: dict) -> None:
+    ref, error = PROGRAM_REF(data)
+    if error:
+        send_notification(NOTIFY["PROGRAM"], error, False)
+        return
+    program_id = ref["id"]
+
+    existing = get_program_by_id(program_id)
+    if not existing:
+        send_notification(NOTIFY["PROGRAM"], "program.not_found", False)
+        return
+
+    updates, error = PROGRAM_UPDATE(data.get("program", {}))
+    if error:
+        send_notification(NOTIFY["PROGRAM"], error, False)
+        return
+
+    # Merge for conflict check against the full updated program
+    merged = {}
+    merged.update(existing)
+    merged.update(updates)
+
+    has_conflict, conflict_name = check_conflict(merged, exclude_id=program_id)
+    if has_conflict:
+        send_notification(
+            NOTIFY["PROGRAM"], "program.conflict", False, name=conflict_name
+        )
+        return
+
+    try:
+        program = edit_program(program_id, updates)
+        send_notification(
+            NOTIFY["PROGRAM"], "program.edited", id=program_id, name=program["name"]
+        )
+
+        # If disabled, stop it wherever it currently is
+        if not program.get("is_active", True):
+            was_active = ctrl.active_program_id == program_id
+            if was_active:
+                ctrl.deactivate_active_zone()
+                send_notification(
+                    NOTIFY["ZONE"],
+                    "program.disabled_stopped",
+                    id=program_id,
+                    name=program["name"],
+                )
+            if ctrl.paused_program and ctrl.paused_program.get("id") == program_id:
+                ctrl.paused_program = None
+            if (
+                ctrl.user_paused_program
+                and ctrl.user_paused_program.get("id") == program_id
+            ):
+                ctrl.user_paused_program = None
+            if was_active:
+                check_and_run_programs()
+
+        send_program_change("update", program_id, program, store.revision)
+    except Exception as e:
+        log.error("Error editing program: %s", e)
+        send_notification(NOTIFY["PROGRAM"], "program.error_edit", False)
+
+
+def handle_program_delete(data: dict) -> None:
+    ref, error = PROGRAM_REF(data)
+    if error:
+        send_notification(NOTIFY["PROGRAM"], error, False)
+        return
+    program_id = ref["id"]
+
+    # Remove from all active states before deleting
+    was_active = ctrl.active_program_id == program_id
+    if was_active:
+        ctrl.deactivate_active_zone()
+        send_notification(NOTIFY["ZONE"], "program.deleted_stopped", id=program_id)
+    if ctrl.paused_program and ctrl.paused_program.get("id") == program_id:
+        ctrl.paused_program = None
+    if ctrl.user_paused_program and ctrl.user_paused_program.get("id") == program_id:
+        ctrl.user_paused_program = None
+    program_last_started.pop(program_id, None)
+
+    success = delete_program(program_id)
+    if success:
+        send_notification(NOTIFY["PROGRAM"], "program.deleted", id=program_id)
+        send_program_change("delete", program_id, None, store.revision)
+        if was_active:
+            check_and_run_programs()
+    else:
+        send_notification(NOTIFY["PROGRAM"], "program.not_found", False)
+
+
+# ---------------------------------------------------------------------------
+# Program list and upcoming activations
+# ---------------------------------------------------------------------------
+
+
+def handle_program_list(data: dict) -> None:
+    send_program_list()
+
+
+def handle_program_upcoming(data: dict) -> None:
+    """
+    Sends one page of upcoming activations.
+    Payload: {"from": <unix s>, "to": <unix s>, "limit": 10, "page": 0, "page_size": 50}
+    — all optional; by default the next 10 activations from now over 8 days.
+    """
+    fields, error = UPCOMING_REQUEST(data)
+    if error:
+        send_notification(NOTIFY["PROGRAM_UPCOMING"], error, False)
+        return
+    start = fields["from"]
+    if start is None:
+        start = now_unix() + 1
+    end = fields["to"]
+    if end is None:
+        end = start + UPCOMING_RANGE
+    if not 0 < end - start <= UPCOMING_MAX_RANGE:
+        send_notification(NOTIFY["PROGRAM_UPCOMING"], "payload.invalid", False)
+        return
+    send_upcoming_programs(
+        start, end, fields["limit"], fields["page"], fields["page_size"]
+    )
+
+
+def send_program_list() -> None:
+    if not memory.has_budget(get_store_size() * PROGRAM_LIST_HEAP_FACTOR):
+        send_notification(NOTIFY["PROGRAM_LIST"], "memory.low", False)
+        return
+    try:
+        programs = get_all_programs()
+        payload = {
+            "programs": programs,
+            "total": len(programs),
+            "rev": store.revision,
+            "timestamp": now_unix_ms(),
+        }
+        publish(NOTIFY["PROGRAM_LIST"], payload)
+    except Exception as e:
+        log.error("Error sending program list: %s", e)
+
+
+def send_program_change(op: str, program_id: int, program: dict, rev: int) -> None:
+    """
+    Publishes one store change: {"op": "create"|"update"|"delete", "id", "program"
+    (the whole program, not on delete), "rev"}. A client holding the list at
+    revision r applies the events from r + 1 on; a gap means it missed one and
+    asks for the list again.
+    """
+    payload = {"op": op, "id": program_id, "rev": rev, "timestamp": now_unix_ms()}
+    if program is not None:
+        payload["program"] = program
+    try:
+        publish(NOTIFY["PROGRAM_CHANGE"], payload)
+    except Exception as e:
+        log.error("Error sending program change: %s", e)
+
+
+def send_upcoming_programs(
+    start: int, end: int, limit: int, page: int, page_size: int
+) -> None:
+    degraded = not memory.has_budget(get_store_size() * PROGRAM_LIST_HEAP_FACTOR)
+    if degraded and page_size > UPCOMING_DEGRADED_COUNT:
+        # Keep the page index meaningful: shrink the page, the client follows 'more'
+        page = page * page_size // UPCOMING_DEGRADED_COUNT
+        page_size = UPCOMING_DEGRADED_COUNT
+    try:
+        upcoming, more = compute_upcoming_programs(start, end, limit, page, page_size)
+        payload = {
+            "upcoming": upcoming,
+            "from": start,
+            "to": end,
+            "page": page,
+            "page_size": page_size,
+            "more": more,
+            "timestamp": now_unix_ms(),
+        }
+        if degraded:
+            payload["degraded"] = True
+        publish(NOTIFY["PROGRAM_UPCOMING"], payload)
+    except Exception as e:
+        log.error("Error sending upcoming programs: %s", e)
+
+
+def compute_upcoming_programs(
+    start: int,
+    end: int,
+    limit: int = UPCOMING_LIMIT,
+    page: int = 0,
+    page_size: int = UPCOMING_PAGE_SIZE,
+) -> tuple:
+    """
+    One page of the activations starting in [start, end) (local-time unix
+    seconds), counting at most 'limit' from the first: (activations, more).
+    'more' is set when another activation exists within 'limit'.
+    """
+    first = page * page_size
+    take = min(page_size, limit - first)
+    if take <= 0:
+        return [], False
+    occurrences = iter_upcoming(get_all_programs(), start, end)
+    out = []
+    skip = first
+    for occurrence in occurrences:
+        if skip:
+            skip -= 1
+            continue
+        if len(out) >= take:
+            return out, first + len(out) < limit
+        out.append(occurrence)
+    return out, False
+
+
+def iter_upcoming(programs: list, start: int, end: int):
+    """
+    Yields the activations of the active programs starting in [start, end) in
+    time order, merging one occurrence generator per program through a heap, so
+    nothing beyond the next activation of each program is held. A window open
+    now is marked with the program's state: "running", "paused" (by a user) or
+    "interrupted" (resumes on its own).
+    """
+    first_day = start - start % 86400
+    last_day = end - end % 86400
+    weekday = weekday_of(first_day)
+    dst = dst_days_between(first_day, last_day)
+    heap = []
+    for prog in programs:
+        if prog.get("is_active", True):
+            gen = _program_occurrences(prog, first_day, weekday, last_day, dst)
+            entry = _next_entry(prog, gen, start)
+            if entry:
+                heap.append(entry)
+    heapq.heapify(heap)
+
+    now = now_unix()
+    while heap:
+        occ_start, _, repeated, duration, prog, gen = heapq.heappop(heap)
+        if occ_start >= end:
+            return
+        occurrence = {
+            "id": prog["id"],
+            "name": prog["name"],
+            "zone": prog["zone"],
+            "start": occ_start,
+            "utc": utc_from_local(occ_start, repeated),
+            "duration": duration,
+        }
+        if occ_start <= now < occ_start + duration:
+            state = _window_state(prog["id"])
+            if state:
+                occurrence["state"] = state
+        yield occurrence
+        entry = _next_entry(prog, gen, start)
+        if entry:
+            heapq.heappush(heap, entry)
+
+
+def _next_entry(prog: dict, gen, start: int) -> tuple:
+    # Ids are unique, so ties on the start never compare further than the id
+    for occ_start, repeated, duration in gen:
+        if occ_start >= start:
+            return occ_start, prog["id"], repeated, duration, prog, gen
+    return None
+
+
+def _program_occurrences(prog: dict, day: int, weekday: int, last_day: int, dst: tuple):
+    """
+    Yields (start, repeated, duration) for each day of 'prog' from the local midnight
+    'day' to 'last_day', as the scheduler runs it across the DST change days in
+    'dst' (March, October): a start in the hour skipped in March waits for 03:00
+    with what is left of its window, one in the hour repeated in October runs on
+    both passes.
+    """
+    springs, autumns = dst
+    start_s = time_str_to_seconds(prog["start_time"])
+    duration = prog["duration"]
+    days = prog["active_days"]
+    dst_hour = DST_HOUR_START <= start_s < DST_HOUR_END
+    while day <= last_day:
+        if weekday in days:
+            start = day + start_s
+            if not dst_hour:
+                yield start, False, duration
+            else:
+                if day in springs:
+                    left = start_s + duration - DST_HOUR_END
+                    if left > 0:
+                        start = day + DST_HOUR_END
+                        yield start, False, left
+                elif day in autumns:
+                    yield start, False, duration
+                    if duration <= 3600:
+                        yield start, True, duration
+                else:
+                    yield start, False, duration
+        day += 86400
+        weekday = (weekday + 1) % 7
+
+
+def _window_state(program_id: int) -> str:
+    if ctrl.active_program_id == program_id:
+        return "running"
+    if ctrl.user_paused_program and ctrl.user_paused_program["id"] == program_id:
+        return "paused"
+    if ctrl.paused_program and ctrl.paused_program["id"] == program_id:
+        return "interrupted"
+    return None
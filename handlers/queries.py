@@ -0,0 +1,209 @@
+import time
+
+import irrigation_history as history
+import irrigation_runtime as runtime
+import irrigation_notify as notify
+from irrigation_notify import NOTIFY, notify_encodings, publish, send_notification
+from utils import compact, log, memory, metrics, schema
+from utils.timezone import now_unix, now_unix_ms
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 100
+HISTORY_DEGRADED_PAGE_SIZE = 10
+
+RUNTIME_MAX_DAYS = 31
+
+LOG_QUERY_LIMIT = 20
+
+ENCODING_REQUEST = schema.compile(
+    (
+        ("topic", schema.choice(NOTIFY, upper=True, default=None)),
+        ("encoding", schema.choice(compact.ENCODINGS, default=None)),
+        ("messages", schema.choice(notify.MESSAGE_MODES, default=None)),
+    )
+)
+HISTORY_REQUEST = schema.compile(
+    (
+        ("res", schema.choice(history.RESOLUTIONS, default="raw")),
+        ("from", schema.integer(default=0)),
+        ("to", schema.integer(default=lambda: now_unix() + 1)),
+        ("page", schema.integer(lo=0, clamp=True, default=0)),
+        (
+            "page_size",
+            schema.integer(
+                lo=1, hi=HISTORY_MAX_PAGE_SIZE, clamp=True, default=HISTORY_PAGE_SIZE
+            ),
+        ),
+    )
+)
+RUNTIME_REQUEST = schema.compile(
+    (
+        ("from", schema.integer(default=0)),
+        ("to", schema.integer(default=lambda: now_unix() + 86400)),
+        (
+            "limit",
+            schema.integer(
+                lo=1, hi=RUNTIME_MAX_DAYS, clamp=True, default=RUNTIME_MAX_DAYS
+            ),
+        ),
+    )
+)
+# Lenient: a bad paging field falls back to its default, an unknown level is ignored
+LOG_REQUEST = schema.compile(
+    (
+        ("set_level", schema.choice(log.LEVELS, default=None)),
+        ("since", schema.integer(default=0)),
+        ("level", schema.choice(log.LEVELS, default="debug")),
+        (
+            "limit",
+            schema.integer(lo=1, hi=log.RING_SIZE, clamp=True, default=LOG_QUERY_LIMIT),
+        ),
+    ),
+    lenient=True,
+)
+METRICS_REQUEST = schema.compile(
+    (
+        ("enabled", schema.boolean(strict=False, default=None)),
+        ("gc_threshold", schema.integer(default=None)),
+    ),
+    lenient=True,
+)
+
+
+def handle_encoding_request(data: dict) -> None:
+    """
+    Selects the encoding of a notification topic and the message mode.
+    Payload: {"topic": "zone", "encoding": "cbor"} and/or {"messages": "code"|"text"}
+    """
+    fields, error = ENCODING_REQUEST(data)
+    if error:
+        log.warning("Invalid encoding request: %s", data)
+        return
+    name = fields["topic"]
+    encoding = fields["encoding"]
+    mode = fields["messages"]
+    # A topic needs an encoding and the other way round; at least one setting
+    if (
+        (name is None) != (encoding is None)
+        or name == "STATUS"
+        or (name is None and mode is None)
+    ):
+        log.warning("Invalid encoding request: %s", data)
+        return
+
+    if mode is not None:
+        notify.message_mode = mode
+    if encoding == "json":
+        notify_encodings.pop(name, None)
+    elif encoding is not None:
+        notify_encodings[name] = encoding
+    notify.save_notify_encodings()
+    if name is not None:
+        send_notification(NOTIFY[name], "encoding.changed", encoding=encoding)
+
+
+def handle_history_request(data: dict) -> None:
+    """
+    Sends one page of recorded telemetry.
+    Payload: {"res": "raw"|"hour"|"day", "from": <unix s>, "to": <unix s>, "page": 0, "page_size": 50}
+    Records are [time, kind, channel, value] (raw) or [time, kind, channel, count, total].
+    """
+    fields, error = HISTORY_REQUEST(data)
+    if error:
+        send_notification(NOTIFY["HISTORY"], "history.invalid", False)
+        return
+    resolution = fields["res"]
+    start = fields["from"]
+    end = fields["to"]
+    page = fields["page"]
+    page_size = fields["page_size"]
+
+    if page_size > HISTORY_DEGRADED_PAGE_SIZE and not memory.has_budget():
+        # Keep the page index meaningful: shrink the page, the client follows 'more'
+        page = page * page_size // HISTORY_DEGRADED_PAGE_SIZE
+        page_size = HISTORY_DEGRADED_PAGE_SIZE
+
+    try:
+        records, more = history.query(resolution, start, end, page, page_size)
+        payload = {
+            "res": resolution,
+            "page_size": page_size,
+            "page": page,
+            "records": records,
+            "more": more,
+            "timestamp": now_unix_ms(),
+        }
+        publish(NOTIFY["HISTORY"], payload)
+    except Exception as e:
+        log.error("Error sending history: %s", e)
+        send_notification(NOTIFY["HISTORY"], "history.error", False)
+
+
+def handle_runtime_request(data: dict) -> None:
+    """
+    Sends actual watering time per day.
+    Payload: {"from": <unix s>, "to": <unix s>, "limit": 31}
+    Each day is {"day": <local midnight>, "zones": {...}, "programs": {...}, "manual": {...}}
+    in seconds; request again from the last day + 86400 while 'more' is true.
+    """
+    fields, error = RUNTIME_REQUEST(data)
+    if error:
+        send_notification(NOTIFY["RUNTIME"], "runtime.invalid", False)
+        return
+
+    try:
+        days, more = runtime.query(fields["from"], fields["to"], fields["limit"])
+        payload = {"days": days, "more": more, "timestamp": now_unix_ms()}
+        publish(NOTIFY["RUNTIME"], payload)
+    except Exception as e:
+        log.error("Error sending runtime: %s", e)
+        send_notification(NOTIFY["RUNTIME"], "runtime.error", False)
+
+
+def handle_log_request(data: dict) -> None:
+    """
+    Sends buffered log entries and optionally changes the log level.
+    Payload: {"since": <seq>, "level": "warning", "limit": 20, "set_level": "debug"}
+    Entries are [seq, time, level, text]; pass the returned 'next' as 'since' to page.
+    """
+    fields, _ = LOG_REQUEST(data)
+    if fields is None:
+        return
+    if fields["set_level"] is not None:
+        log.LEVEL = log.LEVELS[fields["set_level"]]
+        log.info("Log level set to %s", fields["set_level"])
+
+    try:
+        entries = log.entries(
+            fields["since"], log.LEVELS[fields["level"]], fields["limit"]
+        )
+        offset = now_unix() - time.time()
+        for entry in entries:
+            entry[1] += offset
+        payload = {
+            "entries": entries,
+            "next": entries[-1][0] if entries else log.next_seq - 1,
+            "timestamp": now_unix_ms(),
+        }
+        publish(NOTIFY["LOG"], payload)
+    except Exception as e:
+        log.error("Error sending log: %s", e)
+
+
+def handle_metrics_request(data: dict) -> None:
+    """
+    Turns loop and heap instrumentation on or off and tunes the GC.
+    Payload: {"enabled": true|false, "gc_threshold": <bytes>} — both optional.
+    """
+    fields, error = METRICS_REQUEST(data)
+    if fields is None:
+        return
+    if error:
+        log.warning("Invalid metrics request: %s", data)
+    enabled = fields["enabled"]
+    if enabled is not None and enabled != metrics.ENABLED:
+        metrics.enable(enabled)
+        log.info("Metrics %s", "enabled" if enabled else "disabled")
+    if fields["gc_threshold"] is not None:
+        applied = memory.tune_gc(fields["gc_threshold"])
+        log.info("GC threshold set to %s bytes", applied)
@@ -2,27 +2,58 @@ import time
 
 from machine import Pin
 
+from utils import log
+
+try:
+    import secrets
+except ImportError:
+    secrets = None
+
 MANUAL_MAX_DURATION = 3600
+FLOAT_DEBOUNCE_MS = 300
 
+# Low-water interlock, opt-in from secrets.py: zones are paused and activation is
+# blocked while INTERLOCK_SWITCH reads INTERLOCK_LOW_VALUE. "" leaves the float
+# switches monitored only.
+INTERLOCK_SWITCH = getattr(secrets, "INTERLOCK_SWITCH", "")
+INTERLOCK_LOW_VALUE = getattr(secrets, "INTERLOCK_LOW_VALUE", 0)
+
+# Outputs are driven low on import: after any reset, the hardware watchdog's
+# included, the valves close before anything is restored
 zone_pins = {
-    "zone_1": Pin(16, Pin.OUT),
-    "zone_2": Pin(17, Pin.OUT),
-    "zone_3": Pin(18, Pin.OUT),
-    "zone_4": Pin(25, Pin.OUT),
-    "zone_5": Pin(26, Pin.OUT),
-    "zone_6": Pin(27, Pin.OUT),
-    "zone_7": Pin(32, Pin.OUT),
-    "zone_8": Pin(33, Pin.OUT),
+    "zone_1": Pin(16, Pin.OUT, value=0),
+    "zone_2": Pin(17, Pin.OUT, value=0),
+    "zone_3": Pin(18, Pin.OUT, value=0),
+    "zone_4": Pin(25, Pin.OUT, value=0),
+    "zone_5": Pin(26, Pin.OUT, value=0),
+    "zone_6": Pin(27, Pin.OUT, value=0),
+    "zone_7": Pin(32, Pin.OUT, value=0),
+    "zone_8": Pin(33, Pin.OUT, value=0),
 }
 
 VALID_ZONES = set(zone_pins.keys())
 
-main_valve = Pin(19, Pin.OUT)
+main_valve = Pin(19, Pin.OUT, value=0)
 
 float_switch_1 = Pin(23, Pin.IN)
 float_switch_2 = Pin(34, Pin.IN)
 float_switch_3 = Pin(35, Pin.IN)
 
+float_pins = {
+    "float_switch_1": float_switch_1,
+    "float_switch_2": float_switch_2,
+    "float_switch_3": float_switch_3,
+}
+
+INTERLOCK_ENABLED = INTERLOCK_SWITCH in float_pins
+if INTERLOCK_SWITCH and not INTERLOCK_ENABLED:
+    log.error("Unknown INTERLOCK_SWITCH '%s', interlock off", INTERLOCK_SWITCH)
+
+# Debounced levels, updated from edge interrupts by poll_float_switches()
+float_levels = {name: pin.value() for name, pin in float_pins.items()}
+_float_pending = False
+_float_edge_ms = 0
+
 active_zone = None
 manual_override = False
 zone_end_time = None       # time.time() of scheduled end for the active zone
@@ -34,6 +65,24 @@ paused_program = None
 # Program explicitly paused by the user via command: {"id": int, "zone": str, "window_end": float}
 user_paused_program = None
 
+# Manual zone stopped by the low-water interlock, resumed when the level recovers:
+# {"zone": str, "remaining": int}. Auto programs go to paused_program instead.
+interlock_paused = None
+water_low = False
+
+
+# Callbacks fn(event, zone, program_id, was_manual) run on every zone transition;
+# event is "on" or "off"
+transition_listeners = []
+
+
+def _notify_transition(event: str, zone: str, program_id: int, was_manual: bool) -> None:
+    for fn in transition_listeners:
+        try:
+            fn(event, zone, program_id, was_manual)
+        except Exception as e:
+            log.error("Transition listener error: %s", e)
+
 
 def _activate_pins(zone_name: str) -> None:
     main_valve.on()
@@ -57,6 +106,7 @@ def activate_zone(
     manual_override = is_manual
     zone_end_time = time.time() + duration
     active_program_id = program_id
+    _notify_transition("on", zone_name, program_id, is_manual)
 
 
 def deactivate_active_zone() -> dict:
@@ -72,19 +122,29 @@ def deactivate_active_zone() -> dict:
     manual_override = False
     zone_end_time = None
     active_program_id = None
+    if prev["zone"] is not None:
+        _notify_transition("off", prev["zone"], prev["program_id"], prev["was_manual"])
     return prev
 
 
 def deactivate_all_zones() -> None:
     """Emergency stop: deactivates all pins and resets all state."""
-    global active_zone, manual_override, zone_end_time, active_program_id, paused_program, user_paused_program
+    global active_zone, manual_override, zone_end_time, active_program_id, paused_program, user_paused_program, interlock_paused
     _deactivate_pins()
+    if active_zone is not None:
+        _notify_transition("off", active_zone, active_program_id, manual_override)
     active_zone = None
     manual_override = False
     zone_end_time = None
     active_program_id = None
     paused_program = None
     user_paused_program = None
+    interlock_paused = None
+
+
+def close_valves() -> None:
+    """Closes every valve and leaves the state alone, so it can be resumed after a reset."""
+    _deactivate_pins()
 
 
 def is_zone_timeout() -> bool:
@@ -100,8 +160,45 @@ def get_remaining_seconds() -> int:
 
 
 def get_float_switches() -> dict:
-    return {
-        "float_switch_1": float_switch_1.value(),
-        "float_switch_2": float_switch_2.value(),
-        "float_switch_3": float_switch_3.value(),
-    }
+    return dict(float_levels)
+
+
+def _on_float_edge(pin) -> None:
+    # IRQ context: only record that something moved, debouncing happens in the loop
+    global _float_pending, _float_edge_ms
+    _float_pending = True
+    _float_edge_ms = time.ticks_ms()
+
+
+def start_float_monitoring() -> None:
+    """Samples the initial levels and arms edge interrupts on all float switches."""
+    global water_low
+    for name, pin in float_pins.items():
+        float_levels[name] = pin.value()
+        pin.irq(trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING, handler=_on_float_edge)
+    water_low = is_level_low()
+
+
+def poll_float_switches() -> list:
+    """
+    Returns the (switch, level) pairs that changed since the last call, once the
+    inputs have been quiet for FLOAT_DEBOUNCE_MS. Returns None when nothing moved,
+    so the idle cost is a single flag check.
+    """
+    global _float_pending
+    if not _float_pending:
+        return None
+    if time.ticks_diff(time.ticks_ms(), _float_edge_ms) < FLOAT_DEBOUNCE_MS:
+        return None
+    _float_pending = False
+    changes = []
+    for name, pin in float_pins.items():
+        value = pin.value()
+        if value != float_levels[name]:
+            float_levels[name] = value
+            changes.append((name, value))
+    return changes
+
+
+def is_level_low() -> bool:
+    return INTERLOCK_ENABLED and float_levels[INTERLOCK_SWITCH] == INTERLOCK_LOW_VALUE
@@ -0,0 +1,355 @@
+import struct
+import time
+
+from utils import log
+from utils.timezone import now_unix
+
+RAW_FILE = "/history_raw.bin"
+HOURLY_FILE = "/history_hour.bin"
+DAILY_FILE = "/history_day.bin"
+
+RAW_CAPACITY = 2048  # ~16 KB on flash
+HOURLY_CAPACITY = 1536  # ~18 KB: about 6 weeks of busy hours
+DAILY_CAPACITY = 1024  # ~12 KB: about 3 months at 11 channels per day
+
+BATCH_SIZE = 16
+FLUSH_INTERVAL = 600
+MIN_VALID_TIME = 1700000000  # anything earlier means the clock is not set yet
+
+KIND_FLOAT = 1
+KIND_ZONE = 2
+
+ZONE_CHANNELS = 8
+FLOAT_CHANNELS = 3
+
+# Raw record: time, kind, channel, value
+#   float: transition time, switch 1-3, new level
+#   zone:  session start, zone 1-8, open seconds (capped at 65535)
+RAW_FORMAT = "<IBBH"
+# Rollup record: period start, kind, channel, count, total
+#   float: transitions, seconds spent at level 0
+#   zone:  sessions started, open seconds
+ROLLUP_FORMAT = "<IBBHI"
+
+RESOLUTIONS = ("raw", "hour", "day")
+
+_HEADER_FORMAT = "<4sBBHII"  # magic, version, record size, capacity, head, count
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+_MAGIC = b"IRTS"
+_VERSION = 1
+_SCAN_RECORDS = 32
+
+
+class RingFile:
+    """
+    Fixed-size circular file of fixed-size records. Reads and writes go through a
+    small reusable buffer, so memory use does not depend on the capacity.
+    """
+
+    def __init__(self, path: str, fmt: str, capacity: int):
+        self.path = path
+        self.fmt = fmt
+        self.rec_size = struct.calcsize(fmt)
+        self.capacity = capacity
+        self.head = 0
+        self.count = 0
+        self._buf = bytearray(self.rec_size * _SCAN_RECORDS)
+        self._load_header()
+
+    def _load_header(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(_HEADER_SIZE)
+            magic, version, rec_size, capacity, head, count = struct.unpack(
+                _HEADER_FORMAT, header
+            )
+            if (
+                magic == _MAGIC
+                and version == _VERSION
+                and rec_size == self.rec_size
+                and capacity == self.capacity
+            ):
+                self.head = head % capacity
+                self.count = min(count, capacity)
+                return
+        except (OSError, ValueError):
+            pass
+        self._create()
+
+    def _create(self) -> None:
+        self.head = 0
+        self.count = 0
+        zeros = bytearray(256)
+        remaining = self.rec_size * self.capacity
+        with open(self.path, "wb") as f:
+            f.write(self._header())
+            while remaining > 0:
+                n = min(remaining, len(zeros))
+                f.write(zeros[:n])
+                remaining -= n
+
+    def _header(self) -> bytes:
+        return struct.pack(
+            _HEADER_FORMAT,
+            _MAGIC,
+            _VERSION,
+            self.rec_size,
+            self.capacity,
+            self.head,
+            self.count,
+        )
+
+    def append(self, records: bytearray, n: int) -> None:
+        """Writes n packed records with one open of the file, wrapping at the end."""
+        if n <= 0:
+            return
+        size = self.rec_size
+        view = memoryview(records)
+        with open(self.path, "r+b") as f:
+            written = 0
+            while written < n:
+                run = min(n - written, self.capacity - self.head)
+                f.seek(_HEADER_SIZE + self.head * size)
+                f.write(view[written * size : (written + run) * size])
+                written += run
+                self.head = (self.head + run) % self.capacity
+            self.count = min(self.count + n, self.capacity)
+            f.seek(0)
+            f.write(self._header())
+
+    def scan(self, start: int, end: int, skip: int, limit: int, fn) -> bool:
+        """
+        Calls fn(record_tuple) for up to 'limit' records with start <= time < end,
+        oldest first, after skipping the first 'skip' matches.
+        Returns True if more matches exist beyond the limit.
+        """
+        size = self.rec_size
+        oldest = (self.head - self.count) % self.capacity
+        buf = self._buf
+        index = 0
+        with open(self.path, "rb") as f:
+            while index < self.count:
+                slot = (oldest + index) % self.capacity
+                n = min(_SCAN_RECORDS, self.count - index, self.capacity - slot)
+                f.seek(_HEADER_SIZE + slot * size)
+                f.readinto(memoryview(buf)[: n * size])
+                for i in range(n):
+                    rec = struct.unpack_from(self.fmt, buf, i * size)
+                    if not start <= rec[0] < end:
+                        continue
+                    if skip > 0:
+                        skip -= 1
+                        continue
+                    if limit <= 0:
+                        return True
+                    fn(rec)
+                    limit -= 1
+                index += n
+        return False
+
+
+raw = None
+hourly = None
+daily = None
+
+_batch = bytearray(struct.calcsize(RAW_FORMAT) * BATCH_SIZE)
+_batch_count = 0
+_batch_since = 0
+
+# Rollup accumulators for the current hour and day, one slot per channel
+_hour_start = 0
+_day_start = 0
+_hour = {
+    KIND_ZONE: ([0] * ZONE_CHANNELS, [0] * ZONE_CHANNELS),
+    KIND_FLOAT: ([0] * FLOAT_CHANNELS, [0] * FLOAT_CHANNELS),
+}
+_day = {
+    KIND_ZONE: ([0] * ZONE_CHANNELS, [0] * ZONE_CHANNELS),
+    KIND_FLOAT: ([0] * FLOAT_CHANNELS, [0] * FLOAT_CHANNELS),
+}
+
+# Open zone session: channel index, session start, start of the not-yet-counted part
+_open_zone = None
+_open_start = 0
+_open_counted_from = 0
+
+# Float levels and when the not-yet-counted low time began (0 = currently high)
+_float_level = [1] * FLOAT_CHANNELS
+_float_low_since = [0] * FLOAT_CHANNELS
+
+
+def _channel(name: str) -> int:
+    """'zone_3' / 'float_switch_2' -> zero-based channel index."""
+    return int(name[name.rfind("_") + 1 :]) - 1
+
+
+def start(float_levels: dict) -> None:
+    """Opens the ring files and seeds the float accumulators with the current levels."""
+    global raw, hourly, daily, _hour_start, _day_start
+    raw = RingFile(RAW_FILE, RAW_FORMAT, RAW_CAPACITY)
+    hourly = RingFile(HOURLY_FILE, ROLLUP_FORMAT, HOURLY_CAPACITY)
+    daily = RingFile(DAILY_FILE, ROLLUP_FORMAT, DAILY_CAPACITY)
+
+    now = now_unix()
+    _hour_start = now - now % 3600
+    _day_start = now - now % 86400
+    for name, level in float_levels.items():
+        i = _channel(name)
+        _float_level[i] = level
+        _float_low_since[i] = now if level == 0 else 0
+
+
+def _append_raw(kind: int, channel: int, t: int, value: int) -> None:
+    global _batch_count, _batch_since
+    if raw is None or t < MIN_VALID_TIME:
+        return
+    struct.pack_into(
+        RAW_FORMAT,
+        _batch,
+        _batch_count * struct.calcsize(RAW_FORMAT),
+        t,
+        kind,
+        channel + 1,
+        min(value, 0xFFFF),
+    )
+    if _batch_count == 0:
+        _batch_since = time.time()
+    _batch_count += 1
+    if _batch_count >= BATCH_SIZE:
+        flush()
+
+
+def flush() -> None:
+    global _batch_count
+    if _batch_count == 0:
+        return
+    try:
+        raw.append(_batch, _batch_count)
+    except Exception as e:
+        log.error("Error writing history: %s", e)
+    _batch_count = 0
+
+
+def on_zone_transition(
+    event: str, zone: str, program_id: int, was_manual: bool
+) -> None:
+    """Controller transition listener: tracks zone sessions."""
+    global _open_zone, _open_start, _open_counted_from
+    now = now_unix()
+    if event == "on":
+        _open_zone = _channel(zone)
+        _open_start = now
+        _open_counted_from = now
+        _hour[KIND_ZONE][0][_open_zone] += 1
+        return
+
+    if _open_zone is None:
+        return
+    _hour[KIND_ZONE][1][_open_zone] += max(0, now - _open_counted_from)
+    _append_raw(KIND_ZONE, _open_zone, _open_start, now - _open_start)
+    _open_zone = None
+
+
+def shift_clock(step: int) -> None:
+    """The clock was stepped: open zone and low-level periods keep their length."""
+    global _open_start, _open_counted_from
+    if _open_zone is not None:
+        _open_start += step
+        _open_counted_from += step
+    for i in range(FLOAT_CHANNELS):
+        if _float_low_since[i]:
+            _float_low_since[i] += step
+
+
+def record_float(switch: str, level: int) -> None:
+    now = now_unix()
+    i = _channel(switch)
+    if level == _float_level[i]:
+        return
+    if _float_level[i] == 0:
+        _hour[KIND_FLOAT][1][i] += max(0, now - _float_low_since[i])
+        _float_low_since[i] = 0
+    else:
+        _float_low_since[i] = now
+    _float_level[i] = level
+    _hour[KIND_FLOAT][0][i] += 1
+    _append_raw(KIND_FLOAT, i, now, level)
+
+
+def _write_rollups(ring: RingFile, period_start: int, acc: dict) -> None:
+    """Writes the non-empty channels of an accumulator as rollup records and clears it."""
+    size = struct.calcsize(ROLLUP_FORMAT)
+    buf = bytearray(size * (ZONE_CHANNELS + FLOAT_CHANNELS))
+    n = 0
+    for kind, (counts, totals) in acc.items():
+        for i in range(len(counts)):
+            if counts[i] or totals[i]:
+                struct.pack_into(
+                    ROLLUP_FORMAT,
+                    buf,
+                    n * size,
+                    period_start,
+                    kind,
+                    i + 1,
+                    min(counts[i], 0xFFFF),
+                    totals[i],
+                )
+                n += 1
+                counts[i] = 0
+                totals[i] = 0
+    if period_start >= MIN_VALID_TIME:
+        try:
+            ring.append(buf, n)
+        except Exception as e:
+            log.error("Error writing history rollup: %s", e)
+
+
+def _close_hour(boundary: int) -> None:
+    """Charges open sessions and low levels up to the boundary, then rolls the hour up."""
+    global _open_counted_from
+    if _open_zone is not None:
+        _hour[KIND_ZONE][1][_open_zone] += max(0, boundary - _open_counted_from)
+        _open_counted_from = boundary
+    for i in range(FLOAT_CHANNELS):
+        if _float_level[i] == 0:
+            _hour[KIND_FLOAT][1][i] += max(0, boundary - _float_low_since[i])
+            _float_low_since[i] = boundary
+
+    for kind, (counts, totals) in _hour.items():
+        day_counts, day_totals = _day[kind]
+        for i in range(len(counts)):
+            day_counts[i] += counts[i]
+            day_totals[i] += totals[i]
+    _write_rollups(hourly, boundary - 3600, _hour)
+
+
+def tick() -> None:
+    """Closes elapsed hours and days and flushes the raw batch when it is due."""
+    global _hour_start, _day_start
+    if raw is None:
+        return
+    now = now_unix()
+    if now < _hour_start or now - _hour_start > 2 * 86400:
+        # Clock jumped (e.g. first NTP sync): realign instead of writing empty periods
+        _hour_start = now - now % 3600
+        _day_start = now - now % 86400
+    while now >= _hour_start + 3600:
+        _hour_start += 3600
+        _close_hour(_hour_start)
+        if _hour_start >= _day_start + 86400:
+            _write_rollups(daily, _day_start, _day)
+            _day_start += 86400
+    if _batch_count and time.time() - _batch_since >= FLUSH_INTERVAL:
+        flush()
+
+
+def query(resolution: str, start: int, end: int, page: int, page_size: int) -> tuple:
+    """Returns (records, more) for one page of a time-range query."""
+    ring = {"raw": raw, "hour": hourly, "day": daily}.get(resolution)
+    if ring is None:
+        return [], False
+    if resolution == "raw":
+        flush()
+    records = []
+    more = ring.scan(start, end, page * page_size, page_size, records.append)
+    return records, more
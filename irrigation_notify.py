@@ -0,0 +1,236 @@
+import json
+
+from utils import log, metrics
+from utils.timezone import now_unix_ms
+
+ENCODING_FILE = "/encoding.json"
+
+# Several controllers can share a broker: each takes DEVICE_ID from secrets.py and
+# listens and reports under its own prefix. Without one the device keeps the
+# original single-controller topics, and has no broadcast or discovery topics.
+try:
+    from secrets import DEVICE_ID
+except ImportError:
+    DEVICE_ID = ""
+
+COMMAND_BASE = b"api/irrigation"
+NOTIFY_BASE = b"api/notification/irrigation"
+# Fleet-wide commands; every namespaced device subscribes to BROADCAST/+
+BROADCAST = COMMAND_BASE + b"/all"
+# Retained announcements, one per device: DISCOVERY/<device id>
+DISCOVERY_BASE = NOTIFY_BASE + b"/devices"
+RESERVED_IDS = ("all", "devices")
+
+COMMANDS = {
+    "ZONE": b"/zone",
+    "PROGRAM_CREATE": b"/program/create",
+    "PROGRAM_EDIT": b"/program/edit",
+    "PROGRAM_DELETE": b"/program/delete",
+    "PROGRAM_LIST": b"/program/list",
+    "PROGRAM_UPCOMING": b"/program/upcoming",
+    "PROGRAM_CONTROL": b"/program/control",
+    "PROGRAM_IMPORT": b"/program/import",
+    "GET_STATUS": b"/status",
+    "ENCODING": b"/encoding",
+    "HISTORY": b"/history",
+    "METRICS": b"/metrics",
+    "LOG": b"/log",
+    "RUNTIME": b"/runtime",
+    "DISCOVER": b"/discover",
+}
+
+# Commands also accepted on BROADCAST: read-only ones. Anything that moves a valve,
+# edits programs or changes saved settings (encodings, log level) names the device
+BROADCAST_COMMANDS = ("GET_STATUS", "METRICS", "DISCOVER")
+
+NOTIFICATIONS = {
+    "ZONE": b"/zone",
+    "PROGRAM": b"/program",
+    "PROGRAM_LIST": b"/program/list",
+    "PROGRAM_CHANGE": b"/program/change",
+    "PROGRAM_UPCOMING": b"/program/upcoming",
+    "PROGRAM_CONTROL": b"/program/control",
+    "STATUS": b"/status",
+    "FLOAT": b"/float",
+    "HISTORY": b"/history",
+    "METRICS": b"/metrics",
+    "LOG": b"/log",
+    "RUNTIME": b"/runtime",
+}
+
+
+def _valid_device_id(device_id: str) -> bool:
+    if not device_id or device_id in RESERVED_IDS:
+        return False
+    for c in "/+#":
+        if c in device_id:
+            return False
+    return True
+
+
+if DEVICE_ID and not _valid_device_id(DEVICE_ID):
+    log.error("Invalid DEVICE_ID '%s', using the shared topics", DEVICE_ID)
+    DEVICE_ID = ""
+
+if DEVICE_ID:
+    _device = b"/" + DEVICE_ID.encode()
+    COMMAND_PREFIX = COMMAND_BASE + _device
+    NOTIFY_PREFIX = NOTIFY_BASE + _device
+    DISCOVERY = DISCOVERY_BASE + _device
+else:
+    COMMAND_PREFIX = COMMAND_BASE
+    NOTIFY_PREFIX = NOTIFY_BASE
+    DISCOVERY = None
+
+TOPICS = {name: COMMAND_PREFIX + suffix for name, suffix in COMMANDS.items()}
+NOTIFY = {name: NOTIFY_PREFIX + suffix for name, suffix in NOTIFICATIONS.items()}
+
+# Broadcast topic -> the device topic it stands for
+BROADCAST_TOPICS = {}
+if DEVICE_ID:
+    for _name in BROADCAST_COMMANDS:
+        BROADCAST_TOPICS[BROADCAST + COMMANDS[_name]] = TOPICS[_name]
+
+TOPIC_NAMES = {topic: name for name, topic in TOPICS.items()}
+
+# Subscribed after connecting, one per loop: a wildcard each when namespaced
+if DEVICE_ID:
+    SUBSCRIPTIONS = (COMMAND_PREFIX + b"/#", BROADCAST + b"/+")
+else:
+    SUBSCRIPTIONS = tuple(t for name, t in TOPICS.items() if name != "DISCOVER")
+
+# The connected MQTTClient, None while offline; set by main
+client = None
+
+# Per-topic payload encoding for notifications {NOTIFY key: "cbor"}; default JSON
+notify_encodings = {}
+
+# Notification body. "text": the legacy {"data": "<Italian sentence>"} that
+# existing dashboards show as is; the default, and the only mode that loads the
+# message catalogs. "code": {"code": "zone.activated", "params": {...}}, rendered
+# and translated by the client, for clients that opt in.
+MESSAGE_MODES = ("code", "text")
+message_mode = "text"
+
+# Params sent in seconds that the legacy texts show in minutes
+MINUTE_PARAMS = ("duration", "remaining")
+
+
+def encode_payload(payload: dict, encoding: str = "json") -> bytes:
+    t0 = metrics.start()
+    if encoding == "cbor":
+        # Only loaded once a client asks for CBOR
+        from utils import compact
+
+        out = compact.encode(payload)
+    else:
+        out = json.dumps(payload).encode("utf-8")
+    metrics.record("encode", t0)
+    return out
+
+
+def topic_encoding(topic: bytes) -> str:
+    for name, encoding in notify_encodings.items():
+        if NOTIFY.get(name) == topic:
+            return encoding
+    return "json"
+
+
+def publish(topic: bytes, payload: dict, encoding: str = None) -> None:
+    """Encodes and publishes; dropped while offline. Socket errors propagate."""
+    if client is None:
+        return
+    client.publish(topic, encode_payload(payload, encoding or topic_encoding(topic)))
+
+
+def render(code: str, params: dict) -> str:
+    """Legacy text for 'code', e.g. "zone.activated" from MESSAGES["zone"]["activated"]."""
+    from utils.messages import DEFAULT_USER, MESSAGES
+
+    group, key = code.split(".", 1)
+    templates = MESSAGES.get(group)
+    if templates is None or key not in templates:
+        # Texts of the lazily loaded handlers, which are the ones sending these codes
+        from handlers.messages import MESSAGES
+
+        templates = MESSAGES.get(group, {})
+    template = templates.get(key)
+    if template is None:
+        return code
+    args = {}
+    for name, value in params.items():
+        if name in MINUTE_PARAMS and value is not None:
+            value = round(value / 60, 1)
+        args[name] = value
+    if args.get("user") is None:
+        args["user"] = DEFAULT_USER
+    text = template.format(**args)
+    for error in params.get("errors", ()):
+        text += "\n" + render(
+            "program.import_rejected",
+            {
+                "index": error["index"],
+                "name": error["name"] or "?",
+                "error": render(error["code"], error.get("params", {})),
+            },
+        )
+    return text
+
+
+def send_notification(topic, code: str, success: bool = True, **params) -> None:
+    """Publishes event 'code' with its params, or its legacy text in "text" mode."""
+    if client is None:
+        # Offline: the history and the next status request carry the state
+        return
+    try:
+        if isinstance(topic, str):
+            topic = topic.encode()
+        payload = {
+            "status": "success" if success else "error",
+            "timestamp": now_unix_ms(),
+        }
+        if message_mode == "text":
+            payload["data"] = render(code, params)
+        else:
+            payload["code"] = code
+            if params:
+                payload["params"] = params
+        publish(topic, payload)
+    except Exception as e:
+        log.error("Error sending notification on %s: %s", topic, e)
+
+
+def parse_payload(msg: bytes) -> dict:
+    t0 = metrics.start()
+    try:
+        return json.loads(msg)
+    except Exception as e:
+        log.error("Error parsing payload: %s", e)
+        return {}
+    finally:
+        metrics.record("parse", t0)
+
+
+def load_notify_encodings() -> None:
+    """Restores the per-topic encodings and the message mode saved in ENCODING_FILE."""
+    global message_mode
+    try:
+        with open(ENCODING_FILE, "r") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return
+    mode = saved.pop("messages", "text")
+    if mode in MESSAGE_MODES:
+        message_mode = mode
+    notify_encodings.update(saved)
+
+
+def save_notify_encodings() -> None:
+    saved = dict(notify_encodings)
+    if message_mode != "text":
+        saved["messages"] = message_mode
+    try:
+        with open(ENCODING_FILE, "w") as f:
+            json.dump(saved, f)
+    except Exception as e:
+        log.error("Error saving encodings: %s", e)
@@ -1,23 +1,53 @@
 import json
+import os
+
+from utils import log
 
 PROGRAMS_FILE = "/programs.json"
 
+# Store revision, saved with the programs and raised by one for every program
+# created, edited or deleted; program change events and the list carry it
+revision = 0
+
 
 def _load_data() -> dict:
+    global revision
     try:
         with open(PROGRAMS_FILE, "r") as f:
-            return json.load(f)
+            data = json.load(f)
     except (OSError, ValueError):
-        return {"next_id": 1, "programs": []}
+        data = {"next_id": 1, "programs": []}
+    revision = data.get("rev", 0)
+    return data
+
+
+def _bump(data: dict) -> int:
+    data["rev"] = data.get("rev", 0) + 1
+    return data["rev"]
 
 
 def _save_data(data: dict) -> None:
+    global revision
     try:
         with open(PROGRAMS_FILE, "w") as f:
             json.dump(data, f)
     except Exception as e:
-        print(f"Error saving programs: {e}")
+        log.error("Error saving programs: %s", e)
         raise
+    revision = data.get("rev", 0)
+
+
+def get_store_size() -> int:
+    """Size in bytes of the program file (0 if missing)."""
+    try:
+        return os.stat(PROGRAMS_FILE)[6]
+    except OSError:
+        return 0
+
+
+def get_store_data() -> dict:
+    """The whole store: {"next_id", "programs", "rev"}."""
+    return _load_data()
 
 
 def get_all_programs() -> list:
@@ -38,15 +68,36 @@ def create_program(program_data: dict) -> dict:
     program.update(program_data)
     data["programs"].append(program)
     data["next_id"] = new_id + 1
+    _bump(data)
     _save_data(data)
     return program
 
 
+def create_programs(programs_data: list) -> list:
+    """
+    Creates several programs with a single write to flash. Each one takes its own
+    revision, in order: the last one created is at 'revision'.
+    """
+    data = _load_data()
+    created = []
+    for program_data in programs_data:
+        program = {"id": data["next_id"], "is_active": True}
+        program.update(program_data)
+        data["programs"].append(program)
+        data["next_id"] += 1
+        _bump(data)
+        created.append(program)
+    if created:
+        _save_data(data)
+    return created
+
+
 def edit_program(program_id: int, updates: dict) -> dict:
     data = _load_data()
     for i, prog in enumerate(data["programs"]):
         if prog["id"] == program_id:
             data["programs"][i].update(updates)
+            _bump(data)
             _save_data(data)
             return data["programs"][i]
     return None
@@ -57,41 +108,7 @@ def delete_program(program_id: int) -> bool:
     original_len = len(data["programs"])
     data["programs"] = [p for p in data["programs"] if p["id"] != program_id]
     if len(data["programs"]) < original_len:
+        _bump(data)
         _save_data(data)
         return True
     return False
-
-
-def check_conflict(program_data: dict, exclude_id: int = None) -> tuple:
-    """
-    Check if program_data overlaps with any existing active program.
-    Returns (has_conflict: bool, conflicting_name: str | None).
-    Conflict = same day AND overlapping time window (start_time + duration).
-    """
-    programs = get_all_programs()
-    new_start = _time_to_seconds(program_data["start_time"])
-    new_end = new_start + program_data["duration"]
-    new_days = set(program_data["active_days"])
-
-    for prog in programs:
-        if prog["id"] == exclude_id:
-            continue
-        if not prog.get("is_active", True):
-            continue
-
-        shared_days = new_days.intersection(set(prog["active_days"]))
-        if not shared_days:
-            continue
-
-        existing_start = _time_to_seconds(prog["start_time"])
-        existing_end = existing_start + prog["duration"]
-
-        if new_start < existing_end and new_end > existing_start:
-            return True, prog.get("name", "sconosciuto")
-
-    return False, None
-
-
-def _time_to_seconds(time_str: str) -> int:
-    h, m = map(int, time_str.split(":"))
-    return h * 3600 + m * 60
@@ -0,0 +1,99 @@
+import sys
+import time
+
+import irrigation_controller as ctrl
+from irrigation_programs import get_program_by_id
+from irrigation_scheduler import (
+    check_and_run_programs,
+    held_programs,
+    program_last_started,
+    resume_interlock_paused,
+)
+from utils import log
+
+# Reset recovery, only needed once per boot: main imports it when irrigation_state
+# holds a snapshot, and resume() drops it from sys.modules once the state is back.
+
+
+def _window_open(paused: dict, now: float) -> bool:
+    return bool(paused) and paused["window_end"] > now
+
+
+def _restore_guard(saved: dict) -> None:
+    for program_id, started in saved.get("started", {}).items():
+        program_id = int(program_id)
+        if started > program_last_started.get(program_id, 0):
+            program_last_started[program_id] = started
+
+
+def _saved_windows(saved: dict) -> list:
+    """(program id, window end) of what a saved state was running or had paused."""
+    out = []
+    if saved.get("zone") and not saved.get("manual") and saved.get("end"):
+        if saved.get("pid") is not None:
+            out.append((saved["pid"], saved["end"]))
+    for key in ("paused", "user_paused"):
+        paused = saved.get(key)
+        if paused:
+            out.append((paused["id"], paused["window_end"]))
+    return out
+
+
+def hold(saved: dict) -> None:
+    """
+    Keeps the scheduler from starting again what a saved state was running or had
+    paused, while the state waits for NTP: its double-start guard applies at once,
+    and those programs are held until their saved window ends on the restored clock.
+    """
+    _restore_guard(saved)
+    for program_id, end in _saved_windows(saved):
+        held_programs[program_id] = end
+
+
+def resume(saved: dict) -> None:
+    """
+    Restores what irrigation_state saved before a reset, on a clock that can be
+    trusted: the double-start guard, paused programs whose window is still open,
+    and the running zone, which resumes until its original end. Interrupted auto
+    programs go through try_resume_paused_program(). Newer state is never
+    overwritten.
+    """
+    now = time.time()
+    for program_id, _ in _saved_windows(saved):
+        held_programs.pop(program_id, None)
+    _restore_guard(saved)
+
+    if ctrl.user_paused_program is None and _window_open(saved.get("user_paused"), now):
+        ctrl.user_paused_program = saved["user_paused"]
+    if ctrl.paused_program is None and _window_open(saved.get("paused"), now):
+        ctrl.paused_program = saved["paused"]
+
+    zone = saved.get("zone")
+    remaining = int(saved["end"] - now) if zone and saved.get("end") else 0
+    if zone in ctrl.VALID_ZONES and remaining > 0 and ctrl.active_zone is None:
+        if saved.get("manual"):
+            ctrl.interlock_paused = {"zone": zone, "remaining": remaining}
+        elif ctrl.paused_program is None:
+            program_id = saved.get("pid")
+            prog = get_program_by_id(program_id)
+            if prog and prog.get("is_active", True):
+                ctrl.paused_program = {
+                    "id": program_id,
+                    "zone": zone,
+                    "window_end": saved["end"],
+                }
+    elif ctrl.interlock_paused is None and saved.get("interlock"):
+        ctrl.interlock_paused = saved["interlock"]
+
+    log.info(
+        "State restored: zone %s, %ss left, paused %s, user paused %s",
+        zone,
+        remaining,
+        ctrl.paused_program and ctrl.paused_program["id"],
+        ctrl.user_paused_program and ctrl.user_paused_program["id"],
+    )
+    # A manual zone resumes like after the interlock; with water low it waits
+    if ctrl.interlock_paused and not ctrl.water_low:
+        resume_interlock_paused("zone.reset_resumed")
+    check_and_run_programs()
+    sys.modules.pop(__name__, None)
@@ -0,0 +1,208 @@
+import json
+import os
+import time
+
+from utils import log
+from utils.timezone import now_unix
+
+# Closed days, one JSON object per line, oldest first
+RUNTIME_FILE = "/runtime.jsonl"
+# Counters of the current day, rewritten every FLUSH_INTERVAL while they change
+TODAY_FILE = "/runtime_today.json"
+RETENTION_DAYS = 120
+FLUSH_INTERVAL = 900
+MIN_VALID_TIME = 1700000000  # anything earlier means the clock is not set yet
+
+# Actual open seconds for the current local day: per zone, per program id (as str,
+# to match the JSON file) and per zone for manual runs only
+_day = 0
+_zones = {}
+_programs = {}
+_manual = {}
+_dirty = False
+_last_flush = 0
+
+# Zone currently open: [zone, program_id, was_manual, counted_until]
+_open = None
+
+
+def _day_start(t: int) -> int:
+    return t - t % 86400
+
+
+def _record() -> dict:
+    return {
+        "day": _day,
+        "zones": _zones,
+        "programs": _programs,
+        "manual": _manual,
+    }
+
+
+def _reset(day: int) -> None:
+    global _day, _zones, _programs, _manual, _dirty
+    _day = day
+    _zones = {}
+    _programs = {}
+    _manual = {}
+    _dirty = False
+
+
+def start() -> None:
+    """Restores today's counters; a leftover file from an earlier day is archived."""
+    _reset(_day_start(now_unix()))
+    try:
+        with open(TODAY_FILE, "r") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return
+    if saved.get("day") == _day:
+        _zones.update(saved.get("zones", {}))
+        _programs.update(saved.get("programs", {}))
+        _manual.update(saved.get("manual", {}))
+    elif saved.get("day", 0) >= MIN_VALID_TIME - 86400:
+        _archive(saved)
+
+
+def _add(counters: dict, key: str, seconds: int) -> None:
+    counters[key] = counters.get(key, 0) + seconds
+
+
+def _charge_open(until: int) -> None:
+    """Charges the open zone up to 'until' to the current day."""
+    global _dirty
+    zone, program_id, was_manual, since = _open
+    seconds = until - since
+    _open[3] = until
+    if seconds <= 0 or since < MIN_VALID_TIME:
+        return
+    _add(_zones, zone, seconds)
+    if was_manual:
+        _add(_manual, zone, seconds)
+    if program_id is not None:
+        _add(_programs, str(program_id), seconds)
+    _dirty = True
+
+
+def on_zone_transition(
+    event: str, zone: str, program_id: int, was_manual: bool
+) -> None:
+    """Controller transition listener: accumulates real open time."""
+    global _open
+    now = now_unix()
+    if event == "on":
+        _open = [zone, program_id, was_manual, now]
+        return
+    if _open is not None:
+        _roll_days(now)
+        _charge_open(now)
+        _open = None
+
+
+def shift_clock(step: int) -> None:
+    """The clock was stepped: the open zone keeps the time it has been open."""
+    if _open is not None:
+        _open[3] += step
+
+
+def _archive(record: dict) -> None:
+    if not (record["zones"] or record["programs"]):
+        return
+    try:
+        with open(RUNTIME_FILE, "a") as f:
+            f.write(json.dumps(record))
+            f.write("\n")
+        _prune()
+    except OSError as e:
+        log.error("Error archiving runtime: %s", e)
+
+
+def _prune() -> None:
+    """Drops the oldest days beyond RETENTION_DAYS, streaming line by line."""
+    with open(RUNTIME_FILE, "r") as f:
+        lines = sum(1 for _ in f)
+    excess = lines - RETENTION_DAYS
+    if excess <= 0:
+        return
+    tmp = RUNTIME_FILE + ".tmp"
+    with open(RUNTIME_FILE, "r") as src, open(tmp, "w") as dst:
+        for i, line in enumerate(src):
+            if i >= excess:
+                dst.write(line)
+    os.remove(RUNTIME_FILE)
+    os.rename(tmp, RUNTIME_FILE)
+
+
+def _roll_days(now: int) -> None:
+    """Closes every day boundary crossed since the last call."""
+    global _dirty
+    if now < _day or now - _day > 2 * 86400:
+        # Clock jumped (e.g. first NTP sync): keep what was counted, restart on the new day
+        if _open is not None:
+            _open[3] = now
+        _archive(_record())
+        _reset(_day_start(now))
+    elif now >= _day + 86400:
+        while now >= _day + 86400:
+            boundary = _day + 86400
+            if _open is not None:
+                _charge_open(boundary)
+            _archive(_record())
+            _reset(boundary)
+    else:
+        return
+    # Overwrite the archived day right away so a reset cannot archive it twice
+    _dirty = True
+    flush()
+
+
+def flush() -> None:
+    global _dirty, _last_flush
+    _last_flush = time.time()
+    if not _dirty:
+        return
+    try:
+        with open(TODAY_FILE, "w") as f:
+            json.dump(_record(), f)
+        _dirty = False
+    except OSError as e:
+        log.error("Error saving runtime: %s", e)
+
+
+def tick() -> None:
+    """Rolls the day over when due and persists today's counters in batches."""
+    if _day == 0:
+        return
+    _roll_days(now_unix())
+    if _dirty and time.time() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def query(start: int, end: int, limit: int) -> tuple:
+    """
+    Returns (days, more): up to 'limit' daily records with start <= day < end,
+    oldest first. Today's record includes the zone that is open right now.
+    """
+    days = []
+    more = False
+    try:
+        with open(RUNTIME_FILE, "r") as f:
+            for line in f:
+                record = json.loads(line)
+                if not start <= record["day"] < end:
+                    continue
+                if len(days) >= limit:
+                    more = True
+                    break
+                days.append(record)
+    except (OSError, ValueError):
+        pass
+
+    if not more and start <= _day < end:
+        if len(days) >= limit:
+            more = True
+        else:
+            if _open is not None:
+                _charge_open(now_unix())
+            days.append(_record())
+    return days, more
@@ -0,0 +1,358 @@
+import time
+
+import irrigation_controller as ctrl
+import irrigation_history as history
+import irrigation_runtime as runtime
+from irrigation_notify import NOTIFY, publish, send_notification
+from irrigation_programs import get_all_programs, get_program_by_id
+from utils import log, timezone, trace
+from utils.timezone import local_time, now_unix_ms
+
+# Tracks when each program was last started to prevent double-triggers {program_id: time.time()}
+program_last_started = {}
+# Programs the scheduler does not start before a time.time() deadline, {id: until}:
+# those of a flash-restored state still waiting for NTP, left to irrigation_restore
+# rather than started again on the restored clock, and holds sent on program/control
+held_programs = {}
+
+
+def time_str_to_seconds(time_str: str) -> int:
+    h, m = map(int, time_str.split(":"))
+    return h * 3600 + m * 60
+
+
+def cap_to_next_program(
+    duration: int, current_seconds: int, exclude_id: int, programs: list
+) -> int:
+    """
+    Truncates 'duration' so the resumed program does not overlap the next scheduled program.
+    Checks both today and tomorrow (in case the window extends past midnight).
+    Returns the (possibly reduced) duration in seconds.
+    """
+    local_t = local_time()
+    current_weekday = local_t[6]
+    next_weekday = (current_weekday + 1) % 7
+    end_seconds = current_seconds + duration
+
+    for prog in programs:
+        if prog["id"] == exclude_id:
+            continue
+        if not prog.get("is_active", True):
+            continue
+        start_s = time_str_to_seconds(prog["start_time"])
+        # Check today
+        if current_weekday in prog["active_days"]:
+            if current_seconds < start_s < end_seconds:
+                end_seconds = start_s
+        # Check tomorrow if the window extends past midnight
+        if end_seconds > 86400 and next_weekday in prog["active_days"]:
+            start_s_tomorrow = start_s + 86400
+            if current_seconds < start_s_tomorrow < end_seconds:
+                end_seconds = start_s_tomorrow
+
+    return end_seconds - current_seconds
+
+
+def try_resume_paused_program(programs: list = None) -> None:
+    """
+    Resumes an auto-paused program (interrupted by a manual zone).
+    Truncates its duration if another program is scheduled before its natural end.
+    Discards it silently if the original time window has already expired.
+    """
+    if not ctrl.paused_program:
+        return
+
+    paused = ctrl.paused_program
+    ctrl.paused_program = None
+
+    actual_remaining = int(paused["window_end"] - time.time())
+    if actual_remaining <= 0:
+        log.warning("Paused program %s window expired, discarding", paused["id"])
+        trace.decision("discard_expired", paused["id"])
+        return
+
+    if programs is None:
+        programs = get_all_programs()
+
+    local_t = local_time()
+    current_seconds = local_t[3] * 3600 + local_t[4] * 60
+
+    capped = cap_to_next_program(
+        actual_remaining, current_seconds, paused["id"], programs
+    )
+
+    if capped <= 0:
+        log.warning(
+            "Paused program %s has no room before next scheduled program, discarding",
+            paused["id"],
+        )
+        trace.decision("discard_no_room", paused["id"])
+        return
+
+    trace.decision("resume", paused["id"], capped)
+    ctrl.activate_zone(paused["zone"], capped, is_manual=False, program_id=paused["id"])
+    send_notification(
+        NOTIFY["ZONE"],
+        "zone.auto_resumed",
+        zone=paused["zone"],
+        program=paused["id"],
+        duration=capped,
+    )
+
+
+def start_auto_program(prog: dict, duration: int = None) -> None:
+    """Starts an auto program. 'duration' supports late-start (partial window)."""
+    actual_duration = duration if duration is not None else prog["duration"]
+    program_last_started[prog["id"]] = time.time()
+    trace.decision("start", prog["id"], actual_duration)
+    ctrl.activate_zone(
+        prog["zone"], actual_duration, is_manual=False, program_id=prog["id"]
+    )
+    send_notification(
+        NOTIFY["ZONE"],
+        "zone.auto_activated",
+        zone=prog["zone"],
+        program=prog["id"],
+        duration=actual_duration,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Zone timeout
+# ---------------------------------------------------------------------------
+
+
+def check_zone_timeout() -> None:
+    if not ctrl.is_zone_timeout():
+        return
+
+    zone_name = ctrl.active_zone
+    was_manual = ctrl.manual_override
+    program_id = ctrl.active_program_id
+    trace.decision("timeout", program_id)
+    ctrl.deactivate_active_zone()
+
+    if was_manual:
+        send_notification(NOTIFY["ZONE"], "zone.timeout_deactivated", zone=zone_name)
+    else:
+        send_notification(
+            NOTIFY["ZONE"], "zone.auto_deactivated", zone=zone_name, program=program_id
+        )
+
+    # Trigger immediately without waiting for the next 10s tick
+    check_and_run_programs()
+
+
+# ---------------------------------------------------------------------------
+# Auto program scheduler
+# ---------------------------------------------------------------------------
+
+
+def check_and_run_programs() -> None:
+    """
+    Checks whether an auto program should start now.
+
+    Priority:
+    1. A scheduled program whose time window is active (start <= now < start+duration):
+       starts for the remaining window time (late-start), discarding any auto-paused program.
+    2. An auto-paused program (no scheduled program currently due):
+       resumes for its remaining window time, capped at the next scheduled program start.
+
+    The auto-paused and user-paused programs are excluded from the scheduler loop
+    to avoid being picked up as a fresh start.
+    Nothing starts while the low-water interlock is engaged or the clock is unknown.
+    """
+    if ctrl.manual_override or ctrl.water_low:
+        return
+
+    if ctrl.active_zone is not None or not timezone.time_valid():
+        return
+
+    programs = get_all_programs()
+    local_t = local_time()
+    current_weekday = local_t[6]  # 0=Mon, 6=Sun
+    current_seconds = local_t[3] * 3600 + local_t[4] * 60
+
+    paused_id = ctrl.paused_program["id"] if ctrl.paused_program else None
+    user_paused_id = (
+        ctrl.user_paused_program["id"] if ctrl.user_paused_program else None
+    )
+
+    # Discard expired user-paused program
+    if (
+        ctrl.user_paused_program
+        and time.time() >= ctrl.user_paused_program["window_end"]
+    ):
+        log.warning("User-paused program %s window expired, discarding", user_paused_id)
+        ctrl.user_paused_program = None
+        user_paused_id = None
+
+    # Find a scheduled program whose time window is currently active
+    due_program = None
+    due_remaining = None
+    for prog in programs:
+        if not prog.get("is_active", True):
+            continue
+        # Skip auto-paused program — handled by try_resume_paused_program
+        if prog["id"] == paused_id:
+            continue
+        # Skip user-paused program — only the user can resume it explicitly
+        if prog["id"] == user_paused_id:
+            continue
+        if time.time() - program_last_started.get(prog["id"], 0) < 70:
+            continue
+        if time.time() < held_programs.get(prog["id"], 0):
+            continue
+        if current_weekday not in prog["active_days"]:
+            continue
+        start_s = time_str_to_seconds(prog["start_time"])
+        end_s = start_s + prog["duration"]
+        if start_s <= current_seconds < end_s:
+            due_program = prog
+            due_remaining = end_s - current_seconds  # late start: remaining window time
+            break
+
+    if due_program:
+        # Scheduled program takes priority — discard any auto-paused program
+        if ctrl.paused_program:
+            log.info(
+                "Paused program %s discarded: '%s' is due",
+                ctrl.paused_program["id"],
+                due_program["name"],
+            )
+            trace.decision("discard_due", ctrl.paused_program["id"])
+            ctrl.paused_program = None
+        start_auto_program(due_program, due_remaining)
+
+    elif ctrl.paused_program:
+        try_resume_paused_program(programs)
+
+
+# ---------------------------------------------------------------------------
+# Clock steps
+# ---------------------------------------------------------------------------
+
+
+def realign_after_clock_step(step: int, was_synced: bool) -> None:
+    """
+    The clock moved by 'step' seconds. Deadlines taken on the old clock keep their
+    remaining time; a program started on a restored clock is checked against its
+    window on the new one, and the scheduler runs right away.
+    """
+    log.warning("Clock stepped by %ss, realigning the schedule", step)
+    if ctrl.zone_end_time is not None:
+        ctrl.zone_end_time += step
+    for paused in (ctrl.paused_program, ctrl.user_paused_program):
+        if paused:
+            paused["window_end"] += step
+    for program_id in program_last_started:
+        program_last_started[program_id] += step
+    for program_id in held_programs:
+        held_programs[program_id] += step
+    history.shift_clock(step)
+    runtime.shift_clock(step)
+
+    if not was_synced and ctrl.active_program_id is not None:
+        _realign_active_program()
+    check_and_run_programs()
+
+
+def _realign_active_program() -> None:
+    """Stops the running program, or shortens it, to its window on the corrected clock."""
+    program_id = ctrl.active_program_id
+    prog = get_program_by_id(program_id)
+    local_t = local_time()
+    current_seconds = local_t[3] * 3600 + local_t[4] * 60 + local_t[5]
+    remaining = 0
+    if prog and local_t[6] in prog["active_days"]:
+        start_s = time_str_to_seconds(prog["start_time"])
+        if start_s <= current_seconds < start_s + prog["duration"]:
+            remaining = start_s + prog["duration"] - current_seconds
+
+    if remaining <= 0:
+        zone_name = ctrl.active_zone
+        trace.decision("realign_stop", program_id)
+        ctrl.deactivate_active_zone()
+        send_notification(
+            NOTIFY["ZONE"], "zone.auto_deactivated", zone=zone_name, program=program_id
+        )
+    elif time.time() + remaining < ctrl.zone_end_time:
+        trace.decision("realign", program_id, remaining)
+        ctrl.zone_end_time = time.time() + remaining
+
+
+# ---------------------------------------------------------------------------
+# Float switches and low-water interlock
+# ---------------------------------------------------------------------------
+
+
+def check_float_switches() -> None:
+    """Publishes debounced level changes and engages/releases the interlock."""
+    changes = ctrl.poll_float_switches()
+    if not changes:
+        return
+
+    levels = ctrl.get_float_switches()
+    for switch, level in changes:
+        trace.float_change(switch, level)
+        history.record_float(switch, level)
+        payload = {
+            "switch": switch,
+            "level": level,
+            "float_switches": levels,
+            "timestamp": now_unix_ms(),
+        }
+        try:
+            publish(NOTIFY["FLOAT"], payload)
+        except Exception as e:
+            log.error("Error sending float switch event: %s", e)
+
+    low = ctrl.is_level_low()
+    if low and not ctrl.water_low:
+        _engage_interlock()
+    elif not low and ctrl.water_low:
+        _release_interlock()
+
+
+def _engage_interlock() -> None:
+    """Stops the active zone; auto programs resume like after a manual override."""
+    ctrl.water_low = True
+    zone = ctrl.active_zone
+    if zone is None:
+        send_notification(NOTIFY["ZONE"], "float.low_idle", False)
+        return
+
+    if ctrl.manual_override:
+        ctrl.interlock_paused = {
+            "zone": zone,
+            "remaining": ctrl.get_remaining_seconds(),
+        }
+    else:
+        ctrl.paused_program = {
+            "id": ctrl.active_program_id,
+            "zone": zone,
+            "window_end": ctrl.zone_end_time,
+        }
+    ctrl.deactivate_active_zone()
+    send_notification(NOTIFY["ZONE"], "float.low_paused", False, zone=zone)
+
+
+def _release_interlock() -> None:
+    ctrl.water_low = False
+    send_notification(NOTIFY["ZONE"], "float.restored")
+
+    if not resume_interlock_paused("float.resumed"):
+        check_and_run_programs()
+
+
+def resume_interlock_paused(code: str) -> bool:
+    """Restarts the manual zone held in interlock_paused for its remaining time."""
+    paused = ctrl.interlock_paused
+    ctrl.interlock_paused = None
+    if not paused or paused["remaining"] <= 0 or ctrl.active_zone is not None:
+        return False
+    ctrl.activate_zone(paused["zone"], paused["remaining"], is_manual=True)
+    send_notification(
+        NOTIFY["ZONE"], code, zone=paused["zone"], duration=paused["remaining"]
+    )
+    return True
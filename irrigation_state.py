@@ -0,0 +1,142 @@
+import json
+import time
+
+import machine
+
+import irrigation_controller as ctrl
+from irrigation_scheduler import program_last_started
+from utils import log
+
+# Snapshot of the controller state, restored after a reset by irrigation_restore.
+# RTC memory survives resets and watchdog reboots and is written on every change;
+# the flash copy survives power loss and is written at most every FLASH_INTERVAL
+# to spare the flash.
+STATE_FILE = "/state.json"
+VERSION = 1
+FLASH_INTERVAL = 30000
+# Double-start guard entries older than this are not worth keeping
+GUARD_KEEP = 3600
+
+# Copies of what was last saved: [zone, end, program id, manual, paused,
+# user paused, interlock paused, guard entries]
+_last = None
+_flash_pending = False
+_flash_ms = 0
+
+
+def _copy(entry):
+    return dict(entry) if entry else None
+
+
+def changed() -> bool:
+    last = _last
+    return (
+        last is None
+        or ctrl.active_zone != last[0]
+        or ctrl.zone_end_time != last[1]
+        or ctrl.active_program_id != last[2]
+        or ctrl.manual_override != last[3]
+        or ctrl.paused_program != last[4]
+        or ctrl.user_paused_program != last[5]
+        or ctrl.interlock_paused != last[6]
+        or len(program_last_started) != last[7]
+    )
+
+
+def snapshot() -> dict:
+    now = time.time()
+    return {
+        "v": VERSION,
+        "t": now,
+        "zone": ctrl.active_zone,
+        "end": ctrl.zone_end_time,
+        "pid": ctrl.active_program_id,
+        "manual": ctrl.manual_override,
+        "paused": ctrl.paused_program,
+        "user_paused": ctrl.user_paused_program,
+        "interlock": ctrl.interlock_paused,
+        "started": {
+            str(pid): t
+            for pid, t in program_last_started.items()
+            if now - t < GUARD_KEEP
+        },
+    }
+
+
+def save() -> None:
+    """Writes the snapshot to RTC memory now and to flash within FLASH_INTERVAL."""
+    global _last, _flash_pending
+    _last = [
+        ctrl.active_zone,
+        ctrl.zone_end_time,
+        ctrl.active_program_id,
+        ctrl.manual_override,
+        _copy(ctrl.paused_program),
+        _copy(ctrl.user_paused_program),
+        _copy(ctrl.interlock_paused),
+        len(program_last_started),
+    ]
+    data = json.dumps(snapshot()).encode()
+    try:
+        machine.RTC().memory(data)
+    except (AttributeError, ValueError) as e:
+        # No RTC memory on this port, or the snapshot does not fit: flash only
+        log.warning("State not kept in RTC memory: %s", e)
+    _flash_pending = True
+
+
+def _write_flash(data: bytes) -> None:
+    try:
+        with open(STATE_FILE, "wb") as f:
+            f.write(data)
+    except OSError as e:
+        log.error("Error saving state: %s", e)
+
+
+def tick(ms_now: int) -> None:
+    """Saves on any change; flushes the flash copy once FLASH_INTERVAL has passed."""
+    global _flash_pending, _flash_ms
+    if changed():
+        save()
+    if _flash_pending and time.ticks_diff(ms_now, _flash_ms) >= FLASH_INTERVAL:
+        _flash_pending = False
+        _flash_ms = ms_now
+        _write_flash(json.dumps(snapshot()).encode())
+
+
+def flush() -> None:
+    global _flash_pending
+    if _flash_pending:
+        _flash_pending = False
+        _write_flash(json.dumps(snapshot()).encode())
+
+
+def _parse(data) -> dict:
+    try:
+        state = json.loads(data)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("v") != VERSION:
+        return None
+    return state
+
+
+def load() -> tuple:
+    """
+    Returns (snapshot, source) for the last saved state: "rtc" when RTC memory
+    survived the reset, "flash" after a power loss, (None, None) if neither holds one.
+    """
+    try:
+        state = _parse(machine.RTC().memory())
+    except AttributeError:
+        state = None
+    if state is not None:
+        return state, "rtc"
+    try:
+        with open(STATE_FILE, "r") as f:
+            state = _parse(f.read())
+    except OSError:
+        state = None
+    if state is not None:
+        return state, "flash"
+    return None, None
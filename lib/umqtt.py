@@ -1,8 +1,22 @@
+import gc
 import ssl
+import time
 
 import usocket as socket
 import ustruct as struct
 
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+# TLS contexts survive client re-creation, so a reconnect reuses the parsed CA.
+# MicroPython's ssl has no session objects: every connect is a full handshake.
+_tls_contexts = {}
+
+MAX_TOPIC_LEN = 128
+READ_CHUNK = 256
+
 
 class MQTTException(Exception):
     pass
@@ -18,16 +32,30 @@ class MQTTClient:
         password=None,
         keepalive=0,
         ssl=False,
+        ca_file=None,
+        max_msg_size=1024,
+        timeout=None,
     ):
         if port == 0:
             port = 8883 if ssl else 1883
         self.client_id = client_id
         self.sock = None
+        self._raw_sock = None
         self.server = server
         self.port = port
         self.ssl = ssl
+        self.ca_file = ca_file
+        self.tls_stats = None
         self.pid = 0
         self.cb = None
+        self.drop_cb = None
+        self.max_msg_size = max_msg_size
+        # Seconds a blocking socket call may wait; None waits forever
+        self.timeout = timeout
+        self.topic_limits = {}
+        self.stream_cbs = {}
+        self._rbuf = bytearray(READ_CHUNK)
+        self._rview = memoryview(self._rbuf)
         self.user = user
         self.pswd = password
         self.keepalive = keepalive
@@ -36,6 +64,23 @@ class MQTTClient:
         self.lw_qos = 0
         self.lw_retain = False
 
+    def _set_blocking(self):
+        if self.timeout is None:
+            self.sock.setblocking(True)
+        else:
+            # On the TCP socket: the TLS wrapper may not have settimeout()
+            self._raw_sock.settimeout(self.timeout)
+
+    def _deadline(self):
+        if self.timeout is None:
+            return None
+        return time.ticks_add(time.ticks_ms(), int(self.timeout * 1000))
+
+    def _check_deadline(self, deadline):
+        # Other traffic keeps wait_msg() returning: bound the wait for an ack too
+        if deadline is not None and time.ticks_diff(time.ticks_ms(), deadline) > 0:
+            raise MQTTException("ack timeout")
+
     def _send_str(self, s):
         self.sock.write(struct.pack("!H", len(s)))
         self.sock.write(s)
@@ -50,18 +95,106 @@ class MQTTClient:
                 return n
             sh += 7
 
+    def _tls_context(self):
+        key = (self.server, self.ca_file)
+        ctx = _tls_contexts.get(key)
+        if ctx is None:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            if self.ca_file:
+                with open(self.ca_file, "rb") as f:
+                    cadata = f.read()
+                if cadata.startswith(b"-----"):
+                    cadata = cadata.decode()
+                ctx.load_verify_locations(cadata=cadata)
+                ctx.verify_mode = ssl.CERT_REQUIRED
+            else:
+                if hasattr(ctx, "check_hostname"):
+                    ctx.check_hostname = False
+                ctx.verify_mode = ssl.CERT_NONE
+            _tls_contexts[key] = ctx
+        return ctx
+
+    def _idf_heap(self):
+        """Returns (free, lowest free since boot) of the IDF heap mbedTLS uses, or zeros."""
+        if esp32 is None:
+            return 0, 0
+        info = esp32.idf_heap_info(esp32.HEAP_DATA)
+        return sum(b[1] for b in info), sum(b[3] for b in info)
+
+    def _wrap_tls(self):
+        ctx = self._tls_context()
+        gc.collect()
+        free_before = gc.mem_free()
+        idf_before, low_before = self._idf_heap()
+        start = time.ticks_ms()
+        self.sock = ctx.wrap_socket(self.sock, server_hostname=self.server)
+        handshake_ms = time.ticks_diff(time.ticks_ms(), start)
+        free_after = gc.mem_free()
+        idf_after, low_after = self._idf_heap()
+        # The IDF low-water mark only moves when the handshake sets a new low:
+        # then it gives the peak there, otherwise the peak stays unknown (None)
+        peak = idf_before - low_after if low_after < low_before else None
+        self.tls_stats = {
+            "handshake_ms": handshake_ms,
+            "heap_bytes": free_before - free_after + idf_before - idf_after,
+            "peak_bytes": peak,
+            "free_after": free_after,
+        }
+
+    def _discard(self, sz):
+        while sz > 0:
+            n = self.sock.readinto(self._rbuf, min(sz, READ_CHUNK))
+            if not n:
+                raise OSError(-1)
+            sz -= n
+
+    def _stream(self, topic, sz, f):
+        offset = 0
+        while offset < sz:
+            n = self.sock.readinto(self._rbuf, min(sz - offset, READ_CHUNK))
+            if not n:
+                raise OSError(-1)
+            f(topic, self._rview[:n], offset, sz)
+            offset += n
+        if sz == 0:
+            f(topic, self._rview[:0], 0, 0)
+
     def set_callback(self, f):
         self.cb = f
 
+    def set_drop_callback(self, f):
+        """f(topic, size) is called when a message is discarded for exceeding its limit."""
+        self.drop_cb = f
+
+    def set_topic_limit(self, topic, max_size):
+        self.topic_limits[topic] = max_size
+
+    def set_stream_callback(self, topic, f, max_size):
+        """Delivers messages on topic in chunks as f(topic, chunk, offset, total).
+
+        chunk is a memoryview into a buffer reused for every read: consume it
+        before returning.
+        """
+        self.stream_cbs[topic] = f
+        self.topic_limits[topic] = max_size
+
     def set_last_will(self, topic, msg, retain=False, qos=0):
-        pass
+        """Published by the broker if the connection drops without a DISCONNECT."""
+        assert 0 <= qos <= 2
+        assert topic
+        self.lw_topic = topic
+        self.lw_msg = msg
+        self.lw_qos = qos
+        self.lw_retain = retain
 
     def connect(self, clean_session=True):
         self.sock = socket.socket()
+        self._raw_sock = self.sock
+        self.sock.settimeout(self.timeout)
         addr = socket.getaddrinfo(self.server, self.port)[0][-1]
         self.sock.connect(addr)
         if self.ssl:
-            self.sock = ssl.wrap_socket(self.sock, server_hostname=self.server)
+            self._wrap_tls()
         premsg = bytearray(b"\x10\0\0\0\0\0")
         msg = bytearray(b"\x04MQTT\x04\x02\0\0")
 
@@ -133,7 +266,9 @@ class MQTTClient:
             self.sock.write(pkt, 2)
         self.sock.write(msg)
         if qos == 1:
+            deadline = self._deadline()
             while 1:
+                self._check_deadline(deadline)
                 op = self.wait_msg()
                 if op == 0x40:
                     sz = self.sock.read(1)
@@ -153,7 +288,9 @@ class MQTTClient:
         self.sock.write(pkt)
         self._send_str(topic)
         self.sock.write(qos.to_bytes(1, "little"))
+        deadline = self._deadline()
         while 1:
+            self._check_deadline(deadline)
             op = self.wait_msg()
             if op == 0x90:
                 resp = self.sock.read(4)
@@ -164,7 +301,7 @@ class MQTTClient:
 
     def wait_msg(self):
         res = self.sock.read(1)
-        self.sock.setblocking(True)
+        self._set_blocking()
         if res is None:
             return None
         if res == b"":
@@ -179,14 +316,29 @@ class MQTTClient:
         sz = self._recv_len()
         topic_len = self.sock.read(2)
         topic_len = (topic_len[0] << 8) | topic_len[1]
-        topic = self.sock.read(topic_len)
+        if topic_len > MAX_TOPIC_LEN:
+            self._discard(topic_len)
+            topic = None
+        else:
+            topic = self.sock.read(topic_len)
         sz -= topic_len + 2
         if op & 6:
             pid = self.sock.read(2)
             pid = pid[0] << 8 | pid[1]
             sz -= 2
-        msg = self.sock.read(sz)
-        self.cb(topic, msg)
+        if sz < 0:
+            # Remaining length shorter than its own header: the stream is corrupt
+            raise MQTTException("malformed publish")
+        if topic is None or sz > self.topic_limits.get(topic, self.max_msg_size):
+            # Oversized: drain the socket without ever holding the body in memory
+            self._discard(sz)
+            if self.drop_cb:
+                self.drop_cb(topic, sz)
+        elif topic in self.stream_cbs:
+            self._stream(topic, sz, self.stream_cbs[topic])
+        else:
+            msg = self.sock.read(sz)
+            self.cb(topic, msg)
         if op & 6 == 2:
             pkt = bytearray(b"\x40\x02\0\0")
             struct.pack_into("!H", pkt, 2, pid)
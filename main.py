@@ -1,140 +1,186 @@
-import json
 import random
 import time
 from secrets import PASSWORD, SERVER, USER
 
 import machine
+import secrets
 
+import handlers
 import irrigation_controller as ctrl
-from irrigation_programs import (
-    check_conflict,
-    create_program,
-    delete_program,
-    edit_program,
-    get_all_programs,
-    get_program_by_id,
-)
+import irrigation_history as history
+import irrigation_notify as notify
+import irrigation_runtime as runtime
+import irrigation_scheduler as scheduler
+import irrigation_state as state
+from irrigation_notify import NOTIFY, TOPIC_NAMES, TOPICS, send_notification
+from irrigation_programs import get_store_data
+from irrigation_scheduler import check_and_run_programs
 from lib.umqtt import MQTTClient
-from utils.messages import DEFAULT_USER, MESSAGES
-from utils.timezone import now_unix, now_unix_ms
-from utils.utils import (
-    connect_to_wifi,
-    is_wifi_connected,
-    validate_program_data,
-    validate_program_updates,
-)
+from utils import log, memory, metrics, schema, timezone, trace, watchdog
+from utils.timezone import now_unix_ms
+from utils.utils import is_wifi_connected, start_wifi
 
 WIFI_TIMEOUT = 120
 SLEEP_INTERVAL = 0.1
-MQTT_RETRY_INTERVAL = 1
+MQTT_RETRY_INTERVAL = 1000  # doubles on every failure up to MQTT_RETRY_MAX
+MQTT_RETRY_MAX = 60000
+MQTT_SOCKET_TIMEOUT = 5  # seconds a connect or socket call may block the loop
+# A network step may wait on the TCP connect, the TLS handshake and the CONNACK
+NETWORK_STALL_BUDGET_MS = 3 * MQTT_SOCKET_TIMEOUT * 1000
 KEEP_ALIVE_INTERVAL = 10
 NOTIFICATION_TIMEOUT = 60
 
 STATUS_SEND_INTERVAL = 1000
+STATUS_REMAINING_STEP = 10
+STATUS_HEARTBEAT_INTERVAL = 30000
+STATUS_MAX_INTERVAL = 60
+STATUS_MAX_LEASE = 600
+STATUS_MAX_LEASES = 4
+STATUS_CLIENT_ID_MAX = 32
 ZONE_CHECK_INTERVAL = 1000
 CHECK_PROGRAMS_INTERVAL = 10000
 
-TOPICS = {
-    "ZONE": b"api/irrigation/zone",
-    "PROGRAM_CREATE": b"api/irrigation/program/create",
-    "PROGRAM_EDIT": b"api/irrigation/program/edit",
-    "PROGRAM_DELETE": b"api/irrigation/program/delete",
-    "PROGRAM_LIST": b"api/irrigation/program/list",
-    "PROGRAM_UPCOMING": b"api/irrigation/program/upcoming",
-    "PROGRAM_CONTROL": b"api/irrigation/program/control",
-    "GET_STATUS": b"api/irrigation/status",
+# Settings added after the first release: secrets.py files written before them
+# keep working, on the plain port without TLS
+PORT = getattr(secrets, "PORT", "")
+MQTT_SSL = getattr(secrets, "MQTT_SSL", False)
+MQTT_CA_FILE = getattr(secrets, "MQTT_CA_FILE", "")
+
+NTP_RETRY_INTERVAL = 2000  # doubles on every failure up to NTP_RETRY_MAX
+NTP_RETRY_MAX = 300000
+NTP_RESYNC_INTERVAL = 86400000
+CLOCK_SAVE_INTERVAL = 600000
+
+MAX_PAYLOAD_SIZE = 1024
+IMPORT_MAX_SIZE = 16384
+
+METRICS_ENABLED = False
+METRICS_INTERVAL = 60000
+
+TRACE_ENABLED = False
+
+LOG_FLUSH_INTERVAL = 60000
+
+# Status stream subscribers {client_id: lease}; "" is the legacy shared lease
+status_leases = {}
+
+# Rarely used commands, served by handler groups imported on first use:
+# {topic: (group, function)}
+LAZY_ROUTES = {
+    TOPICS["PROGRAM_CREATE"]: ("programs", "handle_program_create"),
+    TOPICS["PROGRAM_EDIT"]: ("programs", "handle_program_edit"),
+    TOPICS["PROGRAM_DELETE"]: ("programs", "handle_program_delete"),
+    TOPICS["PROGRAM_LIST"]: ("programs", "handle_program_list"),
+    TOPICS["PROGRAM_UPCOMING"]: ("programs", "handle_program_upcoming"),
+    TOPICS["PROGRAM_CONTROL"]: ("control", "handle_program_control"),
+    TOPICS["ENCODING"]: ("queries", "handle_encoding_request"),
+    TOPICS["HISTORY"]: ("queries", "handle_history_request"),
+    TOPICS["METRICS"]: ("queries", "handle_metrics_request"),
+    TOPICS["LOG"]: ("queries", "handle_log_request"),
+    TOPICS["RUNTIME"]: ("queries", "handle_runtime_request"),
 }
 
-NOTIFY = {
-    "ZONE": b"api/notification/irrigation/zone",
-    "PROGRAM": b"api/notification/irrigation/program",
-    "PROGRAM_LIST": b"api/notification/irrigation/program/list",
-    "PROGRAM_UPCOMING": b"api/notification/irrigation/program/upcoming",
-    "PROGRAM_CONTROL": b"api/notification/irrigation/program/control",
-    "STATUS": b"api/notification/irrigation/status",
-}
-
-mqtt_client = None
-status_requested = False
-status_end_time = 0
-
-# Tracks when each program was last started to prevent double-triggers {program_id: time.time()}
-program_last_started = {}
-
-
-def send_notification(topic, message, success: bool = True) -> None:
-    try:
-        if isinstance(topic, str):
-            topic = topic.encode()
-        payload = {
-            "data": message,
-            "status": "success" if success else "error",
-            "timestamp": now_unix_ms(),
-        }
-        mqtt_client.publish(topic, json.dumps(payload).encode("utf-8"))
-    except Exception as e:
-        print(f"Error sending notification on {topic}: {e}")
-
-
-def parse_payload(msg: bytes) -> dict:
-    try:
-        return json.loads(msg.decode("utf-8"))
-    except Exception as e:
-        print(f"Error parsing payload: {e}")
-        return {}
+# Control loop timers (ticks_ms)
+last_zone_check = 0
+last_program_check = 0
+last_clock_sync = 0
+last_clock_save = 0
+last_keep_alive = 0
+last_metrics = 0
+ntp_retry_ms = NTP_RETRY_INTERVAL
+
+# ticks_ms() of the first scheduler check: time from reset to a running schedule
+first_tick_ms = None
+
+# State saved before a power loss, restored once NTP gives the real time
+pending_state = None
+
+# Network link, advanced one step per loop by network_tick():
+#   "wifi"       waiting for WiFi, restarted every WIFI_TIMEOUT
+#   "mqtt"       WiFi up, next broker connection attempt at net_next_ms
+#   "subscribe"  connected, one subscription per loop
+#   "online"     serving commands
+net_state = "wifi"
+net_next_ms = 0
+mqtt_retry_ms = MQTT_RETRY_INTERVAL
+wifi_started_ms = None
+pending_topics = []
+# ticks_ms() the last online period ended; None while online or before the first
+net_down_ms = None
+net_reconnects = 0
+net_last_outage_ms = 0
 
 
 # ---------------------------------------------------------------------------
 # Manual zone control
 # ---------------------------------------------------------------------------
 
+# Payload: {"zone": "zone_1", "cmd": "on"|"off"|"toggle", "duration": <s>, "user": "..."}
+# A duration above MANUAL_MAX_DURATION is cut to it; none runs for the maximum.
+ZONE_COMMAND = schema.compile(
+    (
+        ("zone", schema.choice(ctrl.VALID_ZONES, "zone.invalid")),
+        ("cmd", schema.choice(("on", "off", "toggle"), default="toggle")),
+        (
+            "duration",
+            schema.integer(
+                "zone.invalid_duration",
+                lo=1,
+                cap=ctrl.MANUAL_MAX_DURATION,
+                default=ctrl.MANUAL_MAX_DURATION,
+            ),
+        ),
+        ("user", schema.text(max_len=32, truncate=True, default=None)),
+    )
+)
 
-def handle_zone_command(data: dict) -> None:
-    zone_name = data.get("zone")
-    duration = data.get("duration")
-    cmd = data.get("cmd", "toggle")
-    username = data.get("user", DEFAULT_USER)
 
-    if zone_name not in ctrl.VALID_ZONES:
-        send_notification(
-            NOTIFY["ZONE"], MESSAGES["zone"]["not_found"].format(zone=zone_name), False
-        )
+def handle_zone_command(data: dict) -> None:
+    fields, error = ZONE_COMMAND(data)
+    if error:
+        send_notification(NOTIFY["ZONE"], error, False)
         return
+    zone_name = fields["zone"]
+    duration = fields["duration"]
+    username = fields["user"]
 
-    if cmd == "off":
+    if fields["cmd"] == "off":
         if ctrl.active_zone == zone_name:
             ctrl.deactivate_active_zone()
-            msg = MESSAGES["zone"]["deactivated"].format(user=username, zone=zone_name)
-            send_notification(NOTIFY["ZONE"], msg)
-            check_and_run_programs()
-        else:
             send_notification(
-                NOTIFY["ZONE"], f"La zona {zone_name} non è attiva", False
+                NOTIFY["ZONE"], "zone.deactivated", user=username, zone=zone_name
             )
+            check_and_run_programs()
+        else:
+            send_notification(NOTIFY["ZONE"], "zone.not_active", False, zone=zone_name)
         return
 
-    duration = (
-        min(int(duration), ctrl.MANUAL_MAX_DURATION)
-        if duration
-        else ctrl.MANUAL_MAX_DURATION
-    )
+    if ctrl.water_low and ctrl.active_zone != zone_name:
+        send_notification(NOTIFY["ZONE"], "float.blocked", False, zone=zone_name)
+        return
 
     if ctrl.active_zone is None:
         ctrl.activate_zone(zone_name, duration, is_manual=True)
-        msg = MESSAGES["zone"]["activated"].format(
-            user=username, zone=zone_name, duration=round(duration / 60, 1)
+        send_notification(
+            NOTIFY["ZONE"],
+            "zone.activated",
+            user=username,
+            zone=zone_name,
+            duration=duration,
         )
-        send_notification(NOTIFY["ZONE"], msg)
 
     elif ctrl.active_zone == zone_name:
         ctrl.deactivate_active_zone()
-        msg = MESSAGES["zone"]["deactivated"].format(user=username, zone=zone_name)
-        send_notification(NOTIFY["ZONE"], msg)
+        send_notification(
+            NOTIFY["ZONE"], "zone.deactivated", user=username, zone=zone_name
+        )
         check_and_run_programs()
 
     else:
+        paused_id = None
         if not ctrl.manual_override:
             # Auto program running — pause it so it can resume after manual ends
+            paused_id = ctrl.active_program_id
             ctrl.paused_program = {
                 "id": ctrl.active_program_id,
                 "zone": ctrl.active_zone,
@@ -143,762 +189,679 @@ def handle_zone_command(data: dict) -> None:
 
         ctrl.deactivate_active_zone()
         ctrl.activate_zone(zone_name, duration, is_manual=True)
-        msg = MESSAGES["zone"]["manual_override"].format(user=username, zone=zone_name)
-        send_notification(NOTIFY["ZONE"], msg)
+        send_notification(
+            NOTIFY["ZONE"],
+            "zone.manual_override",
+            user=username,
+            zone=zone_name,
+            duration=duration,
+            program=paused_id,
+        )
 
 
 # ---------------------------------------------------------------------------
-# User-initiated pause / resume / stop of auto programs
+# Clock
 # ---------------------------------------------------------------------------
 
 
-def handle_program_control(data: dict) -> None:
-    """Routes pause/resume/stop actions. Payload: {"action": "pause"|"resume"|"stop", "id": <int>, "user": "..."}"""
-    action = data.get("action")
-    username = data.get("user", DEFAULT_USER)
-
-    try:
-        program_id = int(data["id"])
-    except (KeyError, TypeError, ValueError):
-        send_notification(
-            NOTIFY["PROGRAM_CONTROL"], "ID programma mancante o non valido", False
-        )
-        return
-
-    if action == "pause":
-        _handle_program_pause(program_id, username)
-    elif action == "resume":
-        _handle_program_resume(program_id, username)
-    elif action == "stop":
-        _handle_program_stop(program_id, username)
-    else:
-        send_notification(
-            NOTIFY["PROGRAM_CONTROL"], f"Azione non valida: {action}", False
-        )
+def clock_tick(ms_now: int) -> None:
+    """
+    Syncs NTP in the background once WiFi is up (retried with backoff, then
+    daily) and saves the clock every CLOCK_SAVE_INTERVAL for the next power loss.
+    """
+    global last_clock_sync, last_clock_save, ntp_retry_ms, pending_state
+    synced = timezone.time_source == "ntp"
+    interval = NTP_RESYNC_INTERVAL if synced else ntp_retry_ms
+    if time.ticks_diff(ms_now, last_clock_sync) >= interval and is_wifi_connected():
+        last_clock_sync = ms_now
+        step = timezone.sync_ntp()
+        if step is None:
+            ntp_retry_ms = min(ntp_retry_ms * 2, NTP_RETRY_MAX)
+        else:
+            ntp_retry_ms = NTP_RETRY_INTERVAL
+            last_clock_save = time.ticks_add(ms_now, -CLOCK_SAVE_INTERVAL)
+            if step:
+                for lease in status_leases.values():
+                    lease["end"] += step
+                scheduler.realign_after_clock_step(step, synced)
+                state.save()
+            if pending_state is not None:
+                import irrigation_restore
+
+                irrigation_restore.resume(pending_state)
+                pending_state = None
 
+    if (
+        timezone.time_valid()
+        and time.ticks_diff(ms_now, last_clock_save) >= CLOCK_SAVE_INTERVAL
+    ):
+        timezone.save_time()
+        last_clock_save = ms_now
 
-def _handle_program_pause(program_id: int, username: str) -> None:
-    """Pauses a running auto program. Stores window_end so resume knows the original deadline."""
-    if ctrl.active_program_id != program_id:
-        send_notification(
-            NOTIFY["PROGRAM_CONTROL"],
-            MESSAGES["program_control"]["not_running"],
-            False,
-        )
-        return
 
-    remaining = ctrl.get_remaining_seconds()
-    window_end = ctrl.zone_end_time  # original scheduled end time
-    zone = ctrl.active_zone
+# ---------------------------------------------------------------------------
+# Status
+# ---------------------------------------------------------------------------
 
-    ctrl.deactivate_active_zone()
 
-    ctrl.user_paused_program = {
-        "id": program_id,
-        "zone": zone,
-        "window_end": window_end,
+def _window_remaining(paused: dict) -> dict:
+    if not paused:
+        return None
+    return {
+        "id": paused["id"],
+        "zone": paused["zone"],
+        "window_remaining_seconds": max(0, int(paused["window_end"] - time.time())),
     }
 
-    program = get_program_by_id(program_id)
-    name = program["name"] if program else str(program_id)
-    msg = MESSAGES["program_control"]["paused"].format(
-        user=username, name=name, remaining=round(remaining / 60, 1)
-    )
-    send_notification(NOTIFY["PROGRAM_CONTROL"], msg)
-
-
-def _handle_program_resume(program_id: int, username: str) -> None:
-    """Resumes a user-paused program if its time window has not expired."""
-    if not ctrl.user_paused_program or ctrl.user_paused_program["id"] != program_id:
-        send_notification(
-            NOTIFY["PROGRAM_CONTROL"],
-            MESSAGES["program_control"]["not_paused"],
-            False,
-        )
-        return
-
-    if time.time() >= ctrl.user_paused_program["window_end"]:
-        ctrl.user_paused_program = None
-        send_notification(
-            NOTIFY["PROGRAM_CONTROL"],
-            MESSAGES["program_control"]["window_expired"],
-            False,
-        )
-        return
 
-    if ctrl.active_zone is not None:
-        send_notification(
-            NOTIFY["PROGRAM_CONTROL"],
-            MESSAGES["program_control"]["zone_busy"],
-            False,
-        )
-        return
+def _build_status() -> dict:
+    return {
+        "active_zone": ctrl.active_zone,
+        "manual_override": ctrl.manual_override,
+        "active_program": ctrl.active_program_id,
+        "zone_remaining_seconds": ctrl.get_remaining_seconds(),
+        "paused_program": _window_remaining(ctrl.paused_program),
+        "user_paused_program": _window_remaining(ctrl.user_paused_program),
+        "float_switches": ctrl.get_float_switches(),
+        "water_low": ctrl.water_low,
+    }
 
-    paused = ctrl.user_paused_program
-    ctrl.user_paused_program = None
 
-    # Remaining time is computed from the original window, not from when it was paused
-    new_remaining = int(paused["window_end"] - time.time())
+def _status_value_changed(key: str, prev, cur) -> bool:
+    """Countdowns only count as changed once they move by STATUS_REMAINING_STEP."""
+    if isinstance(cur, dict) and isinstance(prev, dict):
+        for k in cur:
+            if _status_value_changed(k, prev.get(k), cur[k]):
+                return True
+        return False
+    if key.endswith("_remaining_seconds") and prev is not None and cur is not None:
+        return abs(cur - prev) >= STATUS_REMAINING_STEP or (cur == 0) != (prev == 0)
+    return prev != cur
 
-    programs = get_all_programs()
-    now = now_unix()
-    local_t = time.localtime(now)
-    current_seconds = local_t[3] * 3600 + local_t[4] * 60
-    capped = _cap_to_next_program(
-        new_remaining, current_seconds, paused["id"], programs
-    )
 
-    if capped <= 0:
-        send_notification(
-            NOTIFY["PROGRAM_CONTROL"],
-            MESSAGES["program_control"]["no_time"],
-            False,
-        )
-        return
+def _status_topic(client_id: str) -> bytes:
+    if not client_id:
+        return NOTIFY["STATUS"]
+    return NOTIFY["STATUS"] + b"/" + client_id.encode()
 
-    ctrl.activate_zone(paused["zone"], capped, is_manual=False, program_id=paused["id"])
 
-    program = get_program_by_id(paused["id"])
-    name = program["name"] if program else str(paused["id"])
-    msg = MESSAGES["program_control"]["resumed"].format(
-        user=username, name=name, remaining=round(capped / 60, 1)
+# The client id becomes a topic level: no wildcards or separators, and a bad one
+# refuses the request instead of falling back to the shared lease
+STATUS_CLIENT = schema.compile(
+    (
+        (
+            "client",
+            schema.pattern(
+                r"^[A-Za-z0-9_-]+$", max_len=STATUS_CLIENT_ID_MAX, default=""
+            ),
+        ),
     )
-    send_notification(NOTIFY["PROGRAM_CONTROL"], msg)
-
-
-def _handle_program_stop(program_id: int, username: str) -> None:
-    """Permanently stops a program regardless of its current state (running, user-paused, or auto-paused)."""
-    stopped = False
-
-    if ctrl.active_program_id == program_id:
-        ctrl.deactivate_active_zone()
-        stopped = True
-
-    if ctrl.user_paused_program and ctrl.user_paused_program["id"] == program_id:
-        ctrl.user_paused_program = None
-        stopped = True
-
-    if ctrl.paused_program and ctrl.paused_program["id"] == program_id:
-        ctrl.paused_program = None
-        stopped = True
-
-    program = get_program_by_id(program_id)
-    name = program["name"] if program else str(program_id)
-
-    if stopped:
-        msg = MESSAGES["program_control"]["stopped"].format(user=username, name=name)
-        send_notification(NOTIFY["PROGRAM_CONTROL"], msg)
-    else:
-        send_notification(
-            NOTIFY["PROGRAM_CONTROL"],
-            MESSAGES["program_control"]["not_running"],
-            False,
-        )
-
-
-def _time_str_to_seconds(time_str: str) -> int:
-    h, m = map(int, time_str.split(":"))
-    return h * 3600 + m * 60
-
-
-def _cap_to_next_program(
-    duration: int, current_seconds: int, exclude_id: int, programs: list
-) -> int:
-    """
-    Truncates 'duration' so the resumed program does not overlap the next scheduled program.
-    Checks both today and tomorrow (in case the window extends past midnight).
-    Returns the (possibly reduced) duration in seconds.
-    """
-    now = now_unix()
-    local_t = time.localtime(now)
-    current_weekday = local_t[6]
-    next_weekday = (current_weekday + 1) % 7
-    end_seconds = current_seconds + duration
-
-    for prog in programs:
-        if prog["id"] == exclude_id:
-            continue
-        if not prog.get("is_active", True):
-            continue
-        start_s = _time_str_to_seconds(prog["start_time"])
-        # Check today
-        if current_weekday in prog["active_days"]:
-            if current_seconds < start_s < end_seconds:
-                end_seconds = start_s
-        # Check tomorrow if the window extends past midnight
-        if end_seconds > 86400 and next_weekday in prog["active_days"]:
-            start_s_tomorrow = start_s + 86400
-            if current_seconds < start_s_tomorrow < end_seconds:
-                end_seconds = start_s_tomorrow
+)
 
-    return end_seconds - current_seconds
+# Lenient: a bad field takes its default rather than refusing the lease
+STATUS_REQUEST = schema.compile(
+    (
+        (
+            "interval",
+            schema.integer(
+                lo=1,
+                hi=STATUS_MAX_INTERVAL,
+                clamp=True,
+                default=STATUS_SEND_INTERVAL // 1000,
+            ),
+        ),
+        (
+            "duration",
+            schema.integer(
+                lo=1, hi=STATUS_MAX_LEASE, clamp=True, default=NOTIFICATION_TIMEOUT
+            ),
+        ),
+        ("encoding", schema.choice(("json", "cbor"), default="json")),
+    ),
+    lenient=True,
+)
 
 
-def _try_resume_paused_program(programs: list = None) -> None:
+def handle_status_request(data: dict) -> None:
     """
-    Resumes an auto-paused program (interrupted by a manual zone).
-    Truncates its duration if another program is scheduled before its natural end.
-    Discards it silently if the original time window has already expired.
+    Opens or renews a status lease.
+    Payload: {"client": "...", "interval": <s>, "duration": <s>, "encoding": "json"|"cbor"}
+    — all optional.
+    Requests without a client share the legacy lease on the base status topic.
     """
-    if not ctrl.paused_program:
+    client, _ = STATUS_CLIENT(data)
+    if client is None:
+        log.warning("Status request refused: invalid client id")
         return
-
-    paused = ctrl.paused_program
-    ctrl.paused_program = None
-
-    actual_remaining = int(paused["window_end"] - time.time())
-    if actual_remaining <= 0:
-        print(f"Paused program {paused['id']} window expired, discarding")
+    fields, _ = STATUS_REQUEST(data)
+    if fields is None:
         return
+    client_id = client["client"]
+    interval = fields["interval"]
+    duration = max(fields["duration"], interval)
+
+    lease = status_leases.get(client_id)
+    if lease is None:
+        if len(status_leases) >= STATUS_MAX_LEASES:
+            log.warning(
+                "Status lease refused for '%s': too many subscribers", client_id
+            )
+            send_notification(
+                _status_topic(client_id),
+                "status.busy",
+                False,
+                client=client_id,
+                leases=STATUS_MAX_LEASES,
+            )
+            return
+        lease = {"sent": None, "seq": 0, "last_send": 0, "last_tick": 0}
+        status_leases[client_id] = lease
+    else:
+        # Renewal from a client that may have missed deltas: resend a full snapshot
+        lease["sent"] = None
+    lease["topic"] = _status_topic(client_id)
+    lease["encoding"] = fields["encoding"]
+    lease["interval_ms"] = interval * 1000
+    lease["end"] = time.time() + duration
 
-    if programs is None:
-        programs = get_all_programs()
 
-    now = now_unix()
-    local_t = time.localtime(now)
-    current_seconds = local_t[3] * 3600 + local_t[4] * 60
+def send_irrigation_status(lease: dict, status: dict) -> None:
+    """Publishes a full snapshot on the first tick of a lease, then only changed fields."""
+    try:
+        prev = lease["sent"]
+        if prev is None:
+            payload = {"type": "full"}
+            payload.update(status)
+            lease["sent"] = dict(status)
+        else:
+            changes = {}
+            for key, value in status.items():
+                if _status_value_changed(key, prev.get(key), value):
+                    changes[key] = value
+                    prev[key] = value
+            if (
+                not changes
+                and time.ticks_diff(time.ticks_ms(), lease["last_send"])
+                < STATUS_HEARTBEAT_INTERVAL
+            ):
+                return
+            payload = {"type": "delta", "changes": changes}
+        lease["seq"] += 1
+        lease["last_send"] = time.ticks_ms()
+        payload["seq"] = lease["seq"]
+        payload["timestamp"] = now_unix_ms()
+        notify.publish(lease["topic"], payload, lease["encoding"])
+    except Exception as e:
+        log.error("Error sending irrigation status: %s", e)
 
-    capped = _cap_to_next_program(
-        actual_remaining, current_seconds, paused["id"], programs
-    )
 
-    if capped <= 0:
-        print(
-            f"Paused program {paused['id']} has no room before next scheduled program, discarding"
-        )
+def service_status_leases(ms_now: int) -> None:
+    """Expires leases and sends status to those whose interval has elapsed."""
+    if not status_leases:
         return
-
-    ctrl.activate_zone(paused["zone"], capped, is_manual=False, program_id=paused["id"])
-    msg = MESSAGES["zone"]["auto_resumed"].format(
-        zone=paused["zone"], duration=round(capped / 60, 1)
-    )
-    send_notification(NOTIFY["ZONE"], msg)
+    now = time.time()
+    status = None
+    for client_id in list(status_leases):
+        lease = status_leases[client_id]
+        if now >= lease["end"]:
+            del status_leases[client_id]
+            log.warning("Status lease expired: '%s'", client_id)
+            continue
+        if (
+            lease["sent"] is not None
+            and time.ticks_diff(ms_now, lease["last_tick"]) < lease["interval_ms"]
+        ):
+            continue
+        lease["last_tick"] = ms_now
+        if status is None:
+            status = _build_status()
+        send_irrigation_status(lease, status)
 
 
-def _start_auto_program(prog: dict, duration: int = None) -> None:
-    """Starts an auto program. 'duration' supports late-start (partial window)."""
-    actual_duration = duration if duration is not None else prog["duration"]
-    program_last_started[prog["id"]] = time.time()
-    ctrl.activate_zone(
-        prog["zone"], actual_duration, is_manual=False, program_id=prog["id"]
-    )
-    msg = MESSAGES["zone"]["auto_activated"].format(
-        zone=prog["zone"], duration=round(actual_duration / 60, 1)
-    )
-    send_notification(NOTIFY["ZONE"], msg)
+def send_metrics() -> None:
+    try:
+        payload = metrics.snapshot()
+        payload["heap"] = memory.report()
+        payload["boot"] = {
+            "first_tick_ms": first_tick_ms,
+            "clock": timezone.time_source,
+            "reset": watchdog.reset_cause(),
+        }
+        payload["watchdog"] = watchdog.report()
+        payload["network"] = {
+            "reconnects": net_reconnects,
+            "last_outage_ms": net_last_outage_ms,
+        }
+        payload["timestamp"] = now_unix_ms()
+        payload["handlers"] = handlers.report()
+        if trace.ENABLED:
+            payload["trace"] = trace.report()
+        notify.publish(NOTIFY["METRICS"], payload)
+    except Exception as e:
+        log.error("Error sending metrics: %s", e)
 
 
 # ---------------------------------------------------------------------------
-# Zone timeout
+# MQTT connection
 # ---------------------------------------------------------------------------
 
 
-def check_zone_timeout() -> None:
-    if not ctrl.is_zone_timeout():
+def handle_message(topic: bytes, msg: bytes) -> None:
+    log.debug("Received - Topic: %s, Message: %s", topic, msg)
+    trace.inbound(topic, msg)
+    # A fleet-wide command is served as if sent to this device
+    topic = notify.BROADCAST_TOPICS.get(topic, topic)
+    watchdog.enter(TOPIC_NAMES.get(topic, "message"))
+    if not metrics.ENABLED:
+        _dispatch(topic, notify.parse_payload(msg))
         return
+    heap_before = memory.alloc_start()
+    t0 = metrics.start()
+    _dispatch(topic, notify.parse_payload(msg))
+    name = TOPIC_NAMES.get(topic, "unknown")
+    metrics.record("handler:" + name, t0)
+    memory.alloc_record(name, heap_before)
 
-    zone_name = ctrl.active_zone
-    was_manual = ctrl.manual_override
-    ctrl.deactivate_active_zone()
-
-    if was_manual:
-        msg = MESSAGES["zone"]["timeout_deactivated"].format(zone=zone_name)
-    else:
-        msg = MESSAGES["zone"]["auto_deactivated"].format(zone=zone_name)
-
-    send_notification(NOTIFY["ZONE"], msg)
 
-    # Trigger immediately without waiting for the next 10s tick
-    check_and_run_programs()
+def _dispatch(topic: bytes, data: dict) -> None:
+    if topic == TOPICS["ZONE"]:
+        handle_zone_command(data)
 
+    elif topic == TOPICS["GET_STATUS"]:
+        handle_status_request(data)
 
-# ---------------------------------------------------------------------------
-# Auto program scheduler
-# ---------------------------------------------------------------------------
+    elif topic == TOPICS["DISCOVER"]:
+        announce()
 
+    else:
+        route = LAZY_ROUTES.get(topic)
+        if route:
+            group, name = route
+            getattr(handlers.load(group), name)(data)
 
-def check_and_run_programs() -> None:
-    """
-    Checks whether an auto program should start now.
 
-    Priority:
-    1. A scheduled program whose time window is active (start <= now < start+duration):
-       starts for the remaining window time (late-start), discarding any auto-paused program.
-    2. An auto-paused program (no scheduled program currently due):
-       resumes for its remaining window time, capped at the next scheduled program start.
+def on_import_chunk(topic: bytes, chunk, offset: int, total: int) -> None:
+    trace.inbound_chunk(topic, chunk, offset, total)
+    handlers.load("programs").on_import_chunk(topic, chunk, offset, total)
 
-    The auto-paused and user-paused programs are excluded from the scheduler loop
-    to avoid being picked up as a fresh start.
-    """
-    if ctrl.manual_override:
-        return
 
-    if ctrl.active_zone is not None:
-        return
+def on_oversized_message(topic: bytes, size: int) -> None:
+    log.warning("Discarded oversized message on %s: %s bytes", topic, size)
 
-    programs = get_all_programs()
-    now = now_unix()
-    local_t = time.localtime(now)
-    current_weekday = local_t[6]  # 0=Mon, 6=Sun
-    current_seconds = local_t[3] * 3600 + local_t[4] * 60
 
-    paused_id = ctrl.paused_program["id"] if ctrl.paused_program else None
-    user_paused_id = (
-        ctrl.user_paused_program["id"] if ctrl.user_paused_program else None
+def connect_to_mqtt() -> bool:
+    """Opens the broker connection; subscriptions follow one per loop."""
+    client = MQTTClient(
+        client_id=str(random.randint(100000, 999999)),
+        user=USER,
+        password=PASSWORD,
+        server=SERVER,
+        max_msg_size=MAX_PAYLOAD_SIZE,
+        port=int(PORT) if PORT else 0,
+        ssl=MQTT_SSL,
+        ca_file=MQTT_CA_FILE if MQTT_SSL else None,
+        timeout=MQTT_SOCKET_TIMEOUT,
     )
+    client.set_callback(handle_message)
+    if notify.DISCOVERY:
+        client.set_last_will(notify.DISCOVERY, _announcement(False), retain=True)
+    trace.wrap_publish(client)
+    client.set_drop_callback(on_oversized_message)
+    client.set_stream_callback(
+        TOPICS["PROGRAM_IMPORT"], on_import_chunk, IMPORT_MAX_SIZE
+    )
+    try:
+        client.connect()
+    except Exception as e:
+        log.error("Failed to connect to MQTT: %s", e)
+        if client.sock:
+            try:
+                client.sock.close()
+            except Exception:
+                pass
+        return False
 
-    # Discard expired user-paused program
-    if (
-        ctrl.user_paused_program
-        and time.time() >= ctrl.user_paused_program["window_end"]
-    ):
-        print(f"User-paused program {user_paused_id} window expired, discarding")
-        ctrl.user_paused_program = None
-        user_paused_id = None
-
-    # Find a scheduled program whose time window is currently active
-    due_program = None
-    due_remaining = None
-    for prog in programs:
-        if not prog.get("is_active", True):
-            continue
-        # Skip auto-paused program — handled by _try_resume_paused_program
-        if prog["id"] == paused_id:
-            continue
-        # Skip user-paused program — only the user can resume it explicitly
-        if prog["id"] == user_paused_id:
-            continue
-        if time.time() - program_last_started.get(prog["id"], 0) < 70:
-            continue
-        if current_weekday not in prog["active_days"]:
-            continue
-        start_s = _time_str_to_seconds(prog["start_time"])
-        end_s = start_s + prog["duration"]
-        if start_s <= current_seconds < end_s:
-            due_program = prog
-            due_remaining = end_s - current_seconds  # late start: remaining window time
-            break
-
-    if due_program:
-        # Scheduled program takes priority — discard any auto-paused program
-        if ctrl.paused_program:
-            print(
-                f"Paused program {ctrl.paused_program['id']} discarded: "
-                f"'{due_program['name']}' is due"
-            )
-            ctrl.paused_program = None
-        _start_auto_program(due_program, due_remaining)
+    if client.tls_stats:
+        stats = client.tls_stats
+        log.info(
+            "TLS handshake: %d ms, heap %d bytes (%d free after), IDF peak: %s",
+            stats["handshake_ms"],
+            stats["heap_bytes"],
+            stats["free_after"],
+            stats["peak_bytes"],
+        )
+    notify.client = client
+    return True
 
-    elif ctrl.paused_program:
-        _try_resume_paused_program(programs)
 
+def disconnect_mqtt() -> None:
+    if notify.client:
+        try:
+            if notify.DISCOVERY and net_state == "online":
+                # What the broker would publish for us after an unclean drop
+                notify.client.publish(
+                    notify.DISCOVERY, _announcement(False), retain=True
+                )
+            notify.client.disconnect()
+        except Exception as e:
+            log.error("Error disconnecting client: %s", e)
+        notify.client = None
 
-# ---------------------------------------------------------------------------
-# Program CRUD
-# ---------------------------------------------------------------------------
 
+def _announcement(online: bool) -> bytes:
+    payload = {"device": notify.DEVICE_ID, "online": online}
+    if online:
+        payload["commands"] = notify.COMMAND_PREFIX.decode()
+        payload["notifications"] = notify.NOTIFY_PREFIX.decode()
+        payload["broadcast"] = notify.BROADCAST.decode()
+        payload["zones"] = sorted(ctrl.VALID_ZONES)
+        payload["messages"] = notify.message_mode
+        payload["reset"] = watchdog.reset_cause()
+        payload["timestamp"] = now_unix_ms()
+    return notify.encode_payload(payload)
 
-def handle_program_create(data: dict) -> None:
-    program_data = data.get("program")
 
-    is_valid, error = validate_program_data(program_data)
-    if not is_valid:
-        send_notification(NOTIFY["PROGRAM"], error, False)
-        return
-
-    has_conflict, conflict_name = check_conflict(program_data)
-    if has_conflict:
-        msg = MESSAGES["program"]["conflict"].format(name=conflict_name)
-        send_notification(NOTIFY["PROGRAM"], msg, False)
+def announce() -> None:
+    """
+    Publishes this device's retained discovery record; the last will replaces it
+    with {"online": false} if the link drops. Only namespaced devices announce.
+    """
+    if notify.DISCOVERY is None or notify.client is None:
         return
-
     try:
-        program = create_program(program_data)
-        msg = MESSAGES["program"]["created"].format(name=program["name"])
-        send_notification(NOTIFY["PROGRAM"], msg)
-        _send_program_list()
+        notify.client.publish(notify.DISCOVERY, _announcement(True), retain=True)
     except Exception as e:
-        print(f"Error creating program: {e}")
-        send_notification(NOTIFY["PROGRAM"], MESSAGES["program"]["error_create"], False)
-
+        log.error("Error sending announcement: %s", e)
 
-def handle_program_edit(data: dict) -> None:
-    updates = data.get("program", {})
 
+def keep_connection_active() -> None:
     try:
-        program_id = int(data["id"])
-    except (KeyError, TypeError, ValueError):
-        send_notification(
-            NOTIFY["PROGRAM"], "ID programma mancante o non valido", False
-        )
-        return
+        notify.client.publish(b"api/ping", b"ping")
+    except Exception as e:
+        log.error("Error sending ping: %s", e)
+        raise
 
-    existing = get_program_by_id(program_id)
-    if not existing:
-        send_notification(NOTIFY["PROGRAM"], MESSAGES["program"]["not_found"], False)
-        return
 
-    is_valid, error = validate_program_updates(updates)
-    if not is_valid:
-        send_notification(NOTIFY["PROGRAM"], error, False)
-        return
+def connection_lost(ms_now: int) -> None:
+    """Drops the broker connection; network_tick() reconnects after the backoff."""
+    global net_state, net_down_ms
+    if net_state == "online":
+        net_down_ms = ms_now
+    disconnect_mqtt()
+    pending_topics.clear()
+    net_state = "mqtt"
+    _schedule_mqtt_retry(ms_now)
 
-    # Merge for conflict check against the full updated program
-    merged = {}
-    merged.update(existing)
-    merged.update(updates)
 
-    has_conflict, conflict_name = check_conflict(merged, exclude_id=program_id)
-    if has_conflict:
-        msg = MESSAGES["program"]["conflict"].format(name=conflict_name)
-        send_notification(NOTIFY["PROGRAM"], msg, False)
-        return
+def _schedule_mqtt_retry(ms_now: int) -> None:
+    global net_next_ms, mqtt_retry_ms
+    # Jittered so a fleet does not reconnect in lockstep after a broker restart
+    delay = mqtt_retry_ms + random.randint(0, mqtt_retry_ms // 4)
+    net_next_ms = time.ticks_add(ms_now, delay)
+    mqtt_retry_ms = min(mqtt_retry_ms * 2, MQTT_RETRY_MAX)
+    log.warning("MQTT offline, retrying in %d ms", delay)
 
-    try:
-        program = edit_program(program_id, updates)
-        msg = MESSAGES["program"]["edited"].format(name=program["name"])
-        send_notification(NOTIFY["PROGRAM"], msg)
-
-        # If disabled, stop it wherever it currently is
-        if not program.get("is_active", True):
-            was_active = ctrl.active_program_id == program_id
-            if was_active:
-                ctrl.deactivate_active_zone()
-                send_notification(
-                    NOTIFY["ZONE"],
-                    f"Programma '{program['name']}' disabilitato: zona disattivata",
-                )
-            if ctrl.paused_program and ctrl.paused_program.get("id") == program_id:
-                ctrl.paused_program = None
-            if (
-                ctrl.user_paused_program
-                and ctrl.user_paused_program.get("id") == program_id
-            ):
-                ctrl.user_paused_program = None
-            if was_active:
-                check_and_run_programs()
 
-        _send_program_list()
-    except Exception as e:
-        print(f"Error editing program: {e}")
-        send_notification(NOTIFY["PROGRAM"], MESSAGES["program"]["error_edit"], False)
+def network_tick(ms_now: int) -> None:
+    """
+    Advances the WiFi and broker connection by at most one blocking step and
+    serves incoming commands once online. The control loop never waits on it.
+    """
+    global net_state, wifi_started_ms, mqtt_retry_ms
+    global net_down_ms, net_reconnects, net_last_outage_ms
+
+    if net_state != "wifi" and not is_wifi_connected():
+        log.warning("WiFi lost")
+        connection_lost(ms_now)
+        wifi_started_ms = None
+        net_state = "wifi"
+
+    if net_state == "wifi":
+        if is_wifi_connected():
+            wifi_started_ms = None
+            net_state = "mqtt"
+        elif (
+            wifi_started_ms is None
+            or time.ticks_diff(ms_now, wifi_started_ms) >= WIFI_TIMEOUT * 1000
+        ):
+            # A connection already in progress (boot.py) is left to finish
+            start_wifi(restart=wifi_started_ms is not None)
+            wifi_started_ms = ms_now
+        return
 
+    if net_state == "mqtt":
+        if time.ticks_diff(ms_now, net_next_ms) < 0:
+            return
+        if connect_to_mqtt():
+            pending_topics[:] = notify.SUBSCRIPTIONS
+            net_state = "subscribe"
+        else:
+            _schedule_mqtt_retry(ms_now)
+        return
 
-def handle_program_delete(data: dict) -> None:
-    try:
-        program_id = int(data["id"])
-    except (KeyError, TypeError, ValueError):
-        send_notification(
-            NOTIFY["PROGRAM"], "ID programma mancante o non valido", False
-        )
+    if net_state == "subscribe":
+        notify.client.subscribe(pending_topics.pop(0))
+        if not pending_topics:
+            log.info("Connected to MQTT broker at %s", SERVER)
+            mqtt_retry_ms = MQTT_RETRY_INTERVAL
+            if net_down_ms is not None:
+                net_reconnects += 1
+                net_last_outage_ms = time.ticks_diff(ms_now, net_down_ms)
+                net_down_ms = None
+            net_state = "online"
+            announce()
         return
 
-    # Remove from all active states before deleting
-    was_active = ctrl.active_program_id == program_id
-    if was_active:
-        ctrl.deactivate_active_zone()
-        send_notification(
-            NOTIFY["ZONE"], f"Programma {program_id} eliminato: zona disattivata"
-        )
-    if ctrl.paused_program and ctrl.paused_program.get("id") == program_id:
-        ctrl.paused_program = None
-    if ctrl.user_paused_program and ctrl.user_paused_program.get("id") == program_id:
-        ctrl.user_paused_program = None
-    program_last_started.pop(program_id, None)
-
-    success = delete_program(program_id)
-    if success:
-        send_notification(NOTIFY["PROGRAM"], MESSAGES["program"]["deleted"])
-        _send_program_list()
-        if was_active:
-            check_and_run_programs()
-    else:
-        send_notification(NOTIFY["PROGRAM"], MESSAGES["program"]["not_found"], False)
+    t0 = metrics.start()
+    notify.client.check_msg()
+    metrics.record("check_msg", t0)
 
 
 # ---------------------------------------------------------------------------
-# Status and program list
+# Main loop
 # ---------------------------------------------------------------------------
 
 
-def send_irrigation_status() -> None:
-    try:
-        user_paused = ctrl.user_paused_program
-        payload = {
-            "active_zone": ctrl.active_zone,
-            "manual_override": ctrl.manual_override,
-            "zone_remaining_seconds": ctrl.get_remaining_seconds(),
-            "paused_program": (
-                {
-                    "id": ctrl.paused_program["id"],
-                    "zone": ctrl.paused_program["zone"],
-                    "window_remaining_seconds": max(
-                        0, int(ctrl.paused_program["window_end"] - time.time())
-                    ),
-                }
-                if ctrl.paused_program
-                else None
-            ),
-            "user_paused_program": (
-                {
-                    "id": user_paused["id"],
-                    "zone": user_paused["zone"],
-                    "window_remaining_seconds": max(
-                        0, int(user_paused["window_end"] - time.time())
-                    ),
-                }
-                if user_paused
-                else None
-            ),
-            "float_switches": ctrl.get_float_switches(),
-            "timestamp": now_unix_ms(),
-        }
-        mqtt_client.publish(NOTIFY["STATUS"], json.dumps(payload).encode("utf-8"))
-    except Exception as e:
-        print(f"Error sending irrigation status: {e}")
-
-
-def _send_program_list() -> None:
+def cleanup_pins() -> None:
     try:
-        programs = get_all_programs()
-        payload = {
-            "programs": programs,
-            "total": len(programs),
-            "timestamp": now_unix_ms(),
-        }
-        mqtt_client.publish(NOTIFY["PROGRAM_LIST"], json.dumps(payload).encode("utf-8"))
+        ctrl.deactivate_all_zones()
     except Exception as e:
-        print(f"Error sending program list: {e}")
+        log.error("Error cleaning up pins: %s", e)
 
 
-def _send_upcoming_programs() -> None:
-    try:
-        upcoming = _compute_upcoming_programs()
-        payload = {
-            "upcoming": upcoming,
-            "timestamp": now_unix_ms(),
+def start_trace(saved: dict) -> None:
+    """Records this boot for tools/replay.py when TRACE_ENABLED."""
+    trace.ENABLED = TRACE_ENABLED
+    if not TRACE_ENABLED:
+        return
+    ctrl.transition_listeners.append(trace.on_zone_transition)
+    trace.start(
+        {
+            "store": get_store_data(),
+            "encodings": notify.notify_encodings,
+            "messages": notify.message_mode,
+            "device": notify.DEVICE_ID,
+            "float": ctrl.get_float_switches(),
+            "interlock": [ctrl.INTERLOCK_SWITCH, ctrl.INTERLOCK_LOW_VALUE],
+            "loop": SLEEP_INTERVAL,
+            "state": saved,
         }
-        mqtt_client.publish(
-            NOTIFY["PROGRAM_UPCOMING"], json.dumps(payload).encode("utf-8")
-        )
-    except Exception as e:
-        print(f"Error sending upcoming programs: {e}")
-
-
-def _compute_upcoming_programs(n: int = 10) -> list:
-    """Returns the next N activations across all active programs, sorted by start time."""
-    programs = get_all_programs()
-    now = now_unix()
-    local_t = time.localtime(now)
-    today_weekday = local_t[6]
-    today_seconds = local_t[3] * 3600 + local_t[4] * 60 + local_t[5]
-
-    upcoming = []
-
-    for prog in programs:
-        if not prog.get("is_active", True):
-            continue
-
-        start_h, start_m = map(int, prog["start_time"].split(":"))
-        start_seconds = start_h * 3600 + start_m * 60
-
-        for day_offset in range(8):
-            check_weekday = (today_weekday + day_offset) % 7
+    )
 
-            if check_weekday not in prog["active_days"]:
-                continue
 
-            # Today but start time already passed — skip
-            if day_offset == 0 and start_seconds <= today_seconds:
-                continue
+def restore_state(saved: dict, source: str) -> None:
+    """
+    Resumes what was running before the reset. Times in the snapshot are only
+    comparable with a clock that ran on (RTC) or was synced; after a power loss
+    the restore waits for NTP, and the scheduler leaves its programs alone until then.
+    """
+    global pending_state
+    if saved is None:
+        return
+    import irrigation_restore
 
-            next_unix = now - today_seconds + day_offset * 86400 + start_seconds
-            upcoming.append(
-                {
-                    "id": prog["id"],
-                    "name": prog["name"],
-                    "zone": prog["zone"],
-                    "start": next_unix,
-                    "duration": prog["duration"],
-                }
+    if timezone.time_source in ("rtc", "ntp"):
+        log.info("Restoring state from %s", source)
+        irrigation_restore.resume(saved)
+    else:
+        log.info("State from %s waits for the clock to be synced", source)
+        irrigation_restore.hold(saved)
+        pending_state = saved
+
+
+def control_tick(ms_now: int) -> None:
+    """Float switches, zone timeouts, the scheduler and the clock; needs no network."""
+    global last_zone_check, last_program_check, first_tick_ms
+    t0 = metrics.start()
+    scheduler.check_float_switches()
+    metrics.record("float_switches", t0)
+
+    if time.ticks_diff(ms_now, last_zone_check) >= ZONE_CHECK_INTERVAL:
+        t0 = metrics.start()
+        scheduler.check_zone_timeout()
+        metrics.record("zone_timeout", t0)
+        t0 = metrics.start()
+        history.tick()
+        runtime.tick()
+        metrics.record("history", t0)
+        last_zone_check = ms_now
+
+    if time.ticks_diff(ms_now, last_program_check) >= CHECK_PROGRAMS_INTERVAL:
+        t0 = metrics.start()
+        check_and_run_programs()
+        metrics.record("programs", t0)
+        last_program_check = ms_now
+        if first_tick_ms is None:
+            first_tick_ms = time.ticks_ms()
+            log.info(
+                "First scheduler tick %d ms after reset, clock: %s",
+                first_tick_ms,
+                timezone.time_source,
             )
-            break
 
-    upcoming.sort(key=lambda x: x["start"])
-    return upcoming[:n]
+    clock_tick(ms_now)
+    state.tick(ms_now)
 
 
-# ---------------------------------------------------------------------------
-# MQTT connection
-# ---------------------------------------------------------------------------
+def online_tick(ms_now: int) -> None:
+    """Status streams, keep-alive and metrics; only while online."""
+    global last_keep_alive, last_metrics
+    t0 = metrics.start()
+    service_status_leases(ms_now)
+    metrics.record("status", t0)
 
+    if time.ticks_diff(ms_now, last_keep_alive) >= KEEP_ALIVE_INTERVAL * 1000:
+        keep_connection_active()
+        last_keep_alive = ms_now
 
-def handle_message(topic: bytes, msg: bytes) -> None:
-    global status_requested, status_end_time
-    print(f"Received - Topic: {topic}, Message: {msg}")
-
-    data = parse_payload(msg)
-
-    if topic == TOPICS["ZONE"]:
-        handle_zone_command(data)
-
-    elif topic == TOPICS["PROGRAM_CREATE"]:
-        handle_program_create(data)
-
-    elif topic == TOPICS["PROGRAM_EDIT"]:
-        handle_program_edit(data)
-
-    elif topic == TOPICS["PROGRAM_DELETE"]:
-        handle_program_delete(data)
-
-    elif topic == TOPICS["PROGRAM_LIST"]:
-        _send_program_list()
-
-    elif topic == TOPICS["PROGRAM_UPCOMING"]:
-        _send_upcoming_programs()
-
-    elif topic == TOPICS["PROGRAM_CONTROL"]:
-        handle_program_control(data)
-
-    elif topic == TOPICS["GET_STATUS"]:
-        status_requested = True
-        status_end_time = time.time() + NOTIFICATION_TIMEOUT
-
-
-def connect_to_mqtt() -> bool:
-    global mqtt_client
-
-    if mqtt_client:
-        try:
-            mqtt_client.disconnect()
-        except Exception:
-            pass
-        mqtt_client = None
-
-    while not is_wifi_connected():
-        print("WiFi not connected, attempting connection...")
-        connect_to_wifi(timeout=WIFI_TIMEOUT)
-        time.sleep(1)
-
-    try:
-        client = MQTTClient(
-            client_id=str(random.randint(100000, 999999)),
-            user=USER,
-            password=PASSWORD,
-            server=SERVER,
-        )
-        client.set_callback(handle_message)
-        client.connect()
-        time.sleep_ms(200)
-
-        for topic_name, topic in TOPICS.items():
-            client.subscribe(topic)
-            print(f"Subscribed to {topic_name}")
-
-        print(f"Connected to MQTT broker at {SERVER}")
-        mqtt_client = client
-        return True
-    except Exception as e:
-        print(f"Failed to connect to MQTT: {e}")
-        return False
-
-
-def keep_connection_active() -> None:
-    try:
-        mqtt_client.publish(b"api/ping", b"ping")
-    except Exception as e:
-        print(f"Error sending ping: {e}")
-        raise
-
-
-# ---------------------------------------------------------------------------
-# Main loop
-# ---------------------------------------------------------------------------
-
-
-def cleanup_pins() -> None:
-    try:
-        ctrl.deactivate_all_zones()
-    except Exception as e:
-        print(f"Error cleaning up pins: {e}")
+    if metrics.ENABLED and time.ticks_diff(ms_now, last_metrics) >= METRICS_INTERVAL:
+        send_metrics()
+        last_metrics = ms_now
 
 
 def main() -> None:
-    global status_requested, mqtt_client
+    global last_zone_check, last_program_check, last_clock_sync
+    global last_keep_alive, last_metrics
 
     cleanup_pins()
-
-    last_zone_check = time.ticks_ms()
-    last_program_check = time.ticks_ms()
-    last_send_status = time.ticks_ms()
-    last_keep_alive = time.time()
-
+    if not timezone.time_valid():
+        timezone.restore_time()
+    ctrl.start_float_monitoring()
+    history.start(ctrl.get_float_switches())
+    ctrl.transition_listeners.append(history.on_zone_transition)
+    runtime.start()
+    ctrl.transition_listeners.append(runtime.on_zone_transition)
+    notify.load_notify_encodings()
+    metrics.enable(METRICS_ENABLED)
+    memory.tune_gc()
+    saved, source = state.load()
+    start_trace(saved)
+    restore_state(saved, source)
+
+    # The scheduler and NTP get their first turn on the first tick
+    ms_start = time.ticks_ms()
+    last_zone_check = ms_start
+    last_program_check = time.ticks_add(ms_start, -CHECK_PROGRAMS_INTERVAL)
+    last_clock_sync = time.ticks_add(ms_start, -NTP_RETRY_INTERVAL)
+    last_metrics = ms_start
+    last_keep_alive = ms_start
+    last_log_flush = ms_start
+    loop_period_us = int(SLEEP_INTERVAL * 1000000)
+
+    if watchdog.reset_cause() == "watchdog":
+        log.warning("Reset by the hardware watchdog")
+    watchdog.start(on_hang=ctrl.close_valves)
+
+    # One loop for everything: control runs every iteration whatever the link
+    # state, the network advances at most one step per iteration
     while True:
         try:
-            if not connect_to_mqtt():
-                print("Failed to connect to MQTT, retrying...")
-                time.sleep(MQTT_RETRY_INTERVAL)
-                continue
-
-            while True:
-                current_time = time.time()
-                ms_now = time.ticks_ms()
-
-                mqtt_client.check_msg()
-
-                if time.ticks_diff(ms_now, last_zone_check) >= ZONE_CHECK_INTERVAL:
-                    check_zone_timeout()
-                    last_zone_check = ms_now
-
-                if (
-                    time.ticks_diff(ms_now, last_program_check)
-                    >= CHECK_PROGRAMS_INTERVAL
-                ):
-                    check_and_run_programs()
-                    last_program_check = ms_now
-
-                if status_requested:
-                    if (
-                        time.ticks_diff(ms_now, last_send_status)
-                        >= STATUS_SEND_INTERVAL
-                    ):
-                        send_irrigation_status()
-                        last_send_status = ms_now
-                    if current_time >= status_end_time:
-                        status_requested = False
-                        print("Status request timeout")
-
-                if current_time - last_keep_alive >= KEEP_ALIVE_INTERVAL:
-                    keep_connection_active()
-                    last_keep_alive = current_time
-
-                time.sleep(SLEEP_INTERVAL)
+            ms_now = time.ticks_ms()
+            metrics.mark_loop(loop_period_us)
+            loop_start = metrics.start()
 
-        except KeyboardInterrupt:
-            print("Program interrupted by user")
-            break
-
-        except Exception as e:
-            print(f"MQTT communication error: {e}")
+            watchdog.enter("network", NETWORK_STALL_BUDGET_MS)
+            try:
+                network_tick(ms_now)
+            except Exception as e:
+                log.error("MQTT communication error: %s", e)
+                connection_lost(ms_now)
 
-        finally:
+            watchdog.enter("control")
             try:
-                if mqtt_client:
-                    mqtt_client.disconnect()
-                    mqtt_client = None
+                control_tick(ms_now)
             except Exception as e:
-                print(f"Error disconnecting client: {e}")
+                log.error("Control error: %s", e)
+
+            if net_state == "online":
+                watchdog.enter("online")
+                try:
+                    online_tick(ms_now)
+                except Exception as e:
+                    log.error("MQTT communication error: %s", e)
+                    connection_lost(ms_now)
+
+            if time.ticks_diff(ms_now, last_log_flush) >= LOG_FLUSH_INTERVAL:
+                watchdog.enter("flush")
+                # Taken first: a failing flush is retried on the next interval
+                last_log_flush = ms_now
+                log.flush()
+                trace.flush()
+
+            metrics.record("loop", loop_start)
+            watchdog.progress()
+            time.sleep(SLEEP_INTERVAL)
 
-            time.sleep(MQTT_RETRY_INTERVAL)
+        except KeyboardInterrupt:
+            log.info("Program interrupted by user")
+            break
+
+        except Exception as e:
+            # Outside the per-stage handlers (flush, metrics): keep the loop alive
+            log.error("Loop error in %s: %s", watchdog.stage, e)
+            watchdog.progress()
+            time.sleep(SLEEP_INTERVAL)
 
+    watchdog.stop()
+    disconnect_mqtt()
     cleanup_pins()
-    print("Program terminated")
+    # Stopped on purpose: nothing to resume on the next boot
+    state.save()
+    state.flush()
+    history.flush()
+    runtime.flush()
+    timezone.save_time()
+    log.info("Program terminated")
+    log.flush()
+    trace.stop()
 
 
 if __name__ == "__main__":
     try:
         main()
     except Exception as e:
-        print(f"Fatal error: {e}")
+        log.error("Fatal error: %s", e)
         cleanup_pins()
+        log.flush()
+        trace.flush()
         machine.reset()
@@ -7,3 +7,16 @@ SERVER = ""
 PORT = ""
 USER = ""
 PASSWORD = ""
+
+# MQTT TLS Config
+MQTT_SSL = False
+MQTT_CA_FILE = "/ca.pem"  # CA certificate on flash (PEM or DER); "" disables pinning
+
+# Controller id: topics become api/irrigation/<DEVICE_ID>/... so several
+# controllers can share a broker. "" keeps the single-controller topics.
+DEVICE_ID = ""
+
+# Low-water interlock: zones stop and stay blocked while this float switch reads
+# INTERLOCK_LOW_VALUE. "" (default) only monitors the float switches.
+INTERLOCK_SWITCH = ""
+INTERLOCK_LOW_VALUE = 0
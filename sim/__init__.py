@@ -0,0 +1,9 @@
+"""
+Host-side simulation of the controller: runs the unmodified firmware on CPython
+with stand-ins for machine, network, ntptime and usocket, a virtual clock and an
+in-process MQTT broker. Nothing in this package is copied to the board.
+"""
+
+from sim.clock import SimulationEnd, VirtualClock
+from sim.hardware import SimReset
+from sim.harness import Simulation, utc_str
@@ -0,0 +1,306 @@
+"""In-process MQTT 3.1.1 broker stand-in and the usocket module that reaches it.
+
+Only what lib/umqtt.py and the host-side tools use is implemented: CONNECT (with
+last will), SUBSCRIBE, PUBLISH at QoS 0/1 (delivered at QoS 0), PINGREQ and
+DISCONNECT. Packets are routed synchronously, so a reply is readable as soon as
+the request has been written.
+"""
+
+import errno
+import types
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    p = pattern.split("/")
+    t = topic.split("/")
+    for i, part in enumerate(p):
+        if part == "#":
+            return True
+        if i >= len(t) or (part != "+" and part != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+def _encode_len(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        out.append(b | 0x80 if n else b)
+        if not n:
+            return bytes(out)
+
+
+def publish_packet(topic: str, payload: bytes, retain: bool = False) -> bytes:
+    t = topic.encode()
+    body = len(t).to_bytes(2, "big") + t + payload
+    return bytes([0x30 | retain]) + _encode_len(len(body)) + body
+
+
+class Broker:
+    def __init__(self, clock):
+        self.clock = clock
+        self.up = True
+        self.retained = {}
+        self._sessions = []
+        # (unix time, topic, payload, sender client id) for every routed publish
+        self.log = []
+
+    def route(self, topic: str, payload: bytes, retain: bool, sender: str) -> None:
+        self.log.append((self.clock.unix_now(), topic, payload, sender))
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        for session in list(self._sessions):
+            if session.wants(topic):
+                session.deliver(topic, payload, False)
+
+    def client(self, client_id: str = "host") -> "HostClient":
+        return HostClient(self, client_id)
+
+    def stop(self) -> None:
+        """Takes the broker down: every session is dropped and new connects fail."""
+        self.up = False
+        for session in list(self._sessions):
+            session.drop()
+
+    def start(self) -> None:
+        self.up = True
+
+    def _attach(self, session) -> None:
+        self._sessions.append(session)
+        for topic, payload in self.retained.items():
+            if session.wants(topic):
+                session.deliver(topic, payload, True)
+
+    def _detach(self, session, graceful: bool) -> None:
+        if session in self._sessions:
+            self._sessions.remove(session)
+        will = session.will
+        session.will = None
+        if will and not graceful:
+            self.route(will[0], will[1], will[2], session.client_id)
+
+
+class _Session:
+    client_id = ""
+    will = None
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.filters = []
+
+    def wants(self, topic: str) -> bool:
+        for f in self.filters:
+            if topic_matches(f, topic):
+                return True
+        return False
+
+
+class HostClient(_Session):
+    """A client living on the host side: callbacks run synchronously on delivery."""
+
+    def __init__(self, broker, client_id: str):
+        super().__init__(broker)
+        self.client_id = client_id
+        self._callbacks = []
+        broker._sessions.append(self)
+
+    def subscribe(self, pattern: str, callback) -> None:
+        """callback(topic: str, payload: bytes) for every message matching pattern."""
+        self.filters.append(pattern)
+        self._callbacks.append((pattern, callback))
+        for topic, payload in self.broker.retained.items():
+            if topic_matches(pattern, topic):
+                callback(topic, payload)
+
+    def publish(self, topic: str, payload, retain: bool = False) -> None:
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.broker.route(topic, bytes(payload), retain, self.client_id)
+
+    def deliver(self, topic: str, payload: bytes, retain: bool) -> None:
+        for pattern, callback in self._callbacks:
+            if topic_matches(pattern, topic):
+                callback(topic, payload)
+
+    def drop(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.broker._detach(self, True)
+
+
+class DeviceSocket(_Session):
+    """A usocket.socket() connected to the broker; the broker parses what is written."""
+
+    def __init__(self, broker):
+        super().__init__(broker)
+        self._in = bytearray()
+        self._out = bytearray()
+        self._blocking = True
+        self._connected = False
+        self._closed = False
+        self.timeout = None
+
+    # -- socket API -----------------------------------------------------------
+
+    def connect(self, addr) -> None:
+        if not self.broker.up:
+            raise OSError(errno.ECONNREFUSED)
+        self._connected = True
+
+    def setblocking(self, flag: bool) -> None:
+        self._blocking = flag
+
+    def settimeout(self, seconds) -> None:
+        self.timeout = seconds
+        self._blocking = seconds is None or seconds > 0
+
+    def read(self, n: int = -1):
+        if not self._in:
+            if self._closed:
+                return b""
+            if not self._blocking:
+                return None
+            # Nothing will ever arrive while the firmware is blocked in read()
+            raise OSError(errno.ETIMEDOUT)
+        if n < 0:
+            n = len(self._in)
+        data = bytes(self._in[:n])
+        del self._in[:n]
+        return data
+
+    recv = read
+
+    def readinto(self, buf, n: int = -1) -> int:
+        if n < 0:
+            n = len(buf)
+        data = self.read(n)
+        if data is None:
+            return None
+        buf[: len(data)] = data
+        return len(data)
+
+    def write(self, buf, n: int = -1) -> int:
+        if self._closed:
+            raise OSError(errno.ECONNRESET)
+        if isinstance(buf, str):
+            # MicroPython's buffer protocol covers str, and umqtt relies on it
+            buf = buf.encode()
+        if n < 0:
+            n = len(buf)
+        self._out += bytes(buf[:n])
+        self._parse()
+        return n
+
+    send = write
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self.broker._detach(self, False)
+
+    # -- broker side ----------------------------------------------------------
+
+    def deliver(self, topic: str, payload: bytes, retain: bool) -> None:
+        self._in += publish_packet(topic, payload, retain)
+
+    def drop(self) -> None:
+        self._closed = True
+        self._in.clear()
+        self.broker._detach(self, False)
+
+    def _parse(self) -> None:
+        while len(self._out) >= 2:
+            length = 0
+            shift = 0
+            i = 1
+            while True:
+                if i >= len(self._out):
+                    return
+                b = self._out[i]
+                length |= (b & 0x7F) << shift
+                shift += 7
+                i += 1
+                if not b & 0x80:
+                    break
+            if len(self._out) < i + length:
+                return
+            op = self._out[0]
+            body = bytes(self._out[i : i + length])
+            del self._out[: i + length]
+            self._handle(op, body)
+
+    def _handle(self, op: int, body: bytes) -> None:
+        kind = op & 0xF0
+        if kind == 0x10:
+            self._on_connect(body)
+        elif kind == 0x30:
+            tlen = int.from_bytes(body[:2], "big")
+            topic = body[2 : 2 + tlen].decode()
+            pos = 2 + tlen
+            if op & 6:
+                pid = body[pos : pos + 2]
+                pos += 2
+                self._in += b"\x40\x02" + pid
+            self.broker.route(topic, body[pos:], bool(op & 1), self.client_id)
+        elif kind == 0x80:
+            pid = body[:2]
+            pos = 2
+            codes = bytearray()
+            topics = []
+            while pos < len(body):
+                tlen = int.from_bytes(body[pos : pos + 2], "big")
+                topics.append(body[pos + 2 : pos + 2 + tlen].decode())
+                pos += 2 + tlen + 1
+                codes.append(0)
+            self._in += bytes([0x90, 2 + len(codes)]) + pid + bytes(codes)
+            for t in topics:
+                self.filters.append(t)
+                for topic, payload in self.broker.retained.items():
+                    if topic_matches(t, topic):
+                        self.deliver(topic, payload, True)
+        elif kind == 0xC0:
+            self._in += b"\xd0\x00"
+        elif kind == 0xE0:
+            self.will = None
+            self._closed = True
+            self.broker._detach(self, True)
+
+    def _on_connect(self, body: bytes) -> None:
+        pos = 2 + int.from_bytes(body[:2], "big") + 1
+        flags = body[pos]
+        pos += 3
+
+        def field():
+            nonlocal pos
+            n = int.from_bytes(body[pos : pos + 2], "big")
+            value = body[pos + 2 : pos + 2 + n]
+            pos += 2 + n
+            return value
+
+        self.client_id = field().decode()
+        if flags & 0x04:
+            topic = field().decode()
+            self.will = (topic, field(), bool(flags & 0x20))
+        self._in += b"\x20\x02\x00\x00"
+        self.broker._attach(self)
+
+
+def usocket_module(broker) -> types.ModuleType:
+    mod = types.ModuleType("usocket")
+    mod.AF_INET = 2
+    mod.SOCK_STREAM = 1
+
+    def socket(*args, **kwargs):
+        return DeviceSocket(broker)
+
+    def getaddrinfo(host, port, *args):
+        return [(mod.AF_INET, mod.SOCK_STREAM, 0, "", (host, port))]
+
+    mod.socket = socket
+    mod.getaddrinfo = getaddrinfo
+    return mod
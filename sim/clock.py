@@ -0,0 +1,173 @@
+"""Virtual clock driving the firmware's view of time.time(), ticks_* and sleep()."""
+
+import heapq
+import types
+from datetime import datetime, timedelta
+
+# MicroPython on the ESP32 counts time.time() and localtime() from 2000-01-01
+EPOCH = datetime(2000, 1, 1)
+EPOCH_OFFSET = 946684800
+TICKS_PERIOD = 1 << 30
+TICKS_HALF = TICKS_PERIOD // 2
+
+
+class SimulationEnd(BaseException):
+    """Raised from sleep() when the run deadline is reached.
+
+    Derives from BaseException so the firmware's `except Exception` handlers let it
+    through, the same way they let KeyboardInterrupt through.
+    """
+
+
+def ticks_diff(a: int, b: int) -> int:
+    return ((a - b + TICKS_HALF) % TICKS_PERIOD) - TICKS_HALF
+
+
+def ticks_add(a: int, delta: int) -> int:
+    return (a + delta) % TICKS_PERIOD
+
+
+_date_cache = {}
+
+
+def _to_tuple(secs: int) -> tuple:
+    days, rem = divmod(secs, 86400)
+    date = _date_cache.get(days)
+    if date is None:
+        dt = EPOCH + timedelta(days=days)
+        date = (dt.year, dt.month, dt.day, dt.weekday(), dt.timetuple().tm_yday)
+        _date_cache[days] = date
+    hour, rem = divmod(rem, 3600)
+    minute, second = divmod(rem, 60)
+    return (date[0], date[1], date[2], hour, minute, second, date[3], date[4])
+
+
+def _from_tuple(t: tuple) -> int:
+    year, month, day, hour, minute, second = t[:6]
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    dt = datetime(year, month, 1) + timedelta(
+        days=day - 1, hours=hour, minutes=minute, seconds=second
+    )
+    return int((dt - EPOCH).total_seconds())
+
+
+class VirtualClock:
+    """
+    Simulated time. 'true' time is seconds since 2000-01-01 UTC; the device RTC
+    reads true time plus rtc_offset (non-zero until NTP sets it). sleep() advances
+    time and runs every event scheduled up to the new instant.
+    """
+
+    def __init__(self, start, rtc_set: bool = True):
+        # A UTC tuple, or seconds since 2000 as read from a device's time.time()
+        if isinstance(start, tuple):
+            start = _from_tuple(start)
+        self.true_now = float(start)
+        self.rtc_offset = 0.0 if rtc_set else -self.true_now
+        self.mono = 0.0
+        self.deadline = None
+        self._events = []
+        self._seq = 0
+        self._in_event = False
+
+    # -- scheduling -----------------------------------------------------------
+
+    def at(self, when: float, fn, *args) -> None:
+        """Runs fn(*args) when true time reaches 'when' (seconds since 2000 UTC)."""
+        self._seq += 1
+        heapq.heappush(self._events, (when, self._seq, fn, args))
+
+    def after(self, delay: float, fn, *args) -> None:
+        self.at(self.true_now + delay, fn, *args)
+
+    def advance(self, seconds: float) -> None:
+        target = self.true_now + seconds
+        if self.deadline is not None and target >= self.deadline:
+            target = self.deadline
+        if not self._in_event:
+            while self._events and self._events[0][0] <= target:
+                when, _, fn, args = heapq.heappop(self._events)
+                self._move(max(when, self.true_now))
+                self._in_event = True
+                try:
+                    fn(*args)
+                finally:
+                    self._in_event = False
+        self._move(target)
+        if (
+            self.deadline is not None
+            and self.true_now >= self.deadline
+            and not self._in_event
+        ):
+            raise SimulationEnd()
+
+    def _move(self, when: float) -> None:
+        if when > self.true_now:
+            self.mono += when - self.true_now
+            self.true_now = when
+
+    # -- device view ----------------------------------------------------------
+
+    def rtc_now(self) -> float:
+        return self.true_now + self.rtc_offset
+
+    def set_rtc(self, secs: float) -> None:
+        self.rtc_offset = secs - self.true_now
+
+    def unix_now(self) -> float:
+        return self.true_now + EPOCH_OFFSET
+
+    def time(self) -> int:
+        return int(self.rtc_now())
+
+    def time_ns(self) -> int:
+        return int(self.rtc_now() * 1e9)
+
+    def ticks_ms(self) -> int:
+        return int(self.mono * 1000) % TICKS_PERIOD
+
+    def ticks_us(self) -> int:
+        return int(self.mono * 1000000) % TICKS_PERIOD
+
+    def ticks_cpu(self) -> int:
+        return self.ticks_us()
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+
+    def sleep_ms(self, ms: int) -> None:
+        self.advance(ms / 1000)
+
+    def sleep_us(self, us: int) -> None:
+        self.advance(us / 1000000)
+
+    def localtime(self, secs=None) -> tuple:
+        return _to_tuple(int(self.rtc_now() if secs is None else secs))
+
+    def mktime(self, t: tuple) -> int:
+        return _from_tuple(t)
+
+    def module(self, real: types.ModuleType) -> types.ModuleType:
+        """A 'time' module for the firmware; other attributes are copied from 'real'."""
+        mod = types.ModuleType("time")
+        mod.__dict__.update(
+            {k: getattr(real, k) for k in dir(real) if not k.startswith("__")}
+        )
+        for name in (
+            "time",
+            "time_ns",
+            "ticks_ms",
+            "ticks_us",
+            "ticks_cpu",
+            "sleep",
+            "sleep_ms",
+            "sleep_us",
+            "localtime",
+            "mktime",
+        ):
+            setattr(mod, name, getattr(self, name))
+        mod.gmtime = self.localtime
+        mod.ticks_diff = ticks_diff
+        mod.ticks_add = ticks_add
+        return mod
@@ -0,0 +1,63 @@
+"""Maps the firmware's root-level flash files ("/programs.json") into a host directory."""
+
+import builtins
+import os
+
+_FS_FUNCS = ("stat", "remove", "rename", "listdir", "mkdir", "rmdir")
+
+
+class Flash:
+    def __init__(self, root: str):
+        self.root = root
+        self._saved = None
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, p):
+        """Host path for a flash path; anything that is not '/<name>' passes through."""
+        if isinstance(p, str) and p.startswith("/") and "/" not in p[1:]:
+            return os.path.join(self.root, p[1:]) if p != "/" else self.root
+        return p
+
+    def read(self, name: str, mode: str = "r"):
+        with self._open(self.path(name), mode) as f:
+            return f.read()
+
+    def write(self, name: str, data, mode: str = "w") -> None:
+        with self._open(self.path(name), mode) as f:
+            f.write(data)
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    @property
+    def _open(self):
+        return self._saved["open"] if self._saved else builtins.open
+
+    def install(self) -> None:
+        if self._saved is not None:
+            return
+        saved = {"open": builtins.open}
+        for name in _FS_FUNCS:
+            saved[name] = getattr(os, name)
+        self._saved = saved
+
+        def open_(file, *args, **kwargs):
+            return saved["open"](self.path(file), *args, **kwargs)
+
+        def wrap(fn):
+            def wrapper(*paths, **kwargs):
+                return fn(*[self.path(p) for p in paths], **kwargs)
+
+            return wrapper
+
+        builtins.open = open_
+        for name in _FS_FUNCS:
+            setattr(os, name, wrap(saved[name]))
+
+    def uninstall(self) -> None:
+        if self._saved is None:
+            return
+        builtins.open = self._saved["open"]
+        for name in _FS_FUNCS:
+            setattr(os, name, self._saved[name])
+        self._saved = None
@@ -0,0 +1,161 @@
+"""Several simulated controllers on one broker, advancing through time together."""
+
+import random
+import threading
+
+from sim.broker import Broker
+from sim.clock import SimulationEnd, VirtualClock
+from sim.harness import Simulation
+
+
+class _DeviceClock(VirtualClock):
+    """A controller's clock that never runs ahead of the fleet."""
+
+    def __init__(self, fleet: "Fleet", start):
+        super().__init__(start)
+        self.fleet = fleet
+        self.sim = None
+
+    def advance(self, seconds: float) -> None:
+        target = self.true_now + seconds
+        barrier = self.fleet.clock
+        while not self._in_event and target > barrier.true_now:
+            # Catches up (raising SimulationEnd at the deadline), then waits a turn
+            super().advance(max(0.0, barrier.true_now - self.true_now))
+            self.fleet._yield(self.sim)
+        super().advance(target - self.true_now)
+
+
+class Fleet:
+    """
+    Controllers with their own flash, board and clock sharing one broker. Each
+    runs its firmware in a thread of its own, but only one runs at a time: the
+    fleet moves time forward by 'quantum' and lets every controller catch up to it
+    in turn, swapping its firmware modules in and out.
+
+        fleet = Fleet(["north", "south"], start=(2026, 6, 1, 3, 50, 0))
+        fleet["north"].set_programs([...])
+        fleet.host.subscribe("api/notification/irrigation/+/zone", on_zone)
+        fleet.run(seconds=3600)
+
+    Each controller gets its name as DEVICE_ID. fleet.at() schedules host-side
+    events (a coordinator tick, a scenario step) on the fleet clock; controller
+    events go through fleet[name].at() as usual.
+    """
+
+    def __init__(
+        self,
+        device_ids: list,
+        start=(2026, 6, 1, 4, 0, 0),
+        loop_interval: float = 1.0,
+        quantum: float = 1.0,
+        quiet: bool = True,
+        seed: int = 0,
+    ):
+        self.clock = VirtualClock(start)
+        self.start_time = self.clock.true_now
+        self.broker = Broker(self.clock)
+        self.host = self.broker.client("fleet-host")
+        self.quantum = quantum
+        self.seed = seed
+        self.devices = {}
+        for device_id in device_ids:
+            clock = _DeviceClock(self, start)
+            sim = Simulation(
+                loop_interval=loop_interval,
+                quiet=quiet,
+                seed=seed,
+                secrets={"DEVICE_ID": device_id},
+                clock=clock,
+                broker=self.broker,
+            )
+            clock.sim = sim
+            self.devices[device_id] = sim
+        self._yielded = threading.Event()
+        self._turns = {}
+        self._errors = {}
+
+    def __getitem__(self, device_id: str) -> Simulation:
+        return self.devices[device_id]
+
+    # -- scenario helpers -----------------------------------------------------
+
+    def when(self, t) -> float:
+        return next(iter(self.devices.values())).when(t)
+
+    def unix(self, t) -> float:
+        return next(iter(self.devices.values())).unix(t)
+
+    def at(self, t, fn, *args) -> None:
+        self.clock.at(self.when(t), fn, *args)
+
+    def every(self, interval: float, fn, *args) -> None:
+        """Runs fn(*args) every 'interval' seconds on the fleet clock, from now."""
+
+        def repeat():
+            fn(*args)
+            self.clock.after(interval, repeat)
+
+        self.clock.after(0, repeat)
+
+    # -- running --------------------------------------------------------------
+
+    def run(self, seconds: float = None, until=None) -> "Fleet":
+        """Runs every controller until the deadline; errors are raised afterwards."""
+        if until is not None:
+            deadline = self.when(until)
+        elif seconds is not None:
+            deadline = self.clock.true_now + seconds
+        else:
+            raise ValueError("run() needs seconds or until")
+
+        random.seed(self.seed)
+        running = []
+        for sim in self.devices.values():
+            sim.clock.deadline = deadline
+            self._turns[sim] = threading.Event()
+            thread = threading.Thread(target=self._device_main, args=(sim,))
+            thread.daemon = True
+            thread.start()
+            running.append(sim)
+
+        while running:
+            if self.clock.true_now < deadline:
+                self.clock.advance(min(self.quantum, deadline - self.clock.true_now))
+            for sim in list(running):
+                self._turn(sim)
+                if sim in self._errors:
+                    running.remove(sim)
+
+        for sim, error in self._errors.items():
+            if not isinstance(error, SimulationEnd):
+                raise error
+        return self
+
+    def _turn(self, sim: Simulation) -> None:
+        sim._resume()
+        try:
+            self._turns[sim].set()
+            self._yielded.wait()
+            self._yielded.clear()
+        finally:
+            sim._suspend()
+
+    def _yield(self, sim: Simulation) -> None:
+        """Called from a controller's thread: hands control back to the fleet."""
+        turn = self._turns[sim]
+        self._yielded.set()
+        turn.wait()
+        turn.clear()
+
+    def _device_main(self, sim: Simulation) -> None:
+        turn = self._turns[sim]
+        turn.wait()
+        turn.clear()
+        try:
+            sim._main_loop()
+            self._errors[sim] = SimulationEnd()
+        except BaseException as e:
+            self._errors[sim] = e
+        finally:
+            self._yielded.set()
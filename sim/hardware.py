@@ -0,0 +1,306 @@
+"""Stand-ins for the machine, network, ntptime and micropython modules."""
+
+import types
+
+
+class SimReset(BaseException):
+    """Raised by machine.reset(); the harness treats it as the end of a boot."""
+
+
+class Board:
+    """
+    Hardware state shared by the fake modules: pin levels with a transition log,
+    the WiFi link and NTP reachability.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.levels = {}
+        self.pins = {}
+        # (unix time, pin id, value) for every output change
+        self.transitions = []
+        self.wifi_up = True
+        self.wifi_delay = 3.0
+        self.ntp_up = True
+        self.resets = 0
+        # Incremented on every boot; timers and the watchdog die with the boot
+        # that started them
+        self.boot_id = 0
+        self.rtc_memory = b""
+        self.wdt_timeout_ms = None
+        self.wdt_fed_ms = 0
+        self._wlan_connect_at = None
+
+    # -- pins -----------------------------------------------------------------
+
+    def set_input(self, pin_id: int, value: int) -> None:
+        """Drives an input pin, firing its irq handler on a matching edge."""
+        value = 1 if value else 0
+        old = self.levels.get(pin_id, 1)
+        self.levels[pin_id] = value
+        pin = self.pins.get(pin_id)
+        if pin is None or pin._handler is None or old == value:
+            return
+        edge = Pin.IRQ_RISING if value else Pin.IRQ_FALLING
+        if pin._trigger & edge:
+            pin._handler(pin)
+
+    def level(self, pin_id: int) -> int:
+        return self.levels.get(pin_id, 0)
+
+    def _write(self, pin_id: int, value: int) -> None:
+        value = 1 if value else 0
+        if self.levels.get(pin_id) != value:
+            self.transitions.append((self.clock.unix_now(), pin_id, value))
+        self.levels[pin_id] = value
+
+    # -- WiFi -----------------------------------------------------------------
+
+    def wlan_connected(self) -> bool:
+        at = self._wlan_connect_at
+        if at is not None and self.wifi_up and self.clock.true_now >= at:
+            return True
+        return False
+
+    def drop_wifi(self) -> None:
+        self.wifi_up = False
+        self._wlan_connect_at = None
+
+    def restore_wifi(self) -> None:
+        self.wifi_up = True
+
+    # -- module factories -----------------------------------------------------
+
+    def modules(self) -> dict:
+        board = self
+
+        machine = types.ModuleType("machine")
+
+        class BoundPin(Pin):
+            _board = board
+
+        class BoundRTC(RTC):
+            _board = board
+
+        class BoundWDT(WDT):
+            _board = board
+
+        class BoundTimer(Timer):
+            _board = board
+
+        def reset():
+            board.resets += 1
+            raise SimReset()
+
+        machine.Pin = BoundPin
+        machine.RTC = BoundRTC
+        machine.WDT = BoundWDT
+        machine.Timer = BoundTimer
+        machine.reset = reset
+        machine.soft_reset = reset
+        machine.freq = lambda *args: 240000000
+        machine.unique_id = lambda: b"\x24\x0a\xc4\x51\x7e\x01"
+        machine.reset_cause = lambda: machine.PWRON_RESET
+        machine.PWRON_RESET = 1
+        machine.HARD_RESET = 2
+        machine.WDT_RESET = 3
+        machine.DEEPSLEEP_RESET = 4
+        machine.SOFT_RESET = 5
+        machine.idle = lambda: None
+
+        network = types.ModuleType("network")
+        network.STA_IF = 0
+        network.AP_IF = 1
+        network.STAT_IDLE = 1000
+        network.STAT_CONNECTING = 1001
+        network.STAT_GOT_IP = 1010
+
+        class BoundWLAN(WLAN):
+            _board = board
+
+        network.WLAN = BoundWLAN
+
+        ntptime = types.ModuleType("ntptime")
+        ntptime.host = "pool.ntp.org"
+
+        def settime():
+            if not (board.ntp_up and board.wlan_connected()):
+                raise OSError(110)
+            clock = board.clock
+            clock.set_rtc(clock.true_now)
+
+        ntptime.settime = settime
+
+        micropython = types.ModuleType("micropython")
+        micropython.const = lambda x: x
+        micropython.schedule = lambda fn, arg: fn(arg)
+        micropython.alloc_emergency_exception_buf = lambda size: None
+        micropython.mem_info = lambda *args: None
+
+        return {
+            "machine": machine,
+            "network": network,
+            "ntptime": ntptime,
+            "micropython": micropython,
+        }
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    _board = None
+
+    def __init__(self, pin_id: int, mode: int = -1, pull: int = -1, value=None):
+        self.id = pin_id
+        self.mode = mode
+        self._handler = None
+        self._trigger = 0
+        self._board.pins[pin_id] = self
+        if mode == Pin.IN:
+            self._board.levels.setdefault(pin_id, 1)
+        elif value is not None:
+            self._board._write(pin_id, value)
+        else:
+            self._board.levels.setdefault(pin_id, 0)
+
+    def value(self, v=None):
+        if v is None:
+            return self._board.level(self.id)
+        if self.mode != Pin.IN:
+            self._board._write(self.id, v)
+
+    def on(self) -> None:
+        self.value(1)
+
+    def off(self) -> None:
+        self.value(0)
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+    def irq(self, handler=None, trigger=IRQ_RISING | IRQ_FALLING, **kwargs):
+        self._handler = handler
+        self._trigger = trigger
+
+    def __repr__(self) -> str:
+        return "Pin(%d)" % self.id
+
+
+class RTC:
+    _board = None
+
+    def datetime(self, dt: tuple = None):
+        clock = self._board.clock
+        if dt is None:
+            y, mo, d, h, mi, s, wd, _ = clock.localtime()
+            return (y, mo, d, wd, h, mi, s, 0)
+        y, mo, d, _, h, mi, s = dt[:7]
+        clock.set_rtc(clock.mktime((y, mo, d, h, mi, s, 0, 0)))
+
+    def init(self, dt: tuple) -> None:
+        self.datetime(dt)
+
+    def memory(self, data: bytes = None):
+        if data is None:
+            return self._board.rtc_memory
+        if len(data) > 2048:
+            raise ValueError("RTC memory is limited to 2048 bytes")
+        self._board.rtc_memory = bytes(data)
+
+
+class WDT:
+    _board = None
+
+    def __init__(self, id: int = 0, timeout: int = 5000):
+        board = self._board
+        board.wdt_timeout_ms = timeout
+        board.wdt_fed_ms = board.clock.mono * 1000
+        self._boot_id = board.boot_id
+        board.clock.after(timeout / 1000, self._check)
+
+    def feed(self) -> None:
+        self._board.wdt_fed_ms = self._board.clock.mono * 1000
+
+    def _check(self) -> None:
+        board = self._board
+        if self._boot_id != board.boot_id:
+            return
+        starved = board.clock.mono * 1000 - board.wdt_fed_ms
+        if starved >= board.wdt_timeout_ms:
+            board.resets += 1
+            raise SimReset("watchdog")
+        board.clock.after((board.wdt_timeout_ms - starved) / 1000, self._check)
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    _board = None
+
+    def __init__(self, id: int = 0, **kwargs):
+        self._gen = 0
+        self._boot_id = self._board.boot_id
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode: int = PERIODIC, period: int = -1, callback=None, **kwargs):
+        self._gen += 1
+        self._board.clock.after(
+            period / 1000, self._fire, self._gen, mode, period, callback
+        )
+
+    def _fire(self, gen: int, mode: int, period: int, callback) -> None:
+        if gen != self._gen or self._boot_id != self._board.boot_id:
+            return
+        if mode == Timer.PERIODIC:
+            self._board.clock.after(
+                period / 1000, self._fire, gen, mode, period, callback
+            )
+        if callback is not None:
+            callback(self)
+
+    def deinit(self) -> None:
+        self._gen += 1
+
+
+class WLAN:
+    _board = None
+
+    def __init__(self, interface: int = 0):
+        self.interface = interface
+
+    def active(self, on: bool = None):
+        return True
+
+    def connect(self, ssid: str = None, key: str = None, **kwargs) -> None:
+        board = self._board
+        if board._wlan_connect_at is None:
+            board._wlan_connect_at = board.clock.true_now + board.wifi_delay
+
+    def disconnect(self) -> None:
+        self._board._wlan_connect_at = None
+
+    def isconnected(self) -> bool:
+        return self._board.wlan_connected()
+
+    def status(self, param: str = None):
+        if param == "rssi":
+            return -60
+        if self.isconnected():
+            return 1010
+        return 1001 if self._board._wlan_connect_at is not None else 1000
+
+    def ifconfig(self, config: tuple = None):
+        return ("192.168.1.50", "255.255.255.0", "192.168.1.1", "192.168.1.1")
+
+    def config(self, *args, **kwargs):
+        if args and args[0] == "mac":
+            return b"\x24\x0a\xc4\x51\x7e\x01"
+        return None
@@ -0,0 +1,357 @@
+"""Boots the unmodified firmware on CPython against the simulated board and broker."""
+
+import contextlib
+import io
+import json
+import os
+import random
+import struct
+import sys
+import tempfile
+import time as _real_time
+import types
+
+from sim.broker import Broker, usocket_module
+from sim.clock import EPOCH_OFFSET, SimulationEnd, VirtualClock, _from_tuple
+from sim.flash import Flash
+from sim.hardware import Board, SimReset
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that belong to the firmware and are re-imported on every simulated boot
+FIRMWARE_MODULES = ("main", "boot", "handlers", "lib", "utils")
+FIRMWARE_PREFIXES = ("irrigation_", "handlers.", "lib.", "utils.")
+
+ZONE_PINS = {16: "zone_1", 17: "zone_2", 18: "zone_3", 25: "zone_4"}
+ZONE_PINS.update({26: "zone_5", 27: "zone_6", 32: "zone_7", 33: "zone_8"})
+MAIN_VALVE_PIN = 19
+FLOAT_PINS = {"float_switch_1": 23, "float_switch_2": 34, "float_switch_3": 35}
+
+HEAP_TOTAL = 118000
+
+SECRETS = {
+    "WLAN_SSID": "sim-wifi",
+    "WLAN_PASSWORD": "sim",
+    "SERVER": "broker.sim",
+    "PORT": "1883",
+    "USER": "",
+    "PASSWORD": "",
+    "MQTT_SSL": False,
+    "MQTT_CA_FILE": "",
+    "DEVICE_ID": "",
+    "INTERLOCK_SWITCH": "",
+    "INTERLOCK_LOW_VALUE": 0,
+}
+
+
+class Simulation:
+    """
+    One simulated controller. Flash files, RTC memory and the broker survive
+    reboots; firmware modules are imported fresh on every boot.
+
+        sim = Simulation(start=(2026, 6, 1, 4, 0, 0), loop_interval=1.0)
+        sim.set_programs([...])
+        sim.send("api/irrigation/zone", {...}, at=(2026, 6, 1, 9, 0, 0))
+        sim.run(days=7)
+        assert sim.zone_runs()[0]["zone"] == "zone_1"
+
+    Times given as tuples are UTC; numbers are seconds after the start. The start
+    itself may also be a number: seconds since 2000 UTC, as the device counts them.
+    """
+
+    def __init__(
+        self,
+        start=(2026, 6, 1, 4, 0, 0),
+        rtc_set: bool = True,
+        loop_interval: float = None,
+        quiet: bool = True,
+        flash_dir: str = None,
+        seed: int = 0,
+        secrets: dict = None,
+        boot: bool = True,
+        clock: VirtualClock = None,
+        broker: Broker = None,
+    ):
+        # A fleet (sim.fleet) passes each controller its own clock and a shared broker
+        self.clock = clock or VirtualClock(start, rtc_set)
+        self.start_time = self.clock.true_now
+        self.board = Board(self.clock)
+        self.broker = broker or Broker(self.clock)
+        self.flash = Flash(flash_dir or tempfile.mkdtemp(prefix="irrigation-sim-"))
+        self.loop_interval = loop_interval
+        self.quiet = quiet
+        self.seed = seed
+        self.secrets = dict(SECRETS, **(secrets or {}))
+        self.run_boot = boot
+        self.heap_free = 92000
+        self.console = io.StringIO()
+        self.boots = 0
+        self.firmware = {}
+        self.on_boot = []
+        # (unix time, topic, payload) for every notification the device published
+        self.notifications = []
+        self.host = self.broker.client("sim-host")
+        device_id = self.secrets.get("DEVICE_ID")
+        if device_id:
+            self.host.subscribe(
+                "api/notification/irrigation/%s/#" % device_id, self._record
+            )
+        else:
+            self.host.subscribe("api/notification/#", self._record)
+        self._saved_modules = None
+        # Firmware modules of this controller while another one runs (sim.fleet)
+        self._modules = {}
+        self._stdout = None
+        self._gc_threshold = -1
+
+    # -- scenario helpers -----------------------------------------------------
+
+    def when(self, t) -> float:
+        """Clock time (seconds since 2000 UTC) for a UTC tuple or an offset from start."""
+        if isinstance(t, tuple):
+            return float(_from_tuple(t))
+        return self.start_time + t
+
+    def unix(self, t) -> float:
+        return self.when(t) + EPOCH_OFFSET
+
+    def at(self, t, fn, *args) -> None:
+        self.clock.at(self.when(t), fn, *args)
+
+    def publish(self, topic: str, payload) -> None:
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
+        self.host.publish(topic, payload)
+
+    def send(self, topic: str, payload, at=None) -> None:
+        """Publishes now, or when the clock reaches 'at'."""
+        if at is None:
+            self.publish(topic, payload)
+        else:
+            self.at(at, self.publish, topic, payload)
+
+    def set_input(self, name_or_pin, value: int, at=None) -> None:
+        pin = FLOAT_PINS.get(name_or_pin, name_or_pin)
+        if at is None:
+            self.board.set_input(pin, value)
+        else:
+            self.at(at, self.board.set_input, pin, value)
+
+    def reset(self, at=None, power_loss: bool = False) -> None:
+        """
+        Resets the controller now or at 'at', like a watchdog reset. A power loss
+        also clears RTC memory and sets the RTC back to 2000.
+        """
+        if at is not None:
+            self.at(at, self.reset, None, power_loss)
+            return
+        if power_loss:
+            self.board.rtc_memory = b""
+            self.clock.rtc_offset = -self.clock.true_now
+        self.board.resets += 1
+        raise SimReset()
+
+    def set_programs(self, programs: list) -> None:
+        """Writes programs.json before boot; ids are assigned in order if missing."""
+        out = []
+        for i, prog in enumerate(programs, 1):
+            prog = dict(prog)
+            prog.setdefault("id", i)
+            prog.setdefault("is_active", True)
+            out.append(prog)
+        next_id = max([p["id"] for p in out] + [0]) + 1
+        self.flash.write(
+            "/programs.json", json.dumps({"next_id": next_id, "programs": out})
+        )
+
+    # -- running --------------------------------------------------------------
+
+    def run(
+        self, seconds: float = None, days: float = None, until=None
+    ) -> "Simulation":
+        """
+        Runs the firmware until the deadline. A machine.reset() reboots it with
+        flash and RTC memory intact; main() returning ends the run early.
+        """
+        if days is not None:
+            seconds = days * 86400
+        if until is not None:
+            self.clock.deadline = self.when(until)
+        elif seconds is not None:
+            self.clock.deadline = self.clock.true_now + seconds
+        else:
+            raise ValueError("run() needs seconds, days or until")
+
+        random.seed(self.seed)
+        self._install()
+        try:
+            with self._output():
+                self._main_loop()
+        finally:
+            self._uninstall()
+        return self
+
+    def _main_loop(self) -> None:
+        while True:
+            try:
+                self._boot()
+                self.firmware["main"].main()
+                break
+            except SimReset:
+                continue
+            except SimulationEnd:
+                break
+
+    def _boot(self) -> None:
+        self.boots += 1
+        self.board.boot_id += 1
+        for name in list(sys.modules):
+            if name in FIRMWARE_MODULES or name.startswith(FIRMWARE_PREFIXES):
+                del sys.modules[name]
+        self.firmware = {}
+        if self.run_boot:
+            self.firmware["boot"] = __import__("boot")
+        main = __import__("main")
+        self.firmware["main"] = main
+        for name in list(sys.modules):
+            if name.startswith(FIRMWARE_PREFIXES) or name.startswith("irrigation_"):
+                self.firmware[name] = sys.modules[name]
+        if self.loop_interval is not None:
+            main.SLEEP_INTERVAL = self.loop_interval
+        for fn in self.on_boot:
+            fn(self)
+
+    @contextlib.contextmanager
+    def _output(self):
+        if self.quiet:
+            with contextlib.redirect_stdout(self.console):
+                yield
+        else:
+            yield
+
+    def _install(self) -> None:
+        fakes = self.board.modules()
+        fakes["time"] = self.clock.module(_real_time)
+        fakes["gc"] = self._gc_module()
+        fakes["usocket"] = usocket_module(self.broker)
+        fakes["ustruct"] = struct
+        fakes["secrets"] = self._secrets_module()
+        self._saved_modules = {name: sys.modules.get(name) for name in fakes}
+        sys.modules.update(fakes)
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)
+        self.flash.install()
+
+    def _uninstall(self) -> None:
+        self.flash.uninstall()
+        for name, mod in (self._saved_modules or {}).items():
+            if mod is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = mod
+        self._saved_modules = None
+
+    def _resume(self) -> None:
+        """Makes this controller the one the firmware imports see (sim.fleet)."""
+        self._install()
+        sys.modules.update(self._modules)
+        self._modules = {}
+        if self.quiet:
+            self._stdout = sys.stdout
+            sys.stdout = self.console
+
+    def _suspend(self) -> None:
+        if self._stdout is not None:
+            sys.stdout = self._stdout
+            self._stdout = None
+        for name in list(sys.modules):
+            if name in FIRMWARE_MODULES or name.startswith(FIRMWARE_PREFIXES):
+                self._modules[name] = sys.modules.pop(name)
+        self._uninstall()
+
+    def _secrets_module(self) -> types.ModuleType:
+        mod = types.ModuleType("secrets")
+        mod.__dict__.update(self.secrets)
+        return mod
+
+    def _gc_module(self) -> types.ModuleType:
+        sim = self
+        mod = types.ModuleType("gc")
+        mod.collect = lambda: None
+        mod.enable = lambda: None
+        mod.disable = lambda: None
+        mod.isenabled = lambda: True
+        mod.mem_free = lambda: sim.heap_free
+        mod.mem_alloc = lambda: HEAP_TOTAL - sim.heap_free
+
+        def threshold(n: int = None):
+            if n is None:
+                return sim._gc_threshold
+            sim._gc_threshold = n
+
+        mod.threshold = threshold
+        return mod
+
+    # -- observations ---------------------------------------------------------
+
+    def _record(self, topic: str, payload: bytes) -> None:
+        self.notifications.append((self.clock.unix_now(), topic, payload))
+
+    def messages(self, suffix: str = "") -> list:
+        """Notifications whose topic ends with 'suffix' as (unix time, topic, data)."""
+        out = []
+        for t, topic, payload in self.notifications:
+            if not topic.endswith(suffix):
+                continue
+            try:
+                data = json.loads(payload)
+            except ValueError:
+                data = payload
+            out.append((t, topic, data))
+        return out
+
+    def pin_log(self) -> list:
+        """Output transitions as (unix time, pin name, value)."""
+        names = dict(ZONE_PINS)
+        names[MAIN_VALVE_PIN] = "main_valve"
+        return [
+            (t, names.get(pin, "pin_%d" % pin), v)
+            for t, pin, v in self.board.transitions
+        ]
+
+    def zone_runs(self) -> list:
+        """Zone openings reconstructed from the pin log, oldest first."""
+        runs = []
+        open_since = {}
+        for t, pin, value in self.board.transitions:
+            zone = ZONE_PINS.get(pin)
+            if zone is None:
+                continue
+            if value:
+                open_since[zone] = t
+            elif zone in open_since:
+                start = open_since.pop(zone)
+                runs.append(
+                    {"zone": zone, "start": start, "end": t, "duration": t - start}
+                )
+        for zone, start in open_since.items():
+            runs.append({"zone": zone, "start": start, "end": None, "duration": None})
+        runs.sort(key=lambda r: r["start"])
+        return runs
+
+    def check_valves(self) -> None:
+        """Asserts the hardware invariants: one zone at a time, main valve with every zone."""
+        state = {}
+        for t, pin, value in self.board.transitions:
+            state[pin] = value
+            zones = [p for p in ZONE_PINS if state.get(p)]
+            assert len(zones) <= 1, "zones %s open together at %s" % (zones, t)
+            if zones:
+                assert state.get(MAIN_VALVE_PIN), (
+                    "zone open without main valve at %s" % t
+                )
+
+
+def utc_str(unix: float) -> str:
+    """UTC 'YYYY-MM-DD HH:MM:SS' for reports."""
+    return _real_time.strftime("%Y-%m-%d %H:%M:%S", _real_time.gmtime(unix))
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The simulator and the tools import the firmware from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
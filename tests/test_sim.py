@@ -0,0 +1,112 @@
+from datetime import datetime
+
+import fleet_day
+import sim_week
+from sim import Simulation
+
+# Monday 1 June 2026, 03:50 UTC (05:50 CEST)
+START = (2026, 6, 1, 3, 50, 0)
+SLACK = 15  # the scheduler checks every 10 s
+EVERY_DAY = list(range(7))
+PRATO = {
+    "name": "Prato",
+    "zone": "zone_1",
+    "active_days": EVERY_DAY,
+    "start_time": "06:00",
+    "duration": 1200,
+}
+
+
+def utc(hour: int, minute: int = 0, day: int = 1) -> tuple:
+    return (2026, 6, day, hour, minute, 0)
+
+
+def unix(*t) -> int:
+    return int((datetime(*t) - datetime(1970, 1, 1)).total_seconds())
+
+
+def test_week():
+    sim_week.main()
+
+
+def test_fleet_day():
+    fleet_day.main()
+
+
+def test_reset_resumes_the_running_program():
+    for power_loss in (False, True):
+        sim = Simulation(start=START, loop_interval=1.0)
+        sim.set_programs([PRATO])
+        sim.reset(at=utc(4, 5), power_loss=power_loss)
+        sim.run(seconds=3600)
+        sim.check_valves()
+        first, resumed = sim.zone_runs()
+        assert abs(first["end"] - sim.unix(utc(4, 5))) <= SLACK, first
+        # Back until the original end, not for a new full window
+        assert resumed["start"] - first["end"] <= 2 * SLACK, resumed
+        assert abs(resumed["end"] - sim.unix(utc(4, 20))) <= SLACK, resumed
+        assert sim.boots == 2
+
+
+def test_upcoming_matches_the_runs_across_dst():
+    notte = dict(PRATO, name="Notte", start_time="02:30", duration=2700)
+    for start, day in (((2026, 10, 24, 22, 0, 0), 25), ((2027, 3, 27, 22, 0, 0), 28)):
+        sim = Simulation(start=start, loop_interval=1.0)
+        sim.set_programs([notte])
+        request = {"from": unix(*start[:3]) + 86400, "to": unix(*start[:3]) + 172800}
+        sim.send("api/irrigation/program/upcoming", request, at=30)
+        sim.run(seconds=5 * 3600)
+        sim.check_valves()
+        ((_, _, reply),) = sim.messages("/program/upcoming")
+        planned = [(o["utc"], o["duration"]) for o in reply["upcoming"]]
+        runs = [(r["start"], r["duration"]) for r in sim.zone_runs()]
+        assert len(planned) == len(runs) == (2 if day == 25 else 1), planned
+        for (at, duration), (ran_at, ran) in zip(planned, runs):
+            assert at <= ran_at <= at + SLACK, (planned, runs)
+            assert abs(ran - duration) <= SLACK, (planned, runs)
+    # The hour skipped in March: what is left of the window, from 03:00
+    assert planned == [(unix(2027, 3, 28, 1, 0), 900)]
+
+
+def float_low_across_the_window(secrets: dict) -> list:
+    sim = Simulation(start=START, loop_interval=1.0, secrets=secrets)
+    sim.set_programs([PRATO])
+    sim.set_input("float_switch_1", 0, at=utc(3, 55))
+    sim.set_input("float_switch_1", 1, at=utc(4, 4))
+    sim.run(seconds=3600)
+    sim.check_valves()
+    return sim.zone_runs()
+
+
+def test_interlock_is_opt_in():
+    (run,) = float_low_across_the_window({})
+    assert run["start"] - unix(*utc(4)) <= SLACK, run
+    assert abs(run["duration"] - 1200) <= SLACK, run
+
+    (run,) = float_low_across_the_window({"INTERLOCK_SWITCH": "float_switch_1"})
+    # Late start once the level recovers, ending with the original window
+    assert 0 <= run["start"] - unix(*utc(4, 4)) <= SLACK, run
+    assert abs(run["end"] - unix(*utc(4, 20))) <= SLACK, run
+
+
+def held_for(seconds: int) -> list:
+    sim = Simulation(start=START, loop_interval=1.0)
+    sim.set_programs([PRATO])
+    sim.send(
+        "api/irrigation/program/control",
+        {"action": "hold", "id": 1, "seconds": seconds, "user": "test"},
+        at=utc(3, 59),
+    )
+    sim.run(seconds=3600)
+    sim.check_valves()
+    return sim.zone_runs()
+
+
+def test_hold_expiry_starts_the_rest_of_the_window():
+    (run,) = held_for(300)
+    assert 0 <= run["start"] - unix(*utc(4, 4)) <= SLACK, run
+    assert abs(run["end"] - unix(*utc(4, 20))) <= SLACK, run
+
+
+def test_hold_past_the_window_skips_the_run():
+    assert held_for(1800) == []
@@ -0,0 +1,67 @@
+import importlib
+import io
+import socket
+import struct
+import sys
+
+import pytest
+
+
+class Socket:
+    """Replays 'data' as what the broker sent; records what the client writes."""
+
+    def __init__(self, data: bytes):
+        self.stream = io.BytesIO(data)
+        self.written = b""
+
+    def read(self, n):
+        return self.stream.read(n)
+
+    def readinto(self, buf, n):
+        chunk = self.stream.read(n)
+        buf[: len(chunk)] = chunk
+        return len(chunk)
+
+    def write(self, data, n=None):
+        self.written += bytes(data[:n] if n is not None else data)
+
+    def setblocking(self, flag):
+        pass
+
+
+@pytest.fixture
+def umqtt(monkeypatch):
+    monkeypatch.setitem(sys.modules, "usocket", socket)
+    monkeypatch.setitem(sys.modules, "ustruct", struct)
+    monkeypatch.delitem(sys.modules, "lib.umqtt", raising=False)
+    return importlib.import_module("lib.umqtt")
+
+
+def client(umqtt, data: bytes):
+    c = umqtt.MQTTClient("test", "broker")
+    c.sock = Socket(data)
+    c.received = []
+    c.set_callback(lambda topic, msg: c.received.append((topic, msg)))
+    return c
+
+
+def test_publish_is_delivered(umqtt):
+    c = client(umqtt, b"\x30\x07\x00\x02ab" + b"xyz")
+    assert c.wait_msg() == 0x30
+    assert c.received == [(b"ab", b"xyz")]
+
+
+@pytest.mark.parametrize(
+    "packet",
+    [
+        # QoS 0: remaining length 3 cannot hold the 4-byte topic field
+        b"\x30\x03\x00\x02ab",
+        # QoS 1: the packet id does not fit either
+        b"\x32\x05\x00\x02ab\x00\x01",
+    ],
+)
+def test_negative_payload_size_is_refused(umqtt, packet):
+    c = client(umqtt, packet)
+    with pytest.raises(umqtt.MQTTException):
+        c.wait_msg()
+    assert c.received == [] and c.sock.written == b""
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from sim import Simulation
+
+EVERY_DAY = list(range(7))
+TOPIC = "api/irrigation/program/upcoming"
+
+
+def unix(*t) -> int:
+    return int((datetime(*t) - datetime(1970, 1, 1)).total_seconds())
+
+
+def replies(requests: list, programs: list) -> list:
+    """The upcoming pages the firmware sends back for 'requests', in order."""
+    sim = Simulation(start=(2026, 6, 1, 8, 0, 0), loop_interval=1.0)
+    sim.set_programs(programs)
+    for i, request in enumerate(requests):
+        sim.send(TOPIC, request, at=30 + i)
+    sim.run(seconds=30 + len(requests) + 5)
+    return [data for _, _, data in sim.messages("/program/upcoming")]
+
+
+def two_a_day() -> list:
+    return [
+        {"name": "Alba", "zone": "zone_1", "start_time": "06:00", "duration": 600},
+        {"name": "Sera", "zone": "zone_2", "start_time": "20:00", "duration": 600},
+    ]
+
+
+def test_limit_below_page_size_ends_the_listing():
+    programs = [dict(p, active_days=EVERY_DAY) for p in two_a_day()]
+    (page,) = replies([{"limit": 10, "page_size": 50}], programs)
+    assert len(page["upcoming"]) == 10
+    assert page["more"] is False
+
+
+def test_pages_cover_the_limit_once():
+    programs = [dict(p, active_days=EVERY_DAY) for p in two_a_day()]
+    bounds = {"from": unix(2026, 6, 2), "to": unix(2026, 6, 30), "limit": 25}
+    pages = replies([dict(bounds, page=p, page_size=10) for p in range(4)], programs)
+    assert [len(p["upcoming"]) for p in pages] == [10, 10, 5, 0]
+    assert [p["more"] for p in pages] == [True, True, False, False]
+    starts = [o["start"] for p in pages for o in p["upcoming"]]
+    assert starts == sorted(starts) and len(set(starts)) == 25
+    assert starts[0] == unix(2026, 6, 2, 6, 0)
+
+
+def test_more_at_the_limit_only_when_activations_remain():
+    programs = [dict(p, active_days=EVERY_DAY) for p in two_a_day()]
+    bounds = {"from": unix(2026, 6, 2), "to": unix(2026, 6, 7), "limit": 10}
+    # Exactly 10 activations in range: the last page is full, and nothing follows
+    pages = replies([dict(bounds, page=p, page_size=5) for p in range(2)], programs)
+    assert [len(p["upcoming"]) for p in pages] == [5, 5]
+    assert [p["more"] for p in pages] == [True, False]
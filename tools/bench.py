@@ -0,0 +1,364 @@
+"""
+Benchmarks the per-tick and per-request hot paths at several program counts:
+scheduler check, conflict check, resume capping, upcoming list, program storage,
+payload validation, status publishing and the MQTT publish path. Reports time and heap per call and
+compares them with a stored baseline.
+
+Runs on the host or the MicroPython unix port (with argparse from micropython-lib),
+from the repository root:
+
+    python tools/bench.py                  # run and compare with the baseline
+    python tools/bench.py --save           # store this run as the local baseline
+    python tools/bench.py --threshold 10   # regression above +10% (default 25)
+    python tools/bench.py --reference      # compare with the committed reference
+    micropython tools/bench.py
+
+Exits with status 1 if a case regressed. Heap per call is what one call allocates
+on MicroPython (gc.mem_alloc() with the collector off) and its peak traced size on
+CPython (tracemalloc). The two differ, so baselines are kept per implementation.
+
+Times depend on the machine. The local baseline (BASELINE_FILE, not committed) is
+the one to compare times against; without one, runs are compared with the
+committed REFERENCE_FILE, where only allocations count as regressions.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, "tools")
+sys.path.insert(0, ".")
+
+import stubs  # noqa: E402
+
+stubs.install()
+
+import irrigation_controller as ctrl  # noqa: E402
+import irrigation_notify as notify  # noqa: E402
+import irrigation_programs as store  # noqa: E402
+import irrigation_scheduler as scheduler  # noqa: E402
+import main as fw  # noqa: E402
+from handlers import programs  # noqa: E402
+from utils import schema  # noqa: E402
+from lib.umqtt import MQTTClient  # noqa: E402
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+SWEEP = (50, 200, 1000)
+MIN_TIME_US = 200000
+MIN_CALLS = 3
+THRESHOLD_PCT = 25
+ALLOC_SLACK = 64  # bytes of allocation growth ignored as noise
+BASELINE_FILE = "tools/bench_baseline.json"
+REFERENCE_FILE = "tools/bench_reference.json"
+STORE_FILE = "bench_programs.json"
+
+# Every case runs at Wednesday 23:30 local time, after all generated windows
+NOW = (2026, 6, 3, 23, 30, 0, 2, 154)
+NOW_UNIX = 1780522200
+ZONES = ["zone_%d" % i for i in range(1, 9)]
+
+# Shares days with every generated program but no time: conflict checks scan all
+PROBE = {
+    "name": "probe",
+    "zone": "zone_1",
+    "start_time": "23:00",
+    "duration": 600,
+    "active_days": [0, 1, 2, 3, 4, 5, 6],
+}
+
+STATUS_PAYLOAD = b"x" * 200
+ZONE_COMMAND = {"zone": "zone_2", "cmd": "on", "duration": 900, "user": "bench"}
+IMPORT_BATCH = 50
+
+
+class NullSocket:
+    """Swallows writes so publish() measures only the client's own work."""
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, buf, n=-1):
+        n = len(buf) if n < 0 else n
+        self.written += n
+        return n
+
+    def read(self, n=-1):
+        return None
+
+    def setblocking(self, flag):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_programs(n: int) -> list:
+    """n deterministic programs starting between 00:00 and 21:59, ten minutes each."""
+    out = []
+    for i in range(n):
+        minute = (i * 37) % (22 * 60)
+        out.append(
+            {
+                "id": i + 1,
+                "name": "Program %d" % (i + 1),
+                "zone": ZONES[i % len(ZONES)],
+                "start_time": "%02d:%02d" % (minute // 60, minute % 60),
+                "duration": 600,
+                "active_days": [d for d in range(7) if (i + d) % 3],
+                "is_active": True,
+            }
+        )
+    return out
+
+
+def _clock():
+    if hasattr(time, "ticks_us"):
+        return time.ticks_us()
+    return int(time.perf_counter() * 1000000)
+
+
+def _elapsed(start):
+    if hasattr(time, "ticks_diff"):
+        return time.ticks_diff(_clock(), start)
+    return _clock() - start
+
+
+def time_per_call(fn) -> float:
+    fn()  # warm-up: first-call caches and lazy imports are not part of the tick
+    calls = 0
+    start = _clock()
+    while True:
+        fn()
+        calls += 1
+        spent = _elapsed(start)
+        if calls >= MIN_CALLS and spent >= MIN_TIME_US:
+            return spent / calls
+
+
+def alloc_per_call(fn) -> int:
+    if tracemalloc is not None:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak - base
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    fn()
+    used = gc.mem_alloc() - before
+    gc.enable()
+    return used
+
+
+def setup_firmware() -> MQTTClient:
+    store.PROGRAMS_FILE = STORE_FILE
+    for module in (fw, notify, scheduler, programs):
+        module.local_time = lambda: NOW
+        module.now_unix = lambda: NOW_UNIX
+        module.now_unix_ms = lambda: NOW_UNIX * 1000
+    # Otherwise the scheduler waits for a synced clock and returns at once
+    scheduler.timezone.time_source = "ntp"
+    client = MQTTClient(client_id="bench", server="localhost")
+    client.sock = NullSocket()
+    notify.client = client
+    return client
+
+
+def program_cases(n: int) -> list:
+    progs = make_programs(n)
+    store._save_data({"next_id": n + 1, "programs": progs})
+    data = store._load_data()
+    current = NOW[3] * 3600 + NOW[4] * 60
+    upcoming_from = NOW_UNIX + 1
+    upcoming_to = upcoming_from + programs.UPCOMING_RANGE
+    return [
+        ("check_and_run_programs", scheduler.check_and_run_programs),
+        ("check_conflict", lambda: programs.check_conflict(PROBE, programs=progs)),
+        (
+            "cap_to_next_program",
+            lambda: scheduler.cap_to_next_program(7200, current, 0, progs),
+        ),
+        (
+            "compute_upcoming",
+            lambda: programs.compute_upcoming_programs(upcoming_from, upcoming_to),
+        ),
+        (
+            "compute_upcoming/month",
+            lambda: programs.compute_upcoming_programs(
+                upcoming_from, upcoming_from + 31 * 86400, 500, 0, 50
+            ),
+        ),
+        ("load_data", store._load_data),
+        ("save_data", lambda: store._save_data(data)),
+    ]
+
+
+def fixed_cases(client: MQTTClient) -> list:
+    ctrl.active_zone = "zone_3"
+    ctrl.zone_end_time = time.time() + 1800
+    status = fw._build_status()
+    lease = {
+        "sent": None,
+        "seq": 0,
+        "last_send": 0,
+        "last_tick": 0,
+        "topic": notify.NOTIFY["STATUS"],
+        "encoding": "json",
+        "interval_ms": 1000,
+        "end": time.time() + 600,
+    }
+
+    def status_full():
+        lease["sent"] = None
+        fw.send_irrigation_status(lease, status)
+
+    def status_delta():
+        # Moves the countdown by more than STATUS_REMAINING_STEP on every call
+        status["zone_remaining_seconds"] += 2 * fw.STATUS_REMAINING_STEP
+        fw.send_irrigation_status(lease, status)
+
+    status_full()
+    batch = make_programs(IMPORT_BATCH)
+    return [
+        ("validate_program", lambda: programs.PROGRAM(PROBE)),
+        ("validate_update", lambda: programs.PROGRAM_UPDATE({"duration": 900})),
+        ("validate_zone_command", lambda: fw.ZONE_COMMAND(ZONE_COMMAND)),
+        (
+            "validate_import/%d" % IMPORT_BATCH,
+            lambda: schema.validate_all(programs.PROGRAM, batch),
+        ),
+        ("status_full", status_full),
+        ("status_delta", status_delta),
+        ("publish", lambda: client.publish(notify.NOTIFY["ZONE"], STATUS_PAYLOAD)),
+    ]
+
+
+def run() -> dict:
+    client = setup_firmware()
+    results = {}
+    try:
+        for n in SWEEP:
+            for name, fn in program_cases(n):
+                results["%s/%d" % (name, n)] = {
+                    "us": round(time_per_call(fn), 1),
+                    "alloc": alloc_per_call(fn),
+                }
+        for name, fn in fixed_cases(client):
+            results[name] = {
+                "us": round(time_per_call(fn), 1),
+                "alloc": alloc_per_call(fn),
+            }
+    finally:
+        try:
+            os.remove(STORE_FILE)
+        except OSError:
+            pass
+    return results
+
+
+def load_baselines(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(path: str, impl: str, results: dict) -> None:
+    baselines = load_baselines(path)
+    baselines[impl] = results
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=1, sort_keys=True)
+        f.write("\n")
+    print("Baseline saved to %s (%s)" % (path, impl))
+
+
+def compare(results: dict, baseline: dict, threshold: float, times: bool) -> list:
+    """Prints the table; returns the keys that regressed (in time only if 'times')."""
+    regressed = []
+    print(
+        "{:<30} {:>11} {:>9} {:>11} {:>8}".format(
+            "case", "us/call", "alloc B", "base us", "delta"
+        )
+    )
+    for key, cur in results.items():
+        base = baseline.get(key)
+        delta = ""
+        flag = ""
+        if base:
+            pct = (cur["us"] - base["us"]) * 100 / base["us"] if base["us"] else 0
+            delta = "{:+.0f}%".format(pct)
+            alloc_limit = base["alloc"] * (100 + threshold) / 100 + ALLOC_SLACK
+            if (times and pct > threshold) or cur["alloc"] > alloc_limit:
+                regressed.append(key)
+                flag = " !"
+        print(
+            "{:<30} {:>11.1f} {:>9} {:>11} {:>8}{}".format(
+                key,
+                cur["us"],
+                cur["alloc"],
+                "%.1f" % base["us"] if base else "-",
+                delta,
+                flag,
+            )
+        )
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD_PCT,
+        help="regression threshold in percent",
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="store this run as the local baseline"
+    )
+    parser.add_argument(
+        "--save-reference",
+        action="store_true",
+        help="store this run as the committed reference",
+    )
+    parser.add_argument(
+        "--reference",
+        action="store_true",
+        help="compare with the reference even when a local baseline exists",
+    )
+    args = parser.parse_args()
+    impl = sys.implementation.name
+
+    results = run()
+    baseline = {}
+    if not args.reference:
+        baseline = load_baselines(BASELINE_FILE).get(impl, {})
+    times = bool(baseline)
+    if baseline:
+        print("Compared with %s (%s)" % (BASELINE_FILE, impl))
+    else:
+        baseline = load_baselines(REFERENCE_FILE).get(impl, {})
+        if baseline:
+            print("Compared with %s (%s), allocations only" % (REFERENCE_FILE, impl))
+    regressed = compare(results, baseline, args.threshold, times)
+
+    if args.save:
+        save_baseline(BASELINE_FILE, impl, results)
+    if args.save_reference:
+        save_baseline(REFERENCE_FILE, impl, results)
+    if regressed and not (args.save or args.save_reference):
+        print("Regressed beyond %s%%: %s" % (args.threshold, ", ".join(regressed)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
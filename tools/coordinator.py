@@ -0,0 +1,702 @@
+"""
+Shares one water supply between several controllers. Runs on a host next to the
+broker, speaking only the controllers' own topics: it finds them through their
+discovery records, follows each one's zones through a status lease (and zone
+notifications from devices that send code messages), and reads their upcoming
+activations to forecast where programs from different devices would draw more
+than the supply's flow budget at once.
+
+A program the forecast delays is held on its device (program/control "hold")
+shortly before its start and queued, so it never opens over budget. An auto
+program that starts over budget anyway, against the forecast, is paused and
+queued. Queued runs start in order, from their scheduled start, as soon as
+enough flow is free: program/control "start" runs the program for what is left
+of it, under its own id. Manual runs are counted but never touched.
+
+From the repository root, against a real broker (needs paho-mqtt):
+
+    python tools/coordinator.py coordinator.json --host broker.local
+
+coordinator.json:
+
+    {"budget": 30, "default_flow": 12, "flows": {"north": {"zone_1": 18}, "south": 9}}
+
+Flows are litres per minute, or any unit the budget uses; a device entry is a
+number for all its zones or a map per zone. Controllers need a DEVICE_ID.
+Devices in text mode are followed through the status lease alone; with
+"code_messages": true (or --code-messages) the coordinator switches them to code
+messages, for every client of the device.
+tools/fleet_day.py runs it against simulated controllers.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+from utils import compact  # noqa: E402
+
+DISCOVERY = "api/notification/irrigation/devices/+"
+PLAN_TOPIC = "api/coordinator/plan"
+USER = "coordinator"
+
+LEASE_INTERVAL = 2  # seconds between status messages
+LEASE_DURATION = 600  # the firmware's STATUS_MAX_LEASE
+LEASE_RENEW = 300
+FORECAST_INTERVAL = 900
+HOLD_LEAD = 60  # seconds before a delayed activation that its hold is sent
+PENDING_TIMEOUT = 30  # seconds a started run waits for its zone notification
+MAX_DEFER = 7200
+FORECAST_LIMIT = 500  # activations per device over its default 8-day range
+
+PROGRAM_STARTED = ("zone.auto_activated", "zone.auto_resumed")
+MANUAL_STARTED = ("zone.activated", "zone.manual_override", "zone.reset_resumed")
+ZONE_STOPPED = ("zone.deactivated", "zone.auto_deactivated", "zone.timeout_deactivated")
+
+
+def decode(payload: bytes):
+    """JSON, or the compact CBOR layout when a topic was switched to it."""
+    try:
+        return json.loads(payload)
+    except ValueError:
+        pass
+    try:
+        return compact.decode(payload)
+    except Exception:
+        return None
+
+
+class Device:
+    __slots__ = (
+        "id",
+        "commands",
+        "notifications",
+        "online",
+        "messages",
+        "zone",
+        "zone_end",
+        "program",
+        "manual",
+        "water_low",
+        "status",
+        "pending_until",
+        "seq",
+        "lease_renewed",
+        "programs",
+        "rev",
+        "upcoming",
+    )
+
+    def __init__(self, device_id: str):
+        self.id = device_id
+        self.commands = None
+        self.notifications = None
+        self.online = False
+        self.messages = "text"
+        self.zone = None
+        self.zone_end = None
+        self.program = None
+        self.manual = False
+        self.water_low = False
+        # Last known status fields, from the lease's snapshot and deltas
+        self.status = {}
+        self.pending_until = None
+        self.seq = None
+        self.lease_renewed = None
+        self.programs = {}
+        # Store revision of 'programs'; None while a list is on its way
+        self.rev = None
+        self.upcoming = []
+
+
+class Coordinator:
+    """
+    'client' publishes and subscribes: publish(topic, payload) and
+    subscribe(pattern, callback(topic, payload)), as a sim.broker.HostClient does.
+    'now' returns unix seconds. Call tick() every few seconds.
+    """
+
+    def __init__(
+        self,
+        client,
+        budget: float,
+        flows: dict = None,
+        default_flow: float = 10.0,
+        max_defer: float = MAX_DEFER,
+        code_messages: bool = False,
+        now=time.time,
+        log=print,
+    ):
+        self.client = client
+        self.budget = budget
+        self.flows = flows or {}
+        self.default_flow = default_flow
+        self.max_defer = max_defer
+        # Switch devices in text mode to code messages: off, as it changes what
+        # every other client of the device receives
+        self.code_messages = code_messages
+        self.now = now
+        self.log = log
+        self.devices = {}
+        # Paused program runs waiting for flow, oldest first
+        self.deferred = []
+        self.forecast_at = None
+        self.plan_entries = []
+        # (device, program, utc start) of the delays already logged, and held
+        self._reported = set()
+        self._held = set()
+        # Counters for reports: deferred (held before their start, or paused),
+        # held, started, expired, over budget (manual)
+        self.stats = {
+            "deferred": 0,
+            "held": 0,
+            "started": 0,
+            "expired": 0,
+            "over_budget": 0,
+        }
+
+    @classmethod
+    def from_config(cls, client, config: dict, **kwargs) -> "Coordinator":
+        return cls(
+            client,
+            config["budget"],
+            flows=config.get("flows"),
+            default_flow=config.get("default_flow", 10.0),
+            max_defer=config.get("max_defer", MAX_DEFER),
+            code_messages=config.get("code_messages", False),
+            **kwargs
+        )
+
+    def start(self) -> None:
+        self.client.subscribe(DISCOVERY, self._on_discovery)
+
+    # -- flow -----------------------------------------------------------------
+
+    def flow(self, device_id: str, zone: str) -> float:
+        entry = self.flows.get(device_id, self.default_flow)
+        if isinstance(entry, dict):
+            return entry.get(zone, self.default_flow)
+        return entry
+
+    def used_flow(self, exclude: str = None) -> float:
+        return sum(
+            self.flow(d.id, d.zone)
+            for d in self.devices.values()
+            if d.zone is not None and d.id != exclude
+        )
+
+    # -- outbound -------------------------------------------------------------
+
+    def _send(self, device: Device, suffix: str, payload: dict) -> None:
+        self.client.publish(device.commands + suffix, json.dumps(payload))
+
+    def _renew_lease(self, device: Device) -> None:
+        device.lease_renewed = self.now()
+        self._send(
+            device,
+            "/status",
+            {
+                "client": USER,
+                "interval": LEASE_INTERVAL,
+                "duration": LEASE_DURATION,
+                "encoding": "json",
+            },
+        )
+
+    def _request_upcoming(self, device: Device, data: dict = None) -> None:
+        """Page 0 covers the device's default range; later pages repeat its bounds."""
+        request = {"limit": FORECAST_LIMIT}
+        if data is not None:
+            request = {
+                "from": data["from"],
+                "to": data["to"],
+                "limit": FORECAST_LIMIT,
+                "page": data["page"] + 1,
+                "page_size": data["page_size"],
+            }
+        self._send(device, "/program/upcoming", request)
+
+    def refresh(self) -> None:
+        """Asks every online device for its upcoming activations."""
+        self.forecast_at = self.now()
+        for device in self.devices.values():
+            if device.online:
+                self._request_upcoming(device)
+
+    # -- inbound --------------------------------------------------------------
+
+    def _on_discovery(self, topic: str, payload: bytes) -> None:
+        data = decode(payload)
+        if not isinstance(data, dict) or not data.get("device"):
+            return
+        device_id = data["device"]
+        device = self.devices.get(device_id)
+        if device is None:
+            device = self.devices[device_id] = Device(device_id)
+        if not data.get("online"):
+            if device.online:
+                self.log("%s went offline" % device_id)
+            device.online = False
+            return
+
+        first = device.notifications is None
+        device.commands = data["commands"]
+        device.notifications = data["notifications"]
+        device.messages = data.get("messages", "text")
+        device.online = True
+        device.seq = None
+        if first:
+            self.client.subscribe(
+                device.notifications + "/#",
+                lambda t, p, device=device: self._on_device(device, t, p),
+            )
+        if device.messages != "code" and self.code_messages:
+            self.log("%s sends text messages, switching it to codes" % device_id)
+            self._send(device, "/encoding", {"messages": "code"})
+            device.messages = "code"
+        elif device.messages != "code":
+            self.log("%s sends text messages: following it by status" % device_id)
+        self.log("%s online (%s)" % (device_id, data.get("reset", "?")))
+        self._renew_lease(device)
+        device.rev = None
+        self._send(device, "/program/list", {})
+        self._request_upcoming(device)
+
+    def _on_device(self, device: Device, topic: str, payload: bytes) -> None:
+        suffix = topic[len(device.notifications) :]
+        data = decode(payload)
+        if not isinstance(data, dict):
+            return
+        if suffix == "/zone":
+            self._on_zone(device, data)
+        elif suffix == "/status/" + USER:
+            self._on_status(device, data)
+        elif suffix == "/program/upcoming":
+            self._on_upcoming(device, data)
+        elif suffix == "/program/list":
+            device.programs = {p["id"]: p for p in data.get("programs", [])}
+            device.rev = data.get("rev")
+        elif suffix == "/program/change":
+            self._on_program_change(device, data)
+            # The forecast is stale
+            self._request_upcoming(device)
+
+    def _on_program_change(self, device: Device, data: dict) -> None:
+        """Applies the next revision; a gap or an older one asks for the list again."""
+        if device.rev is None:
+            # The list requested earlier includes this change
+            return
+        if data.get("rev") != device.rev + 1:
+            self.log(
+                "%s program change %s after %s: reloading the list"
+                % (device.id, data.get("rev"), device.rev)
+            )
+            device.rev = None
+            self._send(device, "/program/list", {})
+            return
+        change = data.get("program")
+        if change is None:
+            device.programs.pop(data.get("id"), None)
+        else:
+            device.programs[data["id"]] = change
+        device.rev = data["rev"]
+
+    def _on_upcoming(self, device: Device, data: dict) -> None:
+        if "page" not in data:
+            return
+        if data["page"] == 0:
+            device.upcoming = []
+        device.upcoming.extend(data.get("upcoming", []))
+        if data.get("more"):
+            self._request_upcoming(device, data)
+        else:
+            self.plan()
+
+    def _on_zone(self, device: Device, data: dict) -> None:
+        code = data.get("code")
+        params = data.get("params", {})
+        if code is None or data.get("status") != "success":
+            return
+        if code in PROGRAM_STARTED:
+            self._program_started(
+                device, params["program"], params["zone"], params["duration"]
+            )
+        elif code in MANUAL_STARTED:
+            self._manual_started(device, params["zone"], params.get("duration", 0))
+        elif code in ZONE_STOPPED:
+            self._set_zone(device, None)
+            self.admit()
+
+    def _program_started(
+        self, device: Device, program: int, zone: str, duration: int
+    ) -> None:
+        # Started despite a hold (lost, or not supported): paused below instead
+        self._drop_held(device.id, program)
+        self._set_zone(device, zone, self.now() + duration)
+        device.program = program
+        device.manual = False
+        if self.used_flow() > self.budget:
+            self._defer(
+                device, {"program": program, "zone": zone, "duration": duration}
+            )
+
+    def _manual_started(self, device: Device, zone: str, duration: int) -> None:
+        self._set_zone(device, zone, self.now() + duration)
+        device.program = None
+        device.manual = True
+        if self.used_flow() > self.budget:
+            self.stats["over_budget"] += 1
+            self.log(
+                "%s %s started by hand over budget: %.1f of %.1f"
+                % (device.id, zone, self.used_flow(), self.budget)
+            )
+
+    def _on_status(self, device: Device, data: dict) -> None:
+        seq = data.get("seq")
+        if data.get("type") == "full":
+            changes = data
+        elif device.seq is not None and seq == device.seq + 1:
+            changes = data.get("changes", {})
+        else:
+            # A lost delta: the renewal brings a full snapshot
+            device.seq = None
+            self._renew_lease(device)
+            return
+        device.seq = seq
+        if data.get("type") == "full":
+            device.status = {}
+        device.status.update(changes)
+        if "water_low" in changes:
+            device.water_low = changes["water_low"]
+        if "active_zone" not in changes:
+            return
+        zone = changes["active_zone"]
+        if zone is None and device.pending_until is not None:
+            # Reported before the device handled the start sent to it
+            return
+        if zone == device.zone:
+            device.pending_until = None
+            return
+        # Zone notifications in code mode usually get here first; in text mode,
+        # or when one was lost, the status tells what opened
+        remaining = changes.get("zone_remaining_seconds") or 0
+        program = device.status.get("active_program")
+        if zone is None:
+            self._set_zone(device, None)
+            self.admit()
+        elif device.status.get("manual_override") or program is None:
+            self._manual_started(device, zone, remaining)
+        else:
+            self._program_started(device, program, zone, remaining)
+
+    def _set_zone(self, device: Device, zone: str, end: float = None) -> None:
+        device.zone = zone
+        device.zone_end = end if zone is not None else None
+        device.pending_until = None
+        if zone is None:
+            device.program = None
+            device.manual = False
+
+    # -- admission ------------------------------------------------------------
+
+    def _hold(self, entry: dict, now: float) -> None:
+        """Holds a delayed activation on its device before it starts, and queues it."""
+        device = self.devices[entry["device"]]
+        self._send(
+            device,
+            "/program/control",
+            {
+                "action": "hold",
+                "id": entry["id"],
+                "seconds": int(entry["utc"] + entry["duration"] - now),
+                "user": USER,
+            },
+        )
+        self.deferred.append(
+            {
+                "device": device.id,
+                "program": entry["id"],
+                "zone": entry["zone"],
+                "duration": entry["duration"],
+                "since": entry["utc"],
+                "held": True,
+            }
+        )
+        self.stats["deferred"] += 1
+        self.stats["held"] += 1
+        self.log(
+            "%s program %s on %s held: planned %ds after its start"
+            % (device.id, entry["id"], entry["zone"], entry["planned"] - entry["utc"])
+        )
+
+    def _drop_held(self, device_id: str, program: int) -> None:
+        for entry in self.deferred:
+            if (
+                entry.get("held")
+                and entry["device"] == device_id
+                and entry["program"] == program
+            ):
+                self.deferred.remove(entry)
+                self.stats["deferred"] -= 1
+                self.log("%s program %s started while held" % (device_id, program))
+                return
+
+    def _defer(self, device: Device, params: dict) -> None:
+        program = params["program"]
+        self._send(
+            device, "/program/control", {"action": "pause", "id": program, "user": USER}
+        )
+        self.deferred.append(
+            {
+                "device": device.id,
+                "program": program,
+                "zone": params["zone"],
+                "duration": params["duration"],
+                "since": self.now(),
+                "held": False,
+            }
+        )
+        self.stats["deferred"] += 1
+        self.log(
+            "%s program %s on %s deferred: %.1f of %.1f in use"
+            % (
+                device.id,
+                program,
+                params["zone"],
+                self.used_flow(exclude=device.id),
+                self.budget,
+            )
+        )
+        self._set_zone(device, None)
+
+    def admit(self) -> None:
+        """Starts queued runs in order, from their start, while their flow fits."""
+        now = self.now()
+        for entry in list(self.deferred):
+            device = self.devices.get(entry["device"])
+            if (
+                now < entry["since"]
+                or device is None
+                or not device.online
+                or device.zone is not None
+                or device.pending_until is not None
+                or device.water_low
+            ):
+                continue
+            flow = self.flow(device.id, entry["zone"])
+            if self.used_flow() + flow > self.budget:
+                break
+            self.deferred.remove(entry)
+            # Under its own id, which lifts the hold or replaces the paused run
+            self._send(
+                device,
+                "/program/control",
+                {
+                    "action": "start",
+                    "id": entry["program"],
+                    "seconds": int(entry["duration"]),
+                    "user": USER,
+                },
+            )
+            self._set_zone(device, entry["zone"], now + entry["duration"])
+            device.program = entry["program"]
+            device.pending_until = now + PENDING_TIMEOUT
+            self.stats["started"] += 1
+            self.log(
+                "%s program %s on %s started after %ds"
+                % (device.id, entry["program"], entry["zone"], now - entry["since"])
+            )
+
+    def tick(self) -> None:
+        now = self.now()
+        for device in self.devices.values():
+            if device.pending_until is not None and now >= device.pending_until:
+                self.log("%s did not confirm its start" % device.id)
+                self._set_zone(device, None)
+            if not device.online:
+                # Still watering as far as we know, until its run would have ended
+                if device.zone is not None and now >= (device.zone_end or now):
+                    self._set_zone(device, None)
+                continue
+            if now - (device.lease_renewed or 0) >= LEASE_RENEW:
+                self._renew_lease(device)
+        for entry in list(self.deferred):
+            if now - entry["since"] >= self.max_defer:
+                self.deferred.remove(entry)
+                self.stats["expired"] += 1
+                self.log(
+                    "%s program %s dropped after waiting %ds"
+                    % (entry["device"], entry["program"], now - entry["since"])
+                )
+        if self.forecast_at is None or now - self.forecast_at >= FORECAST_INTERVAL:
+            self.refresh()
+        for entry in self.plan_entries:
+            if entry["planned"] <= entry["utc"] or not (
+                entry["utc"] - HOLD_LEAD <= now < entry["utc"]
+            ):
+                continue
+            key = (entry["device"], entry["id"], entry["utc"])
+            device = self.devices.get(entry["device"])
+            if key not in self._held and device is not None and device.online:
+                self._held.add(key)
+                self._hold(entry, now)
+        self.admit()
+
+    # -- forecast -------------------------------------------------------------
+
+    def plan(self) -> list:
+        """
+        Lays the devices' upcoming activations out in start order, each one
+        delayed until enough flow is free for it and its own device is idle.
+        Returns and publishes (retained on PLAN_TOPIC) the entries with their
+        planned start in UTC; a delay means the programs overlap over budget,
+        and tick() holds that activation on its device shortly before it.
+        """
+        now = self.now()
+        items = []
+        for device in self.devices.values():
+            if device.online:
+                for act in device.upcoming:
+                    utc = act.get("utc", act["start"])
+                    # A window already open is counted by the zone it runs
+                    if utc >= now:
+                        items.append((utc, device.id, act))
+        items.sort(key=lambda item: (item[0], item[1]))
+
+        running = []  # [end, flow] of planned runs, from those open now
+        device_free = {}
+        for device in self.devices.values():
+            if device.online and device.zone is not None and device.zone_end:
+                running.append([device.zone_end, self.flow(device.id, device.zone)])
+                device_free[device.id] = device.zone_end
+        entries = []
+        for start, device_id, act in items:
+            flow = self.flow(device_id, act["zone"])
+            t = max(start, device_free.get(device_id, start))
+            while True:
+                running = [r for r in running if r[0] > t]
+                if not running or sum(r[1] for r in running) + flow <= self.budget:
+                    break
+                t = min(r[0] for r in running)
+            running.append([t + act["duration"], flow])
+            device_free[device_id] = t + act["duration"]
+            entries.append(
+                {
+                    "device": device_id,
+                    "id": act["id"],
+                    "name": act.get("name"),
+                    "zone": act["zone"],
+                    "start": act["start"],
+                    "utc": start,
+                    "planned": t,
+                    "duration": act["duration"],
+                    "flow": flow,
+                }
+            )
+
+        # Activations already past are neither reported nor held again
+        self._reported = set(k for k in self._reported if k[2] >= now)
+        self._held = set(k for k in self._held if k[2] >= now)
+        conflicts = [e for e in entries if e["planned"] > e["utc"]]
+        for e in conflicts:
+            key = (e["device"], e["id"], e["utc"], e["planned"])
+            if key not in self._reported:
+                self._reported.add(key)
+                self.log(
+                    "Forecast: %s program %s at %s delayed %ds to fit the budget"
+                    % (
+                        e["device"],
+                        e["id"],
+                        # Device local time, as its programs are written
+                        time.strftime("%Y-%m-%d %H:%M", time.gmtime(e["start"])),
+                        e["planned"] - e["utc"],
+                    )
+                )
+        self.plan_entries = entries
+        self.client.publish(
+            PLAN_TOPIC,
+            json.dumps(
+                {
+                    "budget": self.budget,
+                    "plan": entries,
+                    "conflicts": len(conflicts),
+                    "timestamp": int(now * 1000),
+                }
+            ),
+            retain=True,
+        )
+        return entries
+
+
+# -- real broker --------------------------------------------------------------
+
+
+class PahoClient:
+    """publish/subscribe over paho-mqtt, with callbacks run from loop()."""
+
+    def __init__(
+        self, host: str, port: int, username: str = None, password: str = None
+    ):
+        try:
+            import paho.mqtt.client as mqtt
+        except ImportError:
+            raise SystemExit("The coordinator needs paho-mqtt: pip install paho-mqtt")
+        self._callbacks = []
+        self._match = mqtt.topic_matches_sub
+        self._client = mqtt.Client(client_id="irrigation-coordinator")
+        if username:
+            self._client.username_pw_set(username, password)
+        self._client.on_message = self._on_message
+        self._client.connect(host, port)
+
+    def subscribe(self, pattern: str, callback) -> None:
+        self._callbacks.append((pattern, callback))
+        self._client.subscribe(pattern)
+
+    def publish(self, topic: str, payload, retain: bool = False) -> None:
+        self._client.publish(topic, payload, retain=retain)
+
+    def loop(self, timeout: float) -> None:
+        self._client.loop(timeout)
+
+    def _on_message(self, client, userdata, message) -> None:
+        for pattern, callback in self._callbacks:
+            if self._match(pattern, message.topic):
+                callback(message.topic, message.payload)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("config", help="JSON file with budget and flows")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--user")
+    parser.add_argument("--password")
+    parser.add_argument("--tick", type=float, default=2, help="seconds between ticks")
+    parser.add_argument(
+        "--code-messages",
+        action="store_true",
+        help="switch controllers in text mode to code messages",
+    )
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    if args.code_messages:
+        config["code_messages"] = True
+    client = PahoClient(args.host, args.port, args.user, args.password)
+
+    def log(line: str) -> None:
+        print("%s %s" % (time.strftime("%Y-%m-%d %H:%M:%S"), line), flush=True)
+
+    coordinator = Coordinator.from_config(client, config, log=log)
+    coordinator.start()
+    while True:
+        client.loop(args.tick)
+        coordinator.tick()
+
+
+if __name__ == "__main__":
+    main()
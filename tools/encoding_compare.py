@@ -0,0 +1,138 @@
+"""
+Compares the JSON and compact (CBOR) encodings of status and notification payloads:
+size on the wire and encode time, and checks that the reference decoder round-trips
+(timestamps come back truncated to whole seconds).
+
+Runs on the host or the MicroPython unix port, from the repository root:
+
+    python tools/encoding_compare.py
+    micropython tools/encoding_compare.py
+"""
+
+import json
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+from utils import compact  # noqa: E402
+
+ROUNDS = 2000
+
+SAMPLES = {
+    "notify_code": {
+        "status": "success",
+        "timestamp": 1792400000417,
+        "code": "zone.auto_activated",
+        "params": {"zone": "zone_3", "program": 4, "duration": 1800},
+    },
+    "notify_text": {
+        "status": "success",
+        "timestamp": 1792400000982,
+        "data": "Ciclo automatico avviato: zone_3 attiva per 30.0 minuti",
+    },
+    "program_change": {
+        "op": "update",
+        "id": 4,
+        "program": {
+            "id": 4,
+            "name": "Prato",
+            "zone": "zone_3",
+            "active_days": [0, 2, 4],
+            "start_time": "06:00",
+            "duration": 1800,
+            "is_active": True,
+        },
+        "rev": 42,
+        "timestamp": 1792400001250,
+    },
+    "status_full": {
+        "type": "full",
+        "active_zone": "zone_3",
+        "manual_override": False,
+        "zone_remaining_seconds": 1742,
+        "paused_program": {
+            "id": 4,
+            "zone": "zone_1",
+            "window_remaining_seconds": 2210,
+        },
+        "user_paused_program": None,
+        "float_switches": {
+            "float_switch_1": 1,
+            "float_switch_2": 1,
+            "float_switch_3": 0,
+        },
+        "seq": 1,
+        "timestamp": 1792400000599,
+    },
+    "status_delta": {
+        "type": "delta",
+        "changes": {"zone_remaining_seconds": 1730},
+        "seq": 2,
+        "timestamp": 1792400010604,
+    },
+}
+
+
+def _clock():
+    if hasattr(time, "ticks_us"):
+        return time.ticks_us()
+    return int(time.perf_counter() * 1000000)
+
+
+def _elapsed(start):
+    if hasattr(time, "ticks_diff"):
+        return time.ticks_diff(time.ticks_us(), start)
+    return _clock() - start
+
+
+def _time_per_call(fn, payload) -> float:
+    start = _clock()
+    for _ in range(ROUNDS):
+        fn(payload)
+    return _elapsed(start) / ROUNDS
+
+
+def _json(payload):
+    return json.dumps(payload).encode("utf-8")
+
+
+def _to_seconds(obj):
+    """'obj' with its timestamps truncated to whole seconds, as compact sends them."""
+    if isinstance(obj, dict):
+        out = {}
+        for key, value in obj.items():
+            if key == "timestamp" and isinstance(value, int):
+                value = value // 1000 * 1000
+            out[key] = _to_seconds(value)
+        return out
+    if isinstance(obj, list):
+        return [_to_seconds(item) for item in obj]
+    return obj
+
+
+def main() -> None:
+    print(
+        "{:<14} {:>10} {:>10} {:>7} {:>12} {:>12}".format(
+            "payload", "json B", "cbor B", "saved", "json us", "cbor us"
+        )
+    )
+    for name, payload in SAMPLES.items():
+        as_json = _json(payload)
+        as_cbor = compact.encode(payload)
+        if compact.decode(as_cbor) != _to_seconds(json.loads(as_json)):
+            raise SystemExit(f"{name}: compact round-trip mismatch")
+        print(
+            "{:<14} {:>10} {:>10} {:>6}% {:>12.1f} {:>12.1f}".format(
+                name,
+                len(as_json),
+                len(as_cbor),
+                100 - len(as_cbor) * 100 // len(as_json),
+                _time_per_call(_json, payload),
+                _time_per_call(compact.encode, payload),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
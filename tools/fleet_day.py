@@ -0,0 +1,150 @@
+"""
+Runs three simulated controllers on one broker whose morning programs overlap
+beyond a shared flow budget, first on their own and then with
+tools/coordinator.py, and checks that the coordinator keeps the combined flow
+within the budget without cutting any program short.
+
+From the repository root:
+
+    python tools/fleet_day.py
+"""
+
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+from sim import utc_str  # noqa: E402
+from sim.fleet import Fleet  # noqa: E402
+from tools.coordinator import Coordinator  # noqa: E402
+
+# Monday 1 June 2026, 03:50 UTC (05:50 CEST)
+START = (2026, 6, 1, 3, 50, 0)
+RUN_SECONDS = 3600
+TICK = 2
+SLACK = 15
+
+BUDGET = 30
+DEFAULT_FLOW = 15
+FLOWS = {"south": {"zone_3": 10}}
+
+EVERY_DAY = [0, 1, 2, 3, 4, 5, 6]
+PROGRAMS = {
+    "north": [
+        {"name": "Prato", "zone": "zone_1", "start_time": "06:00", "duration": 1200}
+    ],
+    "south": [
+        {"name": "Siepe", "zone": "zone_1", "start_time": "06:00", "duration": 1200},
+        {"name": "Vasi", "zone": "zone_3", "start_time": "06:30", "duration": 600},
+    ],
+    "east": [
+        {"name": "Orto", "zone": "zone_2", "start_time": "06:10", "duration": 900}
+    ],
+}
+
+
+def make_fleet() -> Fleet:
+    fleet = Fleet(list(PROGRAMS), start=START)
+    for device_id, programs in PROGRAMS.items():
+        fleet[device_id].set_programs(
+            [dict(p, active_days=EVERY_DAY) for p in programs]
+        )
+    return fleet
+
+
+def flow(device_id: str, zone: str) -> float:
+    return FLOWS.get(device_id, {}).get(zone, DEFAULT_FLOW)
+
+
+def flow_profile(fleet: Fleet) -> tuple:
+    """(peak flow, seconds over BUDGET) from every controller's valve log."""
+    edges = []
+    for device_id, sim in fleet.devices.items():
+        sim.check_valves()
+        for run in sim.zone_runs():
+            end = run["end"] if run["end"] is not None else float("inf")
+            edges.append((run["start"], flow(device_id, run["zone"])))
+            edges.append((end, -flow(device_id, run["zone"])))
+    edges.sort()
+    used = peak = over = 0
+    last = None
+    for t, delta in edges:
+        if used > BUDGET and last is not None:
+            over += t - last
+        used += delta
+        peak = max(peak, used)
+        last = t
+    return peak, over
+
+
+def main() -> None:
+    # Without a coordinator: all three water together from 06:10 to 06:20
+    fleet = make_fleet()
+    fleet.run(seconds=RUN_SECONDS)
+    peak, over = flow_profile(fleet)
+    print("uncoordinated: peak %d, %ds over budget %d" % (peak, over, BUDGET))
+    assert peak > BUDGET and over >= 600 - SLACK, (peak, over)
+
+    fleet = make_fleet()
+    client = fleet.broker.client("coordinator")
+    lines = []
+    coordinator = Coordinator(
+        client,
+        BUDGET,
+        flows=FLOWS,
+        default_flow=DEFAULT_FLOW,
+        now=fleet.clock.unix_now,
+        log=lambda line: lines.append(
+            "%s %s" % (utc_str(fleet.clock.unix_now()), line)
+        ),
+    )
+    coordinator.start()
+    fleet.every(TICK, coordinator.tick)
+
+    wall = time.perf_counter()
+    fleet.run(seconds=RUN_SECONDS)
+    wall = time.perf_counter() - wall
+    for line in lines:
+        print("  " + line)
+    for device_id, sim in fleet.devices.items():
+        for run in sim.zone_runs():
+            print(
+                "%s  %-5s %-7s %5ds"
+                % (utc_str(run["start"]), device_id, run["zone"], run["duration"])
+            )
+
+    # The forecast saw the conflict on every day: Orto waits for Prato and Siepe
+    for e in coordinator.plan_entries:
+        delay = 600 if e["device"] == "east" else 0
+        assert e["planned"] - e["utc"] == delay, e
+
+    # Held before its start from the forecast, so it never opened over budget
+    stats = coordinator.stats
+    assert stats["deferred"] == stats["held"] == stats["started"] == 1, stats
+    peak, over = flow_profile(fleet)
+    assert peak <= BUDGET and over == 0, (peak, over)
+
+    # Nothing cut short: Orto ran its 15 minutes once the supply was free
+    east = [r for r in fleet["east"].zone_runs() if r["duration"] > SLACK]
+    assert len(east) == 1, east
+    start = fleet.unix((2026, 6, 1, 4, 20, 0))
+    assert start <= east[0]["start"] <= start + SLACK, east
+    assert abs(east[0]["duration"] - 900) <= SLACK, east
+    # Started under its own program id, so its runtime is booked to it
+    runtime = fleet["east"].firmware["irrigation_runtime"]
+    assert abs(runtime._programs.get("1", 0) - 900) <= SLACK, runtime._programs
+    assert not runtime._manual, runtime._manual
+    for device_id in ("north", "south"):
+        runs = fleet[device_id].zone_runs()
+        assert len(runs) == len(PROGRAMS[device_id]), runs
+        for run, prog in zip(runs, PROGRAMS[device_id]):
+            assert abs(run["duration"] - prog["duration"]) <= SLACK, run
+
+    print(
+        "OK: %ds over budget %d, %d deferred, simulated hour in %.1f s"
+        % (over, BUDGET, stats["deferred"], wall)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Measures what the firmware costs at boot and what each lazily loaded handler group
+adds on first use: import time and the heap still held once the import is done.
+
+Runs on the host or the MicroPython unix port, from the repository root:
+
+    python -B tools/footprint.py
+    micropython tools/footprint.py
+
+Resident bytes are gc.mem_alloc() growth after a collection on MicroPython and
+tracemalloc's traced size on CPython, without the import system's own caches.
+CPython objects are much larger: compare runs on the same implementation only.
+On CPython the compiled code size of each set is printed as well, a steadier
+proxy for what the device holds. Use -B on CPython so bytecode caches do not
+make the import times depend on the previous run.
+"""
+
+import gc
+import sys
+import time
+
+sys.path.insert(0, "tools")
+sys.path.insert(0, ".")
+
+import stubs  # noqa: E402
+
+stubs.install()
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import marshal
+except ImportError:
+    marshal = None
+
+FIRMWARE_PREFIXES = ("main", "irrigation_", "handlers", "lib", "utils")
+ON_DEMAND = ("irrigation_restore", "utils.compact")
+BREAKDOWN_TOP = 8
+
+
+def _clock():
+    if hasattr(time, "ticks_us"):
+        return time.ticks_us()
+    return int(time.perf_counter() * 1000000)
+
+
+def _elapsed(start):
+    if hasattr(time, "ticks_diff"):
+        return time.ticks_diff(_clock(), start)
+    return _clock() - start
+
+
+# CPython's import system caches specs, finders and paths per import; MicroPython
+# keeps nothing like it, so those allocations are left out
+IMPORT_SYSTEM = "<frozen importlib._bootstrap>"
+
+
+def _resident() -> int:
+    gc.collect()
+    if tracemalloc is not None:
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, IMPORT_SYSTEM),)
+        )
+        return sum(stat.size for stat in snapshot.statistics("filename"))
+    return gc.mem_alloc()
+
+
+def _firmware_modules() -> set:
+    return {name for name in sys.modules if name.startswith(FIRMWARE_PREFIXES)}
+
+
+def _code_size(names) -> int:
+    """
+    Bytes of the modules' compiled code, which a source import on the device holds
+    in its heap as well: a proxy that does not depend on CPython object sizes.
+    0 where marshal is missing (MicroPython).
+    """
+    if marshal is None:
+        return 0
+    total = 0
+    for name in names:
+        path = getattr(sys.modules[name], "__file__", None)
+        if path:
+            with open(path) as f:
+                total += len(marshal.dumps(compile(f.read(), path, "exec")))
+    return total
+
+
+def measure(name: str) -> tuple:
+    """Imports 'name'; returns (microseconds, resident bytes, new firmware modules)."""
+    modules = _firmware_modules()
+    before = _resident()
+    start = _clock()
+    __import__(name)
+    elapsed = _elapsed(start)
+    return elapsed, _resident() - before, _firmware_modules() - modules
+
+
+def _row(label, us, resident, code, modules) -> None:
+    print(
+        "{:<20} {:>10.1f} {:>12} {:>10} {:>8}".format(
+            label, us / 1000, resident, code, modules
+        )
+    )
+
+
+def main() -> None:
+    if tracemalloc is not None:
+        tracemalloc.start()
+    # Standard library modules the firmware imports are not part of its cost
+    for name in ("binascii", "json", "os", "random", "re", "socket", "ssl", "struct"):
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+    rows = [("core (main)",) + measure("main")]
+    boot = rows[0][3]
+    import handlers
+
+    # Loaded on demand outside the handler groups: reset recovery while a saved
+    # state is restored, the compact codec once a topic uses CBOR
+    for name in ON_DEMAND + tuple("handlers." + g for g in handlers.GROUPS):
+        rows.append((name,) + measure(name))
+
+    print(
+        "{:<20} {:>10} {:>12} {:>10} {:>8}".format(
+            "", "import ms", "resident B", "code B", "modules"
+        )
+    )
+    for label, us, resident, modules in rows:
+        _row(label, us, resident, _code_size(modules), len(modules))
+    total_us = sum(row[1] for row in rows)
+    total_bytes = sum(row[2] for row in rows)
+    loaded = _firmware_modules()
+    total_code = _code_size(loaded)
+    _row("all loaded", total_us, total_bytes, total_code, len(loaded))
+    print(
+        "Boot holds %d%% of the resident heap with every group loaded"
+        % (rows[0][2] * 100 // total_bytes if total_bytes else 0)
+    )
+    if total_code:
+        print(
+            "Boot holds %d%% of the compiled code; largest boot modules:"
+            % (_code_size(boot) * 100 // total_code)
+        )
+        sizes = sorted(((_code_size((n,)), n) for n in boot), reverse=True)
+        for size, name in sizes[:BREAKDOWN_TOP]:
+            print("  {:<24} {:>8}".format(name, size))
+
+
+main()
@@ -0,0 +1,386 @@
+"""
+Drives the firmware with a mix of MQTT commands at a given rate and measures,
+per command type, how long it waits before it is handled and how long until its
+notification arrives, plus throughput and drops. Runs in the host simulation
+(sim/), so times are virtual: they come from the loop cadence, the queue and the
+firmware's own sleeps. --cpu-scale also charges handler CPU time. Set it to the
+device/host ratio of tools/bench.py timings.
+
+From the repository root:
+
+    python tools/loadgen.py
+    python tools/loadgen.py --rate 20 --duration 300 --mix zone=5,program_list=1
+    python tools/loadgen.py --programs 200 --cpu-scale 40
+
+Mix keys are the lowercase TOPICS names; weights are relative.
+"""
+
+import argparse
+import collections
+import json
+import random
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+from sim import Simulation  # noqa: E402
+
+START = (2026, 6, 1, 8, 0, 0)
+WARMUP = 15  # seconds for the device to boot and subscribe before the load starts
+STATUS_CLIENTS = 4  # firmware STATUS_MAX_LEASES: more clients would be refused
+
+DEFAULT_MIX = {
+    "zone": 3,
+    "program_list": 2,
+    "program_upcoming": 1,
+    "get_status": 2,
+    "program_create": 1,
+    "program_edit": 1,
+    "program_delete": 1,
+    "program_control": 1,
+    "program_import": 0.5,
+    "history": 1,
+    "runtime": 1,
+    "log": 1,
+    "encoding": 0.2,
+    "metrics": 0.2,
+}
+
+NOTIFY = "api/notification/irrigation/"
+STATUS_TOPIC = NOTIFY + "status/"
+
+
+class Command:
+    __slots__ = ("kind", "topic", "payload", "sent", "started", "replied", "wait_for")
+
+    def __init__(self, kind: str, topic: str, payload, wait_for: str = None):
+        self.kind = kind
+        self.topic = topic
+        self.payload = payload
+        self.sent = None
+        self.started = None
+        self.replied = None
+        # Topic of a reply sent later from the loop (status) rather than by the handler
+        self.wait_for = wait_for
+
+
+class Generator:
+    """Builds payloads that keep the program store valid: creates never conflict."""
+
+    def __init__(self, rng: random.Random, programs: int):
+        self.rng = rng
+        self.next_id = programs + 1
+        self.ids = list(range(1, programs + 1))
+        self.slot = 0
+        self.seq = 0
+
+    def _new_program(self) -> dict:
+        # Two-minute slots from 22:00 on one weekday at a time, clear of the seed
+        # programs and of the load window
+        minute = 22 * 60 + self.slot % 60 * 2
+        day = self.slot // 60 % 7
+        self.slot += 1
+        return {
+            "name": "Load %d" % self.slot,
+            "zone": "zone_%d" % self.rng.randint(1, 8),
+            "start_time": "%02d:%02d" % (minute // 60, minute % 60),
+            "duration": 60,
+            "active_days": [day],
+        }
+
+    def make(self, kind: str) -> Command:
+        self.seq += 1
+        topic = "api/irrigation/" + kind.replace("_", "/")
+        if kind == "zone":
+            zone = "zone_%d" % self.rng.randint(1, 8)
+            return Command(kind, topic, {"zone": zone, "duration": 120})
+        if kind == "program_list":
+            return Command(kind, topic, {})
+        if kind == "program_upcoming":
+            return Command(kind, topic, {})
+        if kind == "get_status":
+            client = "lg%d" % (self.seq % STATUS_CLIENTS)
+            payload = {"client": client, "interval": 5, "duration": 30}
+            return Command(
+                kind, "api/irrigation/status", payload, STATUS_TOPIC + client
+            )
+        if kind == "program_create":
+            self.ids.append(self.next_id)
+            self.next_id += 1
+            return Command(kind, topic, {"program": self._new_program()})
+        if kind == "program_edit" and self.ids:
+            prog_id = self.rng.choice(self.ids)
+            return Command(
+                kind, topic, {"id": prog_id, "program": {"name": "Edit %d" % self.seq}}
+            )
+        if kind == "program_delete" and self.ids:
+            prog_id = self.ids.pop(self.rng.randrange(len(self.ids)))
+            return Command(kind, topic, {"id": prog_id})
+        if kind == "program_control" and self.ids:
+            return Command(kind, topic, {"action": "pause", "id": self.ids[0]})
+        if kind == "program_import":
+            batch = [self._new_program(), self._new_program()]
+            self.ids.extend((self.next_id, self.next_id + 1))
+            self.next_id += 2
+            return Command(kind, topic, batch)
+        if kind == "history":
+            return Command(kind, topic, {"res": "raw", "page_size": 10})
+        if kind == "runtime":
+            return Command(kind, topic, {"limit": 7})
+        if kind == "log":
+            return Command(kind, topic, {"limit": 10})
+        if kind == "encoding":
+            return Command(kind, topic, {"topic": "log", "encoding": "json"})
+        if kind == "metrics":
+            return Command(kind, topic, {"gc_threshold": 20000})
+        return self.make("program_list")
+
+
+class LoadRun:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.sim = Simulation(
+            start=START, loop_interval=args.loop_interval, seed=args.seed
+        )
+        self.gen = Generator(self.rng, args.programs)
+        self.commands = []
+        self.inflight = collections.deque()
+        self.current = None
+        self.waiting = {}
+        self.unsolicited = 0
+        self.sim.on_boot.append(self._instrument)
+        self.sim.host.subscribe(NOTIFY + "#", self._on_notification)
+
+    def seed_programs(self) -> None:
+        progs = []
+        for i in range(self.args.programs):
+            minute = i * 11 % (6 * 60)  # 00:00-05:59, far from the load window
+            progs.append(
+                {
+                    "name": "Seed %d" % (i + 1),
+                    "zone": "zone_%d" % (i % 8 + 1),
+                    "start_time": "%02d:%02d" % (minute // 60, minute % 60),
+                    "duration": 60,
+                    "active_days": [i % 7],
+                }
+            )
+        self.sim.set_programs(progs)
+
+    def schedule(self) -> None:
+        kinds = list(self.args.mix)
+        weights = [self.args.mix[k] for k in kinds]
+        t = WARMUP
+        end = t + self.args.duration
+        while True:
+            t += self.rng.expovariate(self.args.rate)
+            if t >= end:
+                break
+            cmd = self.gen.make(self.rng.choices(kinds, weights)[0])
+            self.commands.append(cmd)
+            self.sim.at(t, self._send, cmd)
+
+    def _send(self, cmd: Command) -> None:
+        cmd.sent = self.sim.clock.unix_now()
+        self.inflight.append(cmd)
+        self.sim.publish(cmd.topic, cmd.payload)
+
+    # -- device-side instrumentation ----------------------------------------
+
+    def _instrument(self, sim: Simulation) -> None:
+        main = sim.firmware["main"]
+        handle_message = main.handle_message
+        on_import_chunk = main.on_import_chunk
+        on_oversized = main.on_oversized_message
+
+        def timed(fn, *args):
+            cmd = self.current
+            wall = time.perf_counter()
+            try:
+                fn(*args)
+            finally:
+                if self.args.cpu_scale:
+                    cpu = (time.perf_counter() - wall) * self.args.cpu_scale
+                    sim.clock.advance(cpu)
+                if cmd is not None and cmd.replied == -1:
+                    cmd.replied = sim.clock.unix_now()
+                self.current = None
+
+        def start(topic):
+            # The device handles messages in publish order; anything skipped over
+            # never reached it (e.g. published while it was reconnecting)
+            topic = topic.decode()
+            cmd = None
+            while self.inflight:
+                cmd = self.inflight.popleft()
+                if cmd.topic == topic:
+                    break
+                cmd = None
+            if cmd is not None:
+                cmd.started = self.sim.clock.unix_now()
+                if cmd.wait_for:
+                    self.waiting.setdefault(cmd.wait_for, collections.deque()).append(
+                        cmd
+                    )
+            self.current = cmd
+
+        def wrapped_message(topic, msg):
+            start(topic)
+            timed(handle_message, topic, msg)
+
+        def wrapped_chunk(topic, chunk, offset, total):
+            if offset == 0:
+                start(topic)
+            else:
+                self.current = self.inflight_import
+            self.inflight_import = self.current
+            timed(on_import_chunk, topic, chunk, offset, total)
+
+        def wrapped_oversized(topic, size):
+            start(topic)
+            self.current = None
+            on_oversized(topic, size)
+
+        self.inflight_import = None
+        main.handle_message = wrapped_message
+        main.on_import_chunk = wrapped_chunk
+        main.on_oversized_message = wrapped_oversized
+
+    def _on_notification(self, topic: str, payload: bytes) -> None:
+        cmd = self.current
+        if cmd is not None and not cmd.wait_for:
+            if cmd.replied is None:
+                cmd.replied = -1  # stamped when the handler returns
+            return
+        queue = self.waiting.get(topic)
+        if queue:
+            try:
+                full = json.loads(payload).get("type") == "full"
+            except (ValueError, AttributeError):
+                full = False
+            if full:
+                cmd = queue.popleft()
+                cmd.replied = self.sim.clock.unix_now()
+                return
+        self.unsolicited += 1
+
+    # -- report ---------------------------------------------------------------
+
+    def run(self) -> None:
+        self.seed_programs()
+        self.schedule()
+        wall = time.perf_counter()
+        self.sim.run(seconds=WARMUP + self.args.duration + self.args.drain)
+        self.wall = time.perf_counter() - wall
+
+    def report(self) -> None:
+        by_kind = collections.OrderedDict()
+        for cmd in self.commands:
+            by_kind.setdefault(cmd.kind, []).append(cmd)
+        print(
+            "{:<17} {:>5} {:>6} {:>5} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+                "command",
+                "sent",
+                "reply",
+                "drop",
+                "queue p50",
+                "p50 ms",
+                "p90 ms",
+                "p99 ms",
+                "max ms",
+            )
+        )
+        for kind, cmds in list(by_kind.items()) + [("all", self.commands)]:
+            self._row(kind, cmds, kind == "all")
+        replies = sum(1 for c in self.commands if _replied(c))
+        print()
+        print(
+            "%d commands in %d s virtual (%.1f/s offered), %.1f replies/s, "
+            "%d unsolicited notifications, %.1f s wall"
+            % (
+                len(self.commands),
+                self.args.duration,
+                len(self.commands) / self.args.duration,
+                replies / self.args.duration,
+                self.unsolicited,
+                self.wall,
+            )
+        )
+
+    def _row(self, kind: str, cmds: list, total: bool) -> None:
+        silent = kind in ("metrics",)
+        sent = len(cmds)
+        handled = [c for c in cmds if c.started is not None]
+        replied = [c for c in cmds if _replied(c)]
+        latencies = sorted((c.replied - c.sent) * 1000 for c in replied)
+        queue = sorted((c.started - c.sent) * 1000 for c in handled)
+        if total:
+            dropped = sum(
+                1
+                for c in cmds
+                if c.started is None or (c.kind != "metrics" and not _replied(c))
+            )
+        else:
+            dropped = sent - (len(handled) if silent else len(replied))
+        print(
+            "{:<17} {:>5} {:>6} {:>5} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+                kind,
+                sent,
+                "-" if silent else len(replied),
+                dropped,
+                _fmt(_pct(queue, 50)),
+                _fmt(_pct(latencies, 50)),
+                _fmt(_pct(latencies, 90)),
+                _fmt(_pct(latencies, 99)),
+                _fmt(latencies[-1] if latencies else None),
+            )
+        )
+
+
+def _replied(cmd: Command) -> bool:
+    return cmd.replied is not None and cmd.replied > 0
+
+
+def _pct(values: list, p: float):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def _fmt(v) -> str:
+    return "-" if v is None else "%.0f" % v
+
+
+def _parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip().lower()
+        if name not in DEFAULT_MIX:
+            raise SystemExit("unknown command in mix: %s" % name)
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rate", type=float, default=5, help="commands per second")
+    parser.add_argument("--duration", type=float, default=120, help="load seconds")
+    parser.add_argument("--drain", type=float, default=30, help="seconds after load")
+    parser.add_argument("--mix", type=_parse_mix, default=dict(DEFAULT_MIX))
+    parser.add_argument("--programs", type=int, default=50, help="stored programs")
+    parser.add_argument(
+        "--loop-interval", type=float, default=None, help="override SLEEP_INTERVAL"
+    )
+    parser.add_argument("--cpu-scale", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    run = LoadRun(args)
+    run.run()
+    run.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Replays a trace recorded by the controller (main.TRACE_ENABLED, /trace.jsonl) in
+the host simulation: same stored programs, encodings and float levels, the same
+inbound messages and float changes at the same offsets. The replayed build
+records its own trace, which is compared with the recording: scheduler
+decisions, zone transitions and notifications in order, then how far apart in
+time the matching events happened.
+
+From the repository root:
+
+    mpremote cp :/trace.jsonl trace.jsonl
+    python tools/replay.py trace.jsonl
+    python tools/replay.py trace.jsonl --save replayed.jsonl
+    python tools/replay.py old.jsonl --against new.jsonl   # compare two traces
+
+Exits with status 1 if the sequences differ.
+"""
+
+import argparse
+import binascii
+import difflib
+import json
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+from sim import Simulation  # noqa: E402
+from sim.harness import FLOAT_PINS  # noqa: E402
+
+COMPARED = ("dec", "pin", "out")
+# Published on a timer or a lease rather than in response to the trace
+IGNORED_TOPICS = (
+    "api/ping",
+    "api/notification/irrigation/status",
+    "api/notification/irrigation/metrics",
+)
+VOLATILE_KEYS = ("timestamp",)
+FLOAT_DEBOUNCE = 0.3  # irrigation_controller.FLOAT_DEBOUNCE_MS
+DRAIN = 30  # seconds replayed after the last recorded event
+REPORT_TOP = 5
+
+
+def load(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _raw(payload) -> bytes:
+    if isinstance(payload, dict):
+        return binascii.unhexlify(payload["hex"])
+    return payload.encode()
+
+
+def _schedule(sim: Simulation, records: list, t0: float, loop: float) -> None:
+    """Injects inputs so the replayed loop picks each one up when the original did."""
+    streamed = None
+    for rec in records:
+        kind, ms = rec[0], rec[1]
+        at = t0 + ms / 1000 - loop / 2
+        if kind == "in":
+            sim.clock.at(at, sim.host.publish, rec[3], _raw(rec[4]))
+        elif kind == "ic":
+            # Chunks are reassembled and published once, as the broker received them
+            topic, offset, total, chunk = rec[3:7]
+            if offset == 0:
+                streamed = [at, b""]
+            if streamed is None:
+                continue
+            streamed[1] += _raw(chunk)
+            if len(streamed[1]) >= total:
+                sim.clock.at(streamed[0], sim.host.publish, topic, streamed[1])
+                streamed = None
+        elif kind == "flt":
+            pin = FLOAT_PINS[rec[3]]
+            sim.clock.at(at - FLOAT_DEBOUNCE, sim.board.set_input, pin, rec[4])
+
+
+def replay(records: list, drain: float = DRAIN) -> tuple:
+    """Runs the trace; returns (replayed records, wall seconds)."""
+    header = records[0]
+    if header[0] != "hdr":
+        raise ValueError("trace does not start with a header")
+    state = header[3]
+    loop = state.get("loop", 0.1)
+    # Traces recorded before the interlock became opt-in ran it on switch 1
+    switch, low = state.get("interlock", ("float_switch_1", 0))
+
+    sim = Simulation(
+        start=header[2],
+        boot=False,
+        loop_interval=loop,
+        secrets={
+            "DEVICE_ID": state.get("device", ""),
+            "INTERLOCK_SWITCH": switch,
+            "INTERLOCK_LOW_VALUE": low,
+        },
+    )
+    sim.board.wifi_delay = 0
+    sim.flash.write("/programs.json", json.dumps(state["store"]))
+    encodings = dict(state.get("encodings") or {})
+    # Traces recorded before message codes carry no mode: they hold legacy texts
+    encodings["messages"] = state.get("messages", "text")
+    sim.flash.write("/encoding.json", json.dumps(encodings))
+    for switch, level in state.get("float", {}).items():
+        sim.set_input(switch, level)
+    if state.get("state"):
+        # The snapshot the recorded boot restored (irrigation_state)
+        sim.board.rtc_memory = json.dumps(state["state"]).encode()
+
+    def enable_trace(sim):
+        sim.firmware["main"].TRACE_ENABLED = True
+        trace = sim.firmware["utils.trace"]
+        trace.MAX_SIZE = 1 << 30
+        start = trace.start
+
+        def traced_start(header):
+            start(header)
+            if sim.boots == 1:
+                _schedule(sim, records[1:], sim.clock.true_now, loop)
+
+        trace.start = traced_start
+
+    sim.on_boot.append(enable_trace)
+    wall = time.perf_counter()
+    sim.run(seconds=records[-1][1] / 1000 + drain)
+    wall = time.perf_counter() - wall
+    if sim.boots > 1:
+        print("warning: the replay rebooted %d time(s)" % (sim.boots - 1))
+    sim.flash.install()
+    try:
+        # Flushed by the firmware only every LOG_FLUSH_INTERVAL; the rest is pending
+        trace = sim.firmware["utils.trace"]
+        trace.flush()
+        replayed = [
+            json.loads(line)
+            for line in sim.flash.read("/trace.jsonl").split("\n")
+            if line
+        ]
+    finally:
+        sim.flash.uninstall()
+    return replayed, wall
+
+
+def _normalize(payload):
+    if not isinstance(payload, str):
+        return json.dumps(payload)
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return payload
+    if isinstance(data, dict):
+        for key in VOLATILE_KEYS:
+            data.pop(key, None)
+    return json.dumps(data, sort_keys=True)
+
+
+def events(records: list) -> list:
+    """Comparable (key, ms) pairs for the decisions, transitions and notifications."""
+    out = []
+    for rec in records:
+        kind = rec[0]
+        if kind not in COMPARED:
+            continue
+        if kind == "out":
+            if rec[3].startswith(IGNORED_TOPICS):
+                continue
+            key = (kind, rec[3], _normalize(rec[4]))
+        else:
+            key = (kind,) + tuple(rec[3:])
+        out.append((key, rec[1]))
+    return out
+
+
+def _describe(key: tuple) -> str:
+    text = " ".join(str(part) for part in key)
+    return text if len(text) <= 120 else text[:117] + "..."
+
+
+def compare(expected: list, actual: list) -> int:
+    """Prints the differences and timing; returns the number of differing events."""
+    a = events(expected)
+    b = events(actual)
+    matcher = difflib.SequenceMatcher(
+        a=[key for key, _ in a], b=[key for key, _ in b], autojunk=False
+    )
+    differing = 0
+    deltas = []
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                deltas.append((b[j][1] - a[i][1], a[i][0], a[i][1]))
+            continue
+        differing += max(i2 - i1, j2 - j1)
+        for key, ms in a[i1:i2]:
+            print("- %9.1f s  %s" % (ms / 1000, _describe(key)))
+        for key, ms in b[j1:j2]:
+            print("+ %9.1f s  %s" % (ms / 1000, _describe(key)))
+
+    print(
+        "%d recorded, %d replayed, %d matching, %d differing"
+        % (len(a), len(b), len(deltas), differing)
+    )
+    if deltas:
+        spread = sorted(abs(d) for d, _, _ in deltas)
+        print(
+            "timing: median %+d ms, max |%d| ms"
+            % (sorted(d for d, _, _ in deltas)[len(deltas) // 2], spread[-1])
+        )
+        deltas.sort(key=lambda d: -abs(d[0]))
+        for delta, key, ms in deltas[:REPORT_TOP]:
+            if delta:
+                print("  %+7d ms at %9.1f s  %s" % (delta, ms / 1000, _describe(key)))
+    return differing
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("trace", help="recorded trace (JSON lines)")
+    parser.add_argument(
+        "--against", help="compare with this trace instead of replaying"
+    )
+    parser.add_argument("--save", help="write the replayed trace to this file")
+    parser.add_argument(
+        "--drain", type=float, default=DRAIN, help="seconds after the last event"
+    )
+    args = parser.parse_args()
+
+    recorded = load(args.trace)
+    if args.against:
+        actual = load(args.against)
+    else:
+        actual, wall = replay(recorded, args.drain)
+        span = recorded[-1][1] / 1000
+        print(
+            "replayed %.0f s of trace in %.1f s (%.0fx)"
+            % (span, wall, span / wall if wall else 0)
+        )
+        if args.save:
+            with open(args.save, "w") as f:
+                for rec in actual:
+                    f.write(json.dumps(rec) + "\n")
+    if compare(recorded, actual):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
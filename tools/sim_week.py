@@ -0,0 +1,108 @@
+"""
+Runs one simulated week of the controller on the host and checks the result:
+scheduled programs on their weekdays, a manual run, a low-water interlock
+during a scheduled window, and the notifications published for each of them.
+
+From the repository root:
+
+    python tools/sim_week.py
+"""
+
+import sys
+import time
+
+sys.path.insert(0, ".")
+
+from sim import Simulation, utc_str  # noqa: E402
+
+# Monday 1 June 2026, 02:00 UTC (04:00 CEST)
+START = (2026, 6, 1, 2, 0, 0)
+LOOP_INTERVAL = 1.0
+SLACK = 15  # seconds a start may lag behind its schedule (scheduler runs every 10 s)
+
+PROGRAMS = [
+    {
+        "name": "Prato",
+        "zone": "zone_1",
+        "active_days": [0, 1, 2, 3, 4, 5, 6],
+        "start_time": "06:00",
+        "duration": 600,
+    },
+    {
+        "name": "Orto",
+        "zone": "zone_2",
+        "active_days": [0, 2, 4],
+        "start_time": "20:00",
+        "duration": 900,
+    },
+]
+
+
+def utc_day(day: int, hour: int, minute: int = 0) -> tuple:
+    return (2026, 6, day, hour, minute, 0)
+
+
+def main() -> None:
+    sim = Simulation(
+        start=START,
+        loop_interval=LOOP_INTERVAL,
+        secrets={"INTERLOCK_SWITCH": "float_switch_1"},
+    )
+    sim.set_programs(PROGRAMS)
+
+    # Wednesday 14:00 local: manual zone_3 for 5 minutes
+    sim.send(
+        "api/irrigation/zone",
+        {"zone": "zone_3", "action": "on", "duration": 300},
+        at=utc_day(3, 12),
+    )
+    # Thursday: tank low from 05:55 to 06:04 local, across Prato's window
+    sim.set_input("float_switch_1", 0, at=utc_day(4, 3, 55))
+    sim.set_input("float_switch_1", 1, at=utc_day(4, 4, 4))
+
+    wall = time.perf_counter()
+    sim.run(days=7)
+    wall = time.perf_counter() - wall
+
+    runs = sim.zone_runs()
+    for run in runs:
+        print("%s  %-7s %5ds" % (utc_str(run["start"]), run["zone"], run["duration"]))
+
+    sim.check_valves()
+
+    prato = [r for r in runs if r["zone"] == "zone_1"]
+    assert len(prato) == 7, prato
+    for day, run in zip(range(1, 8), prato):
+        start = sim.unix(utc_day(day, 4))
+        if day == 4:
+            # Late start once the level recovers, ending with the original window
+            assert sim.unix(utc_day(4, 4, 4)) <= run["start"] <= start + 240 + SLACK
+            assert run["end"] <= start + 600 + SLACK
+        else:
+            assert start <= run["start"] <= start + SLACK, run
+            assert 590 <= run["duration"] <= 600 + SLACK, run
+
+    orto = [r for r in runs if r["zone"] == "zone_2"]
+    assert [time.gmtime(r["start"]).tm_mday for r in orto] == [1, 3, 5], orto
+
+    manual = [r for r in runs if r["zone"] == "zone_3"]
+    assert len(manual) == 1 and abs(manual[0]["duration"] - 300) <= SLACK, manual
+
+    low = [
+        data
+        for _, _, data in sim.messages("/float")
+        if data["switch"] == "float_switch_1"
+    ]
+    assert [d["level"] for d in low] == [0, 1], low
+    zone_msgs = [data["status"] for _, _, data in sim.messages("/zone")]
+    # Two per scheduled run, two for the manual one, low + restored for the tank
+    assert len(zone_msgs) == 2 * len(runs) + 2, zone_msgs
+
+    print(
+        "OK: %d runs, %d notifications, %d boot(s), simulated week in %.1f s"
+        % (len(runs), len(sim.notifications), sim.boots, wall)
+    )
+
+
+if __name__ == "__main__":
+    main()
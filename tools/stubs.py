@@ -0,0 +1,122 @@
+"""
+Minimal stand-ins so the firmware can be imported where the ESP32 modules are
+missing (CPython, the MicroPython unix port). This module poses as machine,
+network, ntptime and secrets at once. Pins only hold a value and there is no
+virtual clock; use sim/ for behaviour, this for timing code paths in place.
+"""
+
+import sys
+import time
+
+# secrets
+WLAN_SSID = ""
+WLAN_PASSWORD = ""
+SERVER = "localhost"
+PORT = ""
+USER = ""
+PASSWORD = ""
+MQTT_SSL = False
+MQTT_CA_FILE = ""
+DEVICE_ID = ""
+INTERLOCK_SWITCH = ""
+INTERLOCK_LOW_VALUE = 0
+
+# network
+STA_IF = 0
+AP_IF = 1
+
+# ntptime
+host = "pool.ntp.org"
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, pin_id, mode=-1, pull=-1, value=None):
+        self.id = pin_id
+        self._value = 1 if mode == Pin.IN else (value or 0)
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = 1 if v else 0
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, handler=None, trigger=3, **kwargs):
+        pass
+
+
+class WLAN:
+    def __init__(self, interface=0):
+        pass
+
+    def active(self, on=None):
+        return True
+
+    def connect(self, ssid=None, key=None):
+        pass
+
+    def isconnected(self):
+        return True
+
+    def ifconfig(self):
+        return ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def freq():
+    return 240000000
+
+
+def settime():
+    pass
+
+
+def _ticks_us():
+    return int(time.perf_counter() * 1000000) & 0x3FFFFFFF
+
+
+def _ticks_ms():
+    return int(time.perf_counter() * 1000) & 0x3FFFFFFF
+
+
+def _ticks_diff(a, b):
+    return ((a - b + 0x20000000) & 0x3FFFFFFF) - 0x20000000
+
+
+def install():
+    """Registers this module for whatever the platform does not provide."""
+    me = sys.modules[__name__]
+    for name, attr in (("machine", "Pin"), ("network", "WLAN"), ("ntptime", "settime")):
+        try:
+            mod = __import__(name)
+            if hasattr(mod, attr):
+                continue
+        except ImportError:
+            pass
+        sys.modules[name] = me
+    try:
+        from secrets import SERVER as _  # noqa: F401
+    except ImportError:
+        sys.modules["secrets"] = me
+    for name, real in (("usocket", "socket"), ("ustruct", "struct")):
+        try:
+            __import__(name)
+        except ImportError:
+            sys.modules[name] = __import__(real)
+    if not hasattr(time, "ticks_us"):
+        time.ticks_us = _ticks_us
+        time.ticks_ms = _ticks_ms
+        time.ticks_diff = _ticks_diff
+        time.sleep_ms = lambda ms: time.sleep(ms / 1000)
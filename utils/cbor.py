@@ -0,0 +1,129 @@
+import struct
+
+# Minimal CBOR (RFC 8949) codec for the types used in MQTT payloads:
+# int, str, bytes, bool, None, float, list/tuple and dict.
+
+
+def _head(out: bytearray, major: int, n: int) -> None:
+    major <<= 5
+    if n < 24:
+        out.append(major | n)
+    elif n < 0x100:
+        out.append(major | 24)
+        out.append(n)
+    elif n < 0x10000:
+        out.append(major | 25)
+        out.extend(struct.pack(">H", n))
+    elif n < 0x100000000:
+        out.append(major | 26)
+        out.extend(struct.pack(">I", n))
+    else:
+        out.append(major | 27)
+        out.extend(struct.pack(">Q", n))
+
+
+def _encode(out: bytearray, obj) -> None:
+    if obj is None:
+        out.append(0xF6)
+    elif obj is True:
+        out.append(0xF5)
+    elif obj is False:
+        out.append(0xF4)
+    elif isinstance(obj, int):
+        if obj >= 0:
+            _head(out, 0, obj)
+        else:
+            _head(out, 1, -1 - obj)
+    elif isinstance(obj, str):
+        b = obj.encode("utf-8")
+        _head(out, 3, len(b))
+        out.extend(b)
+    elif isinstance(obj, (bytes, bytearray)):
+        _head(out, 2, len(obj))
+        out.extend(obj)
+    elif isinstance(obj, float):
+        out.append(0xFB)
+        out.extend(struct.pack(">d", obj))
+    elif isinstance(obj, (list, tuple)):
+        _head(out, 4, len(obj))
+        for item in obj:
+            _encode(out, item)
+    elif isinstance(obj, dict):
+        _head(out, 5, len(obj))
+        for key, value in obj.items():
+            _encode(out, key)
+            _encode(out, value)
+    else:
+        raise TypeError("unsupported type")
+
+
+def dumps(obj) -> bytes:
+    out = bytearray()
+    _encode(out, obj)
+    return bytes(out)
+
+
+def _decode(data, pos: int) -> tuple:
+    ib = data[pos]
+    pos += 1
+    major = ib >> 5
+    info = ib & 0x1F
+
+    if major == 7:
+        if info == 20:
+            return False, pos
+        if info == 21:
+            return True, pos
+        if info == 22:
+            return None, pos
+        if info == 27:
+            return struct.unpack(">d", data[pos : pos + 8])[0], pos + 8
+        if info == 26:
+            return struct.unpack(">f", data[pos : pos + 4])[0], pos + 4
+        raise ValueError("unsupported simple value")
+
+    if info < 24:
+        n = info
+    elif info == 24:
+        n = data[pos]
+        pos += 1
+    elif info == 25:
+        n = struct.unpack(">H", data[pos : pos + 2])[0]
+        pos += 2
+    elif info == 26:
+        n = struct.unpack(">I", data[pos : pos + 4])[0]
+        pos += 4
+    elif info == 27:
+        n = struct.unpack(">Q", data[pos : pos + 8])[0]
+        pos += 8
+    else:
+        raise ValueError("indefinite lengths not supported")
+
+    if major == 0:
+        return n, pos
+    if major == 1:
+        return -1 - n, pos
+    if major == 2:
+        return bytes(data[pos : pos + n]), pos + n
+    if major == 3:
+        return bytes(data[pos : pos + n]).decode("utf-8"), pos + n
+    if major == 4:
+        items = []
+        for _ in range(n):
+            item, pos = _decode(data, pos)
+            items.append(item)
+        return items, pos
+    if major == 5:
+        obj = {}
+        for _ in range(n):
+            key, pos = _decode(data, pos)
+            obj[key], pos = _decode(data, pos)
+        return obj, pos
+    raise ValueError("unsupported major type")
+
+
+def loads(data):
+    obj, pos = _decode(data, 0)
+    if pos != len(data):
+        raise ValueError("trailing data")
+    return obj
@@ -0,0 +1,93 @@
+from utils import cbor
+
+# Compact payload layout, version 1: a CBOR map whose well-known keys are replaced
+# by small integers (1 byte each on the wire) and whose millisecond timestamps are
+# sent in whole seconds, dropping the milliseconds to save 4 bytes. Key 0 carries
+# the layout version. Append new keys only: never renumber, or old clients will
+# misread payloads.
+COMPACT_VERSION = 1
+
+KEY_IDS = {
+    "data": 1,
+    "status": 2,
+    "timestamp": 3,
+    "active_zone": 4,
+    "manual_override": 5,
+    "zone_remaining_seconds": 6,
+    "paused_program": 7,
+    "user_paused_program": 8,
+    "float_switches": 9,
+    "id": 10,
+    "zone": 11,
+    "window_remaining_seconds": 12,
+    "type": 13,
+    "changes": 14,
+    "seq": 15,
+    "float_switch_1": 16,
+    "float_switch_2": 17,
+    "float_switch_3": 18,
+    "water_low": 19,
+    "switch": 20,
+    "level": 21,
+    "code": 22,
+    "params": 23,
+    "duration": 24,
+    "remaining": 25,
+    "program": 26,
+    "name": 27,
+    "user": 28,
+    "op": 29,
+    "rev": 30,
+    "active_program": 31,
+}
+
+KEY_NAMES = {v: k for k, v in KEY_IDS.items()}
+
+ENCODINGS = ("json", "cbor")
+
+
+def _compact(obj):
+    if isinstance(obj, dict):
+        out = {}
+        for key, value in obj.items():
+            if key == "timestamp" and isinstance(value, int):
+                value //= 1000
+            out[KEY_IDS.get(key, key)] = _compact(value)
+        return out
+    if isinstance(obj, list):
+        return [_compact(item) for item in obj]
+    return obj
+
+
+def _expand(obj):
+    if isinstance(obj, dict):
+        out = {}
+        for key, value in obj.items():
+            name = KEY_NAMES.get(key, key)
+            value = _expand(value)
+            if name == "timestamp" and isinstance(value, int):
+                value *= 1000
+            out[name] = value
+        return out
+    if isinstance(obj, list):
+        return [_expand(item) for item in obj]
+    return obj
+
+
+def encode(payload: dict) -> bytes:
+    """Encodes a JSON-style payload dict in the compact layout."""
+    out = _compact(payload)
+    out[0] = COMPACT_VERSION
+    return cbor.dumps(out)
+
+
+def decode(data) -> dict:
+    """
+    Reference decoder: returns the payload dict as the JSON path would have sent
+    it, except that timestamps are whole seconds (milliseconds truncated, * 1000).
+    """
+    obj = cbor.loads(data)
+    version = obj.pop(0, None)
+    if version != COMPACT_VERSION:
+        raise ValueError("unsupported compact version")
+    return _expand(obj)
@@ -0,0 +1,91 @@
+import json
+
+_LBRACKET = 0x5B
+_RBRACKET = 0x5D
+_LBRACE = 0x7B
+_RBRACE = 0x7D
+_QUOTE = 0x22
+_BACKSLASH = 0x5C
+_COMMA = 0x2C
+_WHITESPACE = b" \t\r\n"
+
+
+class JsonArrayReader:
+    """
+    Incremental parser for a JSON array of objects, fed in arbitrary chunks.
+    Each element is copied into a preallocated buffer and decoded on its own, so
+    memory use is bounded by the largest element rather than the whole array.
+    """
+
+    def __init__(self, max_item_size: int):
+        self.buf = bytearray(max_item_size)
+        self.reset()
+
+    def reset(self) -> None:
+        self.depth = 0
+        self.size = 0
+        self.in_string = False
+        self.escape = False
+        self.done = False
+        self.error = None
+
+    def feed(self, chunk, on_item) -> None:
+        """Consumes a chunk, calling on_item(obj) for every completed element."""
+        if self.error:
+            return
+        buf = self.buf
+        limit = len(buf)
+        for b in chunk:
+            if self.depth >= 2:
+                if self.size >= limit:
+                    self.error = "item too large"
+                    return
+                buf[self.size] = b
+                self.size += 1
+                if self.in_string:
+                    if self.escape:
+                        self.escape = False
+                    elif b == _BACKSLASH:
+                        self.escape = True
+                    elif b == _QUOTE:
+                        self.in_string = False
+                elif b == _QUOTE:
+                    self.in_string = True
+                elif b == _LBRACE or b == _LBRACKET:
+                    self.depth += 1
+                elif b == _RBRACE or b == _RBRACKET:
+                    self.depth -= 1
+                    if self.depth == 1:
+                        self._emit(on_item)
+                        if self.error:
+                            return
+            elif b in _WHITESPACE:
+                continue
+            elif self.done:
+                self.error = "trailing data"
+                return
+            elif self.depth == 0:
+                if b != _LBRACKET:
+                    self.error = "expected array"
+                    return
+                self.depth = 1
+            elif b == _LBRACE:
+                self.depth = 2
+                buf[0] = b
+                self.size = 1
+            elif b == _RBRACKET:
+                self.depth = 0
+                self.done = True
+            elif b != _COMMA:
+                self.error = "expected object"
+                return
+
+    def _emit(self, on_item) -> None:
+        try:
+            item = json.loads(self.buf[: self.size])
+        except ValueError:
+            self.error = "invalid item"
+            return
+        finally:
+            self.size = 0
+        on_item(item)
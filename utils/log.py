@@ -0,0 +1,142 @@
+import os
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+
+LEVEL = INFO  # entries below this are dropped before anything is stored
+CONSOLE_LEVEL = WARNING  # entries at or above this are also printed to the UART
+FLASH_LEVEL = WARNING  # entries at or above this are appended to FLASH_FILE
+RING_SIZE = 64
+ARG_MAX_BYTES = 64  # bytes args are cut to this when stored
+
+FLASH_FILE = "/log.txt"
+FLASH_OLD_FILE = "/log.1.txt"
+FLASH_MAX_SIZE = 16384
+FLASH_BATCH = 16
+
+# Preallocated ring: entry i lives in slot i % RING_SIZE of the parallel lists.
+# Messages are kept as (format, args) and only rendered when read. Bytes args (topics,
+# payloads) are copied and cut to ARG_MAX_BYTES, so the ring never keeps a received
+# message or a reused buffer alive.
+_seq = [0] * RING_SIZE
+_time = [0] * RING_SIZE
+_level = [0] * RING_SIZE
+_fmt = [""] * RING_SIZE
+_args = [None] * RING_SIZE
+
+next_seq = 1
+_flushed_seq = 0
+_unflushed = 0
+
+
+def _render(fmt: str, args) -> str:
+    if not args:
+        return fmt
+    try:
+        return fmt % args
+    except Exception:
+        return fmt + " " + repr(args)
+
+
+def _keep(args: tuple) -> tuple:
+    out = None
+    for n, arg in enumerate(args):
+        if isinstance(arg, (bytes, bytearray, memoryview)):
+            if out is None:
+                out = list(args)
+            if len(arg) > ARG_MAX_BYTES:
+                out[n] = "%s... (%d bytes)" % (bytes(arg[:ARG_MAX_BYTES]), len(arg))
+            else:
+                out[n] = bytes(arg)
+    return args if out is None else tuple(out)
+
+
+def log(level: int, fmt: str, *args) -> None:
+    global next_seq, _unflushed
+    if level < LEVEL:
+        return
+    i = next_seq % RING_SIZE
+    _seq[i] = next_seq
+    _time[i] = time.time()
+    _level[i] = level
+    _fmt[i] = fmt
+    _args[i] = _keep(args) if args else args
+    next_seq += 1
+    if level >= CONSOLE_LEVEL:
+        print(LEVEL_NAMES[level], _render(fmt, args))
+    if level >= FLASH_LEVEL:
+        _unflushed += 1
+        if _unflushed >= FLASH_BATCH:
+            flush()
+
+
+def debug(fmt: str, *args) -> None:
+    if DEBUG >= LEVEL:
+        log(DEBUG, fmt, *args)
+
+
+def info(fmt: str, *args) -> None:
+    log(INFO, fmt, *args)
+
+
+def warning(fmt: str, *args) -> None:
+    log(WARNING, fmt, *args)
+
+
+def error(fmt: str, *args) -> None:
+    log(ERROR, fmt, *args)
+
+
+def entries(since: int = 0, min_level: int = DEBUG, limit: int = RING_SIZE) -> list:
+    """Returns up to 'limit' rendered entries newer than 'since': [seq, time, level, text]."""
+    out = []
+    first = max(since + 1, next_seq - RING_SIZE, 1)
+    for seq in range(first, next_seq):
+        i = seq % RING_SIZE
+        if _level[i] < min_level:
+            continue
+        out.append([seq, _time[i], LEVEL_NAMES[_level[i]], _render(_fmt[i], _args[i])])
+        if len(out) >= limit:
+            break
+    return out
+
+
+def flush() -> None:
+    """Appends pending entries at or above FLASH_LEVEL to the flash log, rotating it."""
+    global _flushed_seq, _unflushed
+    if not _unflushed:
+        return
+    _unflushed = 0
+    first = max(_flushed_seq + 1, next_seq - RING_SIZE, 1)
+    try:
+        try:
+            if os.stat(FLASH_FILE)[6] >= FLASH_MAX_SIZE:
+                try:
+                    os.remove(FLASH_OLD_FILE)
+                except OSError:
+                    pass
+                os.rename(FLASH_FILE, FLASH_OLD_FILE)
+        except OSError:
+            pass
+        with open(FLASH_FILE, "a") as f:
+            for seq in range(first, next_seq):
+                i = seq % RING_SIZE
+                if _level[i] >= FLASH_LEVEL:
+                    f.write(
+                        "%d %d %s %s\n"
+                        % (
+                            seq,
+                            _time[i],
+                            LEVEL_NAMES[_level[i]],
+                            _render(_fmt[i], _args[i]),
+                        )
+                    )
+    except OSError as e:
+        print("Error writing log:", e)
+    _flushed_seq = next_seq - 1
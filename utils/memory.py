@@ -0,0 +1,94 @@
+import gc
+
+# Below this much free heap (after a collection) heavy requests are refused or degraded
+LOW_WATERMARK = 24000
+# Automatic collection after this many bytes are allocated; 0 = free heap / 4 at start
+GC_THRESHOLD = 0
+
+_PROBE_GRANULARITY = 256
+
+# Heap allocated per handler {name: [calls, total bytes, max bytes]}
+_allocs = {}
+degraded = 0
+
+
+def tune_gc(threshold: int = GC_THRESHOLD) -> int:
+    """Sets gc.threshold; returns the value applied."""
+    gc.collect()
+    if threshold <= 0:
+        threshold = gc.mem_free() // 4
+    gc.threshold(threshold)
+    return threshold
+
+
+def alloc_start() -> int:
+    return gc.mem_alloc()
+
+
+def alloc_record(name: str, before: int) -> None:
+    """Charges the heap growth since alloc_start() to a handler.
+
+    A collection in between makes the delta an undercount, never an overcount.
+    """
+    used = max(0, gc.mem_alloc() - before)
+    acc = _allocs.get(name)
+    if acc is None:
+        acc = [0, 0, 0]
+        _allocs[name] = acc
+    acc[0] += 1
+    acc[1] += used
+    if used > acc[2]:
+        acc[2] = used
+
+
+def largest_free_block() -> int:
+    """Finds the largest allocatable block by bisection (to _PROBE_GRANULARITY bytes)."""
+    gc.collect()
+    lo = 0
+    hi = gc.mem_free()
+    while hi - lo > _PROBE_GRANULARITY:
+        mid = (lo + hi) // 2
+        try:
+            probe = bytearray(mid)
+            del probe
+            lo = mid
+        except MemoryError:
+            hi = mid
+    return lo
+
+
+def has_budget(required: int = 0) -> bool:
+    """True if 'required' bytes can be spent without dropping below LOW_WATERMARK."""
+    global degraded
+    if gc.mem_free() - required >= LOW_WATERMARK:
+        return True
+    gc.collect()
+    if gc.mem_free() - required >= LOW_WATERMARK:
+        return True
+    degraded += 1
+    return False
+
+
+def report() -> dict:
+    """Heap state and per-handler allocations since the last report."""
+    global degraded
+    largest = largest_free_block()
+    free = gc.mem_free()
+    handlers = {}
+    for name, (calls, total, peak) in _allocs.items():
+        handlers[name] = {
+            "calls": calls,
+            "avg_bytes": total // calls if calls else 0,
+            "max_bytes": peak,
+        }
+    heap = {
+        "free": free,
+        "alloc": gc.mem_alloc(),
+        "largest_block": largest,
+        "fragmentation_pct": 100 - largest * 100 // free if free else 0,
+        "degraded": degraded,
+        "handlers": handlers,
+    }
+    _allocs.clear()
+    degraded = 0
+    return heap
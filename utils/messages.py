@@ -1,5 +1,9 @@
 DEFAULT_USER = "Sistema"
 
+# Legacy texts of the notification codes, "group.key" -> MESSAGES[group][key].
+# Loaded only in the "text" message mode (irrigation_notify.render); the lazily
+# loaded handlers keep theirs in handlers/messages.py. Durations are rendered in
+# minutes. Codes are part of the API: add new ones, never rename.
 MESSAGES = {
     "zone": {
         "activated": "{user} ha attivato {zone} per {duration} minuti",
@@ -9,27 +13,28 @@ MESSAGES = {
         "manual_override": "Ciclo automatico in pausa: {user} ha attivato {zone} manualmente",
         "auto_resumed": "Ciclo automatico ripreso: {zone} attiva per {duration} minuti rimanenti",
         "timeout_deactivated": "{zone} disattivata automaticamente per timeout",
+        "reset_resumed": "{zone} riattivata dopo il riavvio per {duration} minuti rimanenti",
         "not_found": "Zona {zone} non trovata o non attiva",
+        "not_active": "La zona {zone} non è attiva",
+        "invalid": "Zona non valida (zone_1 - zone_8)",
+        "invalid_duration": "Durata non valida (intero positivo in secondi)",
         "error": "Errore nell'attivazione di {zone}",
     },
-    "program_control": {
-        "paused": "{user} ha messo in pausa '{name}' ({remaining} min rimanenti)",
-        "resumed": "{user} ha ripreso '{name}' ({remaining} min rimanenti)",
-        "stopped": "{user} ha fermato il programma '{name}'",
-        "not_running": "Il programma non è in esecuzione",
-        "not_paused": "Nessun programma in pausa con questo ID",
-        "window_expired": "La finestra temporale del programma è scaduta: non è più possibile riprendere",
-        "zone_busy": "Impossibile riprendere: un'altra zona è attiva",
-        "no_time": "Nessun tempo disponibile prima del prossimo programma schedulato",
+    "float": {
+        "low_idle": "Livello acqua basso: irrigazione bloccata",
+        "low_paused": "Livello acqua basso: {zone} in pausa",
+        "restored": "Livello acqua ripristinato: irrigazione sbloccata",
+        "resumed": "{zone} ripresa dopo il ripristino del livello per {duration} minuti",
+        "blocked": "Impossibile attivare {zone}: livello acqua basso",
     },
-    "program": {
-        "created": "Programma '{name}' creato con successo",
-        "edited": "Programma '{name}' modificato con successo",
-        "deleted": "Programma eliminato con successo",
-        "conflict": "Conflitto con il programma '{name}': orario già occupato",
-        "not_found": "Programma non trovato",
-        "error_create": "Errore nella creazione del programma",
-        "error_edit": "Errore nella modifica del programma",
-        "error_delete": "Errore nell'eliminazione del programma",
+    "payload": {
+        "invalid": "Dati non validi",
+        "missing": "Campo obbligatorio mancante",
+    },
+    "status": {
+        "busy": "Troppi client collegati allo stato ({leases}): riprovare più tardi",
+    },
+    "memory": {
+        "low": "Memoria insufficiente: richiesta rifiutata, riprovare più tardi",
     },
 }
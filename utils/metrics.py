@@ -0,0 +1,93 @@
+import time
+
+# Hot-path timing. Every call site guards on ENABLED (start() returns 0 and record()
+# returns immediately), so the disabled cost is one global lookup per stage.
+ENABLED = False
+
+# Upper bounds of the histogram buckets in microseconds; a last bucket collects the rest
+BUCKETS_US = (100, 300, 1000, 3000, 10000, 30000, 100000, 300000, 1000000)
+STALL_US = 1000000
+
+# {stage: [bucket counts, calls, total us, max us]}
+_stages = {}
+
+_last_loop = 0
+loops = 0
+lag_max_us = 0
+stalls = 0
+
+
+def enable(on: bool) -> None:
+    global ENABLED, _last_loop
+    ENABLED = on
+    _last_loop = 0
+    reset()
+
+
+def reset() -> None:
+    global loops, lag_max_us, stalls
+    _stages.clear()
+    loops = 0
+    lag_max_us = 0
+    stalls = 0
+
+
+def start() -> int:
+    return time.ticks_us() if ENABLED else 0
+
+
+def record(stage: str, t0: int) -> None:
+    if not ENABLED:
+        return
+    elapsed = time.ticks_diff(time.ticks_us(), t0)
+    hist = _stages.get(stage)
+    if hist is None:
+        hist = [[0] * (len(BUCKETS_US) + 1), 0, 0, 0]
+        _stages[stage] = hist
+    i = 0
+    for bound in BUCKETS_US:
+        if elapsed < bound:
+            break
+        i += 1
+    hist[0][i] += 1
+    hist[1] += 1
+    hist[2] += elapsed
+    if elapsed > hist[3]:
+        hist[3] = elapsed
+
+
+def mark_loop(expected_us: int) -> None:
+    """Called once per loop iteration: tracks how late each iteration started."""
+    global _last_loop, loops, lag_max_us, stalls
+    if not ENABLED:
+        return
+    now = time.ticks_us()
+    if _last_loop:
+        lag = time.ticks_diff(now, _last_loop) - expected_us
+        if lag > lag_max_us:
+            lag_max_us = lag
+        if lag >= STALL_US:
+            stalls += 1
+    _last_loop = now
+    loops += 1
+
+
+def snapshot() -> dict:
+    """Returns the counters collected since the last snapshot and starts a new window."""
+    stages = {}
+    for stage, (counts, calls, total, peak) in _stages.items():
+        stages[stage] = {
+            "calls": calls,
+            "avg_us": total // calls if calls else 0,
+            "max_us": peak,
+            "hist": counts,
+        }
+    report = {
+        "buckets_us": BUCKETS_US,
+        "stages": stages,
+        "loops": loops,
+        "lag_max_us": lag_max_us,
+        "stalls": stalls,
+    }
+    reset()
+    return report
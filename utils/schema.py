@@ -0,0 +1,187 @@
+import re
+
+# Inbound payload shapes, declared once next to the handler that reads them and
+# compiled at import into a validator function. Rules are closures over their
+# bounds, precompiled patterns and lookup sets, so a call only checks fields and
+# never rebuilds anything.
+#
+#     ZONE = schema.compile((
+#         ("zone", schema.choice(VALID_ZONES, "zone.invalid")),
+#         ("duration", schema.integer("zone.invalid_duration", lo=1, default=60)),
+#     ))
+#     fields, error = ZONE(data)
+#
+# A validator returns (fields, None) with defaults applied and values normalized,
+# or (None, error) for the first field that fails, in declaration order. Errors
+# are notification codes (irrigation_notify): the field's own, else
+# "payload.missing" / "payload.invalid" or the code given to compile().
+# Fields declared as (name, rule) pairs keep that order on MicroPython too.
+
+_MISSING = object()
+_REQUIRED = "payload.missing"
+_INVALID = "payload.invalid"
+
+
+def text(error=None, max_len=None, truncate=False, default=_MISSING):
+    """A non-empty string; longer than max_len is an error, or cut when truncate."""
+
+    def check(value):
+        if not isinstance(value, str) or not value:
+            return _MISSING
+        if max_len is not None and len(value) > max_len:
+            return value[:max_len] if truncate else _MISSING
+        return value
+
+    return check, default, error
+
+
+def choice(options, error=None, default=_MISSING, upper=False):
+    """One of 'options' (any container with 'in'); upper=True folds strings first."""
+
+    def check(value):
+        if upper and isinstance(value, str):
+            value = value.upper()
+        try:
+            return value if value in options else _MISSING
+        except TypeError:
+            # Unhashable values (lists, dicts) against a set
+            return _MISSING
+
+    return check, default, error
+
+
+def pattern(regex: str, error=None, default=_MISSING, max_len=None):
+    """
+    A string matching 'regex', compiled once. MicroPython's re has no counted
+    repetition ({m,n}): bound the length with max_len instead.
+    """
+    match = re.compile(regex).match
+
+    def check(value):
+        if not isinstance(value, str) or (max_len is not None and len(value) > max_len):
+            return _MISSING
+        if match(value):
+            return value
+        return _MISSING
+
+    return check, default, error
+
+
+def integer(
+    error=None, lo=None, hi=None, clamp=False, cap=None, strict=False, default=_MISSING
+):
+    """
+    An integer within [lo, hi]. strict=True takes only ints (a program duration),
+    otherwise numeric strings and floats are converted as int() would. true/false
+    are never taken for 1/0. Out of range values are an error, or moved to the
+    bound with clamp=True; values above 'cap' are cut to it.
+    """
+
+    def check(value):
+        if isinstance(value, bool):
+            return _MISSING
+        if strict:
+            if not isinstance(value, int):
+                return _MISSING
+        else:
+            try:
+                value = int(value)
+            except (TypeError, ValueError, OverflowError):
+                return _MISSING
+        if lo is not None and value < lo:
+            return lo if clamp else _MISSING
+        if hi is not None and value > hi:
+            return hi if clamp else _MISSING
+        if cap is not None and value > cap:
+            return cap
+        return value
+
+    return check, default, error
+
+
+def boolean(error=None, strict=True, default=_MISSING):
+    """True or False; strict=False also takes anything with a truth value."""
+
+    def check(value):
+        if strict and not isinstance(value, bool):
+            return _MISSING
+        return bool(value)
+
+    return check, default, error
+
+
+def int_list(lo: int, hi: int, error=None, max_items=None, default=_MISSING):
+    """A non-empty list of ints within [lo, hi], checked through a lookup set."""
+    allowed = set(range(lo, hi + 1))
+
+    def check(value):
+        if not isinstance(value, list) or not value:
+            return _MISSING
+        if max_items is not None and len(value) > max_items:
+            return _MISSING
+        for item in value:
+            if isinstance(item, bool) or not isinstance(item, int):
+                return _MISSING
+            if item not in allowed:
+                return _MISSING
+        return value
+
+    return check, default, error
+
+
+def compile(fields: tuple, partial: bool = False, lenient: bool = False, error=None):
+    """
+    Builds a validator for 'fields', a tuple of (name, rule) pairs.
+
+    partial=True validates an update: only the fields present are checked, no
+    default is applied, and an empty payload is an error. lenient=True never fails
+    a field that has a default: a bad value takes the default and the error is still
+    returned next to the fields.
+    """
+    fields = tuple((name, rule[0], rule[1], rule[2]) for name, rule in fields)
+    invalid = error or _INVALID
+
+    def validate(data) -> tuple:
+        if not isinstance(data, dict) or (partial and not data):
+            return None, invalid
+        out = {}
+        failed = None
+        for name, check, default, field_error in fields:
+            value = data.get(name, _MISSING)
+            if value is _MISSING or value is None:
+                if partial:
+                    continue
+                if default is _MISSING:
+                    return None, field_error or _REQUIRED
+                out[name] = default() if callable(default) else default
+                continue
+            value = check(value)
+            if value is _MISSING:
+                field_error = field_error or invalid
+                if not lenient or default is _MISSING:
+                    return None, field_error
+                if failed is None:
+                    failed = field_error
+                value = default() if callable(default) else default
+            out[name] = value
+        return out, failed
+
+    return validate
+
+
+def validate_all(validator, items: list, label: str = "name") -> tuple:
+    """
+    Runs 'validator' over a batch, collecting every failure instead of stopping at
+    the first. Returns ([index, fields] for the valid items in order, errors as
+    [index, label, error]) where label is the item's 'label' field if it has one.
+    """
+    valid = []
+    errors = []
+    for index, item in enumerate(items):
+        fields, error = validator(item)
+        if fields is None:
+            name = item.get(label) if isinstance(item, dict) else None
+            errors.append([index, name, error])
+        else:
+            valid.append([index, fields])
+    return valid, errors
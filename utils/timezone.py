@@ -1,10 +1,20 @@
+import json
 import time
 
+import machine
 import ntptime
 
+from utils import log
+
 NTP_HOST = "pool.ntp.org"
-NTP_MAX_RETRIES = 10
 EPOCH_OFFSET = 946684800
+# time.time() below this means the RTC was never set (same cutoff as history/runtime)
+MIN_VALID_TIME = 1700000000 - EPOCH_OFFSET
+CLOCK_FILE = "/clock.json"
+
+# Where the current time came from: "rtc" (kept across a reset), "saved" (CLOCK_FILE
+# after a power loss), "ntp", or None while unknown
+time_source = None
 
 
 def _last_sunday(year: int, month: int) -> int:
@@ -16,7 +26,8 @@ def _last_sunday(year: int, month: int) -> int:
         last_day = (next_month - curr_month) // 86400
 
     t = time.localtime(time.mktime((year, month, last_day, 0, 0, 0, 0, 0, 0)))
-    return last_day - t[6]
+    # t[6] counts from Monday: a last day on Sunday (6) is itself the last Sunday
+    return last_day - (t[6] + 1) % 7
 
 
 def _is_dst(utc_t: tuple) -> bool:
@@ -39,20 +50,130 @@ def tz_offset() -> int:
     return 7200 if _is_dst(time.localtime()) else 3600
 
 
-def sync_ntp() -> bool:
+def _days_from_civil(year: int, month: int, day: int) -> int:
+    """Days since 1970-01-01; plain arithmetic, whatever epoch the port counts from."""
+    year -= month <= 2
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    return era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+
+
+def _year_of(days: int) -> int:
+    year = 1970 + days * 400 // 146097
+    if _days_from_civil(year + 1, 1, 1) <= days:
+        year += 1
+    elif _days_from_civil(year, 1, 1) > days:
+        year -= 1
+    return year
+
+
+def weekday_of(local: int) -> int:
+    """Weekday (0 = Monday) of a local-time unix timestamp."""
+    return (local // 86400 + 3) % 7
+
+
+# Local midnights of each year's DST change days, {year: (march, october)}
+_dst_days = {}
+
+
+def dst_days(year: int) -> tuple:
+    """
+    Local-time unix seconds of the midnights of the last Sundays of March (02:00
+    jumps to 03:00) and October (03:00 goes back to 02:00).
+    """
+    days = _dst_days.get(year)
+    if days is None:
+        out = []
+        for month in (3, 10):
+            last = _days_from_civil(year, month, 31)
+            out.append((last - (last + 3 - 6) % 7) * 86400)
+        days = _dst_days[year] = tuple(out)
+    return days
+
+
+def utc_from_local(local: int, repeated: bool = False) -> int:
+    """
+    Unix seconds of a local-time unix timestamp. The hour from 02:00 that October
+    goes through twice is read as its first pass, or the second with repeated=True.
+    """
+    spring, autumn = dst_days(_year_of(local // 86400))
+    if spring + 10800 <= local < autumn + 7200:
+        return local - 7200
+    if autumn + 7200 <= local < autumn + 10800 and not repeated:
+        return local - 7200
+    return local - 3600
+
+
+def dst_days_between(first: int, last: int) -> tuple:
+    """The March and October change days (as in dst_days) from 'first' to 'last'."""
+    springs = []
+    autumns = []
+    for year in range(_year_of(first // 86400), _year_of(last // 86400) + 1):
+        spring, autumn = dst_days(year)
+        springs.append(spring)
+        autumns.append(autumn)
+    return springs, autumns
+
+
+def sync_ntp():
+    """One NTP attempt. Returns how far it moved the clock in seconds, or None."""
+    global time_source
     ntptime.host = NTP_HOST
-
-    for attempt in range(1, NTP_MAX_RETRIES + 1):
-        try:
-            ntptime.settime()
-            print(f"NTP sync OK — UTC: {time.localtime()}")
-            return True
-        except Exception as e:
-            print(f"NTP attempt {attempt}/{NTP_MAX_RETRIES} failed: {e}")
-            time.sleep(2)
-
-    print("NTP sync failed")
-    return False
+    before = time.time()
+    t0 = time.ticks_ms()
+    try:
+        ntptime.settime()
+    except Exception as e:
+        log.warning("NTP sync failed: %s", e)
+        return None
+    step = time.time() - before - time.ticks_diff(time.ticks_ms(), t0) // 1000
+    time_source = "ntp"
+    log.info("NTP sync OK, clock stepped %ss — UTC: %s", step, time.localtime())
+    return step
+
+
+def restore_time() -> str:
+    """
+    Called at boot, before any network. The RTC survives resets and watchdog
+    reboots; after a power loss it restarts at 2000 and the last saved time is
+    the best estimate. Returns the source, None if the time is still unknown.
+    """
+    global time_source
+    if time.time() >= MIN_VALID_TIME:
+        time_source = "rtc"
+        return time_source
+    try:
+        with open(CLOCK_FILE, "r") as f:
+            saved = json.load(f)["time"]
+    except (OSError, ValueError, KeyError):
+        return None
+    if saved < MIN_VALID_TIME:
+        return None
+    t = time.localtime(saved)
+    machine.RTC().datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+    time_source = "saved"
+    return time_source
+
+
+def save_time() -> None:
+    if time_source is None:
+        return
+    try:
+        with open(CLOCK_FILE, "w") as f:
+            json.dump({"time": time.time()}, f)
+    except OSError as e:
+        log.error("Error saving clock: %s", e)
+
+
+def time_valid() -> bool:
+    return time_source is not None
+
+
+def local_time() -> tuple:
+    """Local broken-down time. localtime() counts from the port's own epoch, so it is
+    given time.time() plus the zone offset, never a unix timestamp."""
+    return time.localtime(time.time() + tz_offset())
 
 
 def now_unix() -> int:
@@ -0,0 +1,173 @@
+import json
+import os
+import time
+
+from binascii import hexlify
+
+from utils import log
+
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None
+
+# Optional recording of what drives the controller, replayed by tools/replay.py.
+# One JSON array per line: [kind, ms since start(), time.time(), ...fields]
+#   hdr  state at start: {"store", "encodings", "messages", "device", "float",
+#        "loop", "state"}
+#   in   topic, payload                      inbound message, before dispatch
+#   ic   topic, offset, total, chunk         one chunk of a streamed message
+#   flt  switch, level                       debounced float switch change
+#   dec  decision, program id, seconds       scheduler start/resume/discard
+#   pin  event, zone, program id             zone transition
+#   out  topic, payload or [length, crc32]   outbound publish
+# Payloads are text, {"hex": ...} when not UTF-8, or [length, crc32] when too long.
+ENABLED = False
+TRACE_FILE = "/trace.jsonl"
+TRACE_OLD_FILE = "/trace.1.jsonl"
+MAX_SIZE = 65536
+BATCH = 16
+PAYLOAD_INLINE_MAX = 256
+SKIP_TOPICS = (b"api/ping",)
+
+active = False
+# Why recording stopped before stop(): "full" at MAX_SIZE, "header" when the
+# header alone (the program store) does not fit
+stopped = None
+_start_ms = 0
+_pending = []
+_size = 0
+
+
+def start(header: dict) -> None:
+    """Starts a new trace, keeping the previous boot's one as TRACE_OLD_FILE."""
+    global active, stopped, _start_ms, _size
+    if not ENABLED:
+        return
+    try:
+        os.remove(TRACE_OLD_FILE)
+    except OSError:
+        pass
+    try:
+        os.rename(TRACE_FILE, TRACE_OLD_FILE)
+    except OSError:
+        pass
+    _pending.clear()
+    _size = 0
+    stopped = None
+    _start_ms = time.ticks_ms()
+    active = True
+    _emit("hdr", header)
+    flush()
+
+
+def stop() -> None:
+    global active
+    flush()
+    active = False
+
+
+def _emit(kind: str, *fields) -> None:
+    global active, stopped, _size
+    try:
+        line = json.dumps(
+            [kind, time.ticks_diff(time.ticks_ms(), _start_ms), time.time()]
+            + list(fields)
+        )
+    except Exception:
+        return
+    if _size + len(line) + 1 > MAX_SIZE:
+        # Keep what fits: a truncated trace still replays up to its last line
+        flush()
+        active = False
+        if kind == "hdr":
+            stopped = "header"
+            log.warning("Trace off: %d byte header exceeds %d", len(line), MAX_SIZE)
+        else:
+            stopped = "full"
+            log.info("Trace stopped at %d bytes", MAX_SIZE)
+        return
+    _size += len(line) + 1
+    _pending.append(line)
+    if len(_pending) >= BATCH:
+        flush()
+
+
+def _text(payload) -> str:
+    if isinstance(payload, str):
+        return payload
+    return bytes(payload).decode()
+
+
+def _payload(msg):
+    try:
+        return _text(msg)
+    except UnicodeError:
+        return {"hex": hexlify(msg).decode()}
+
+
+def inbound(topic: bytes, msg: bytes) -> None:
+    if active:
+        _emit("in", _text(topic), _payload(msg))
+
+
+def inbound_chunk(topic: bytes, chunk, offset: int, total: int) -> None:
+    if active:
+        _emit("ic", _text(topic), offset, total, _payload(chunk))
+
+
+def float_change(switch: str, level: int) -> None:
+    if active:
+        _emit("flt", switch, level)
+
+
+def decision(what: str, program_id: int, seconds: int = 0) -> None:
+    if active:
+        _emit("dec", what, program_id, seconds)
+
+
+def on_zone_transition(
+    event: str, zone: str, program_id: int, was_manual: bool
+) -> None:
+    """Controller transition listener."""
+    if active:
+        _emit("pin", event, zone, program_id)
+
+
+def outbound(topic: bytes, msg: bytes) -> None:
+    if not active or topic in SKIP_TOPICS:
+        return
+    if len(msg) <= PAYLOAD_INLINE_MAX:
+        _emit("out", _text(topic), _payload(msg))
+    else:
+        _emit("out", _text(topic), [len(msg), crc32(msg) if crc32 else 0])
+
+
+def wrap_publish(client) -> None:
+    """Records every publish of an MQTT client while tracing is active."""
+    if not ENABLED:
+        return
+    publish = client.publish
+
+    def traced(topic, msg, retain=False, qos=0):
+        outbound(topic, msg)
+        return publish(topic, msg, retain, qos)
+
+    client.publish = traced
+
+
+def report() -> dict:
+    return {"active": active, "bytes": _size, "stopped": stopped}
+
+
+def flush() -> None:
+    if not _pending:
+        return
+    try:
+        with open(TRACE_FILE, "a") as f:
+            for line in _pending:
+                f.write(line)
+                f.write("\n")
+    except OSError as e:
+        log.error("Trace write failed: %s", e)
+    _pending.clear()
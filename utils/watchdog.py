@@ -0,0 +1,130 @@
+import time
+
+import machine
+
+from utils import log
+
+# Loop supervision. The main loop names each stage with enter() and calls
+# progress() once per iteration:
+# - a stage longer than its budget (STALL_BUDGET_MS unless enter() names one) is
+#   recorded as a stall
+# - machine.WDT is fed from progress() only, never from a timer
+# - a periodic timer resets the board after HANG_TIMEOUT_MS without progress,
+#   once on_hang() has closed the valves
+# - the timer's callback is soft: it cannot run while the VM is blocked in C
+#   (socket connect, DNS, TLS handshake). Such a hang ends with the hardware WDT
+#   reset, valves as they were until then; irrigation_controller drives them low
+#   again as soon as it is imported on the next boot
+ENABLED = True
+STALL_BUDGET_MS = 2000
+HANG_TIMEOUT_MS = 20000
+WDT_TIMEOUT_MS = 30000
+CHECK_INTERVAL_MS = 1000
+RECENT_STALLS = 8
+
+stage = "boot"
+_stage_ms = 0
+_stage_budget = STALL_BUDGET_MS
+_progress_ms = 0
+_wdt = None
+_timer = None
+_on_hang = None
+
+stall_count = 0
+# Most recent stalls, oldest first: [stage, ms, time.time()]
+recent_stalls = []
+
+RESET_CAUSES = {
+    getattr(machine, "PWRON_RESET", 1): "power_on",
+    getattr(machine, "HARD_RESET", 2): "hard",
+    getattr(machine, "WDT_RESET", 3): "watchdog",
+    getattr(machine, "DEEPSLEEP_RESET", 4): "deepsleep",
+    getattr(machine, "SOFT_RESET", 5): "soft",
+}
+
+
+def reset_cause() -> str:
+    try:
+        return RESET_CAUSES.get(machine.reset_cause(), "unknown")
+    except AttributeError:
+        return "unknown"
+
+
+def start(on_hang=None) -> None:
+    """Arms the hardware watchdog and the hang check; from here progress() must run."""
+    global _wdt, _timer, _on_hang, _progress_ms, _stage_ms
+    _on_hang = on_hang
+    _progress_ms = _stage_ms = time.ticks_ms()
+    if not ENABLED:
+        return
+    _wdt = machine.WDT(timeout=WDT_TIMEOUT_MS)
+    _timer = machine.Timer(0)
+    _timer.init(mode=machine.Timer.PERIODIC, period=CHECK_INTERVAL_MS, callback=_check)
+    log.info(
+        "Watchdog armed: hang %d ms, hardware %d ms", HANG_TIMEOUT_MS, WDT_TIMEOUT_MS
+    )
+
+
+def stop() -> None:
+    """
+    Stops the hang check. The ESP32 hardware watchdog cannot be stopped: it
+    resets the board WDT_TIMEOUT_MS after the last progress().
+    """
+    global _timer
+    if _timer is not None:
+        _timer.deinit()
+        _timer = None
+
+
+def _stage_done(now: int) -> None:
+    global stall_count
+    elapsed = time.ticks_diff(now, _stage_ms)
+    if elapsed < _stage_budget:
+        return
+    stall_count += 1
+    recent_stalls.append([stage, elapsed, time.time()])
+    if len(recent_stalls) > RECENT_STALLS:
+        recent_stalls.pop(0)
+    log.warning("Stall: %s took %d ms", stage, elapsed)
+
+
+def enter(name: str, budget_ms: int = STALL_BUDGET_MS) -> None:
+    """Starts timing stage 'name', closing the previous one."""
+    global stage, _stage_ms, _stage_budget
+    now = time.ticks_ms()
+    _stage_done(now)
+    stage = name
+    _stage_ms = now
+    _stage_budget = budget_ms
+
+
+def progress() -> None:
+    """End of a loop iteration: the loop is alive."""
+    global _progress_ms
+    enter("sleep")
+    _progress_ms = _stage_ms
+    if _wdt is not None:
+        _wdt.feed()
+
+
+def _check(timer) -> None:
+    stuck = time.ticks_diff(time.ticks_ms(), _progress_ms)
+    if stuck < HANG_TIMEOUT_MS:
+        return
+    log.error("Loop hung in %s for %d ms, closing valves and resetting", stage, stuck)
+    if _on_hang is not None:
+        try:
+            _on_hang()
+        except Exception as e:
+            log.error("Hang handler error: %s", e)
+    log.flush()
+    machine.reset()
+
+
+def report() -> dict:
+    return {
+        "stalls": stall_count,
+        "recent": recent_stalls,
+        "stage": stage,
+        "budget_ms": STALL_BUDGET_MS,
+    }